@@ -1,10 +1,18 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+import metrics
+from cache import TTLCache
 from config import settings
 from database import get_db
 from models import AppUser
@@ -12,6 +20,21 @@ from models import AppUser
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
+# bcrypt consume ~100-300 ms de CPU por llamada: se ejecuta en un pool acotado
+# para no congelar el event loop. Si hay demasiadas operaciones en espera se
+# responde 503 en lugar de acumularlas.
+_hash_executor = ThreadPoolExecutor(
+    max_workers=settings.password_hash_workers,
+    thread_name_prefix="bcrypt",
+)
+# in_flight cuenta los trabajos del pool hasta que terminan, aunque el request
+# que los pidió se haya cancelado (el hilo no se puede interrumpir)
+hash_pool_stats = {"in_flight": 0, "completed": 0, "failed": 0, "cancelled": 0, "rejected": 0}
+_hash_pool_lock = threading.Lock()
+
+# Usuarios resueltos por `sub` del token, para no consultar app_user en cada request
+user_cache = TTLCache(maxsize=settings.user_cache_max_size, ttl=settings.user_cache_ttl_seconds)
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
@@ -36,6 +59,49 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+def _hash_job_done(future) -> None:
+    # Corre en el hilo del pool (o en el loop si el trabajo no llegó a empezar)
+    with _hash_pool_lock:
+        hash_pool_stats["in_flight"] -= 1
+        if future.cancelled():
+            hash_pool_stats["cancelled"] += 1
+        elif future.exception() is not None:
+            hash_pool_stats["failed"] += 1
+        else:
+            hash_pool_stats["completed"] += 1
+
+
+async def _run_in_hash_pool(func, *args):
+    capacity = settings.password_hash_workers + settings.password_hash_max_queue
+    with _hash_pool_lock:
+        if hash_pool_stats["in_flight"] >= capacity:
+            hash_pool_stats["rejected"] += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Servidor ocupado, intenta nuevamente en unos segundos",
+                headers={"Retry-After": "1"},
+            )
+        hash_pool_stats["in_flight"] += 1
+    try:
+        future = _hash_executor.submit(func, *args)
+    except BaseException:
+        with _hash_pool_lock:
+            hash_pool_stats["in_flight"] -= 1
+        raise
+    future.add_done_callback(_hash_job_done)
+    return await asyncio.wrap_future(future)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password ejecutado en el pool de bcrypt"""
+    return await _run_in_hash_pool(verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """get_password_hash ejecutado en el pool de bcrypt"""
+    return await _run_in_hash_pool(get_password_hash, password)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -47,36 +113,75 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 
-def authenticate_user(db: Session, username: str, password: str):
+async def authenticate_user(db: AsyncSession, username: str, password: str):
     """
     Autentica un usuario verificando username y password.
     Maneja errores de DB y verificación de forma segura.
     """
     try:
-        user = db.query(AppUser).filter(AppUser.username == username).first()
+        result = await db.execute(select(AppUser).where(AppUser.username == username))
+        user = result.scalars().first()
         if not user:
             return False
         # Validar que el hash existe y no está vacío
         if not user.password_hash or not user.password_hash.strip():
             return False
-        if not verify_password(password, user.password_hash):
+        if not await verify_password_async(password, user.password_hash):
             return False
         return user
+    except HTTPException:
+        # Pool de bcrypt saturado (503): no confundir con credenciales inválidas
+        raise
     except Exception as e:
         # Error de DB o cualquier otro error inesperado
         # Retornar False en lugar de lanzar excepción
         return False
 
 
+def invalidate_user_cache(username: Optional[str] = None):
+    """Invalida un usuario del cache (o todo el cache si no se indica username)"""
+    if username is None:
+        user_cache.clear()
+    else:
+        user_cache.pop(username)
+
+
+def _user_snapshot(user: AppUser) -> AppUser:
+    """Copia desacoplada de la sesión y sin password_hash para guardar en cache"""
+    return AppUser(id=user.id, username=user.username, created_at=user.created_at)
+
+
+@event.listens_for(AppUser, "after_insert")
+@event.listens_for(AppUser, "after_update")
+@event.listens_for(AppUser, "after_delete")
+def _on_user_changed(mapper, connection, target):
+    # Invalida al hacer flush y de nuevo al commit, para que un request
+    # concurrente no deje en cache la versión anterior del usuario
+    usernames = {target.username}
+    usernames.update(inspect(target).attrs.username.history.deleted or ())
+    session = inspect(target).session
+    if session is not None:
+        session.info.setdefault("invalidate_users", set()).update(usernames)
+    for username in usernames:
+        invalidate_user_cache(username)
+
+
+@event.listens_for(Session, "after_commit")
+def _on_commit(session):
+    for username in session.info.pop("invalidate_users", ()):
+        invalidate_user_cache(username)
+
+
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="No se pudo validar las credenciales",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    start = time.perf_counter()
     try:
         payload = jwt.decode(token, settings.jwt_secret, algorithms=[settings.jwt_algorithm])
         username: str = payload.get("sub")
@@ -84,8 +189,34 @@ async def get_current_user(
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    user = db.query(AppUser).filter(AppUser.username == username).first()
+
+    # Modo "confiar en los claims": id y username salen del token firmado, sin ir a la DB.
+    # Un usuario eliminado sigue siendo válido hasta que expire su token.
+    user_id = payload.get("uid")
+    if settings.auth_trust_claims and user_id is not None:
+        metrics.AUTH_DURATION.observe(time.perf_counter() - start, "claims")
+        return AppUser(id=user_id, username=username)
+
+    cached = user_cache.get(username)
+    if cached is not None:
+        metrics.AUTH_DURATION.observe(time.perf_counter() - start, "cache")
+        return cached
+
+    result = await db.execute(select(AppUser).where(AppUser.username == username))
+    user = result.scalars().first()
     if user is None:
         raise credentials_exception
+    user = _user_snapshot(user)
+    user_cache.set(username, user)
+    metrics.AUTH_DURATION.observe(time.perf_counter() - start, "db")
     return user
 
+
+async def get_admin_user(current_user: AppUser = Depends(get_current_user)):
+    """Usuario autenticado que además está en ADMIN_USERNAMES"""
+    if current_user.username not in settings.admin_usernames:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Requiere permisos de administrador",
+        )
+    return current_user
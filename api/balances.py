@@ -0,0 +1,23 @@
+from sqlalchemy import text
+
+# Saldo de la venta (alias `s`) desde las columnas mantenidas por triggers
+# (migrations/0008_sale_balance.sql), con los nombres de v_sale_statement
+SALE_BALANCE_COLUMNS = """
+    s.sale_total, s.paid_total,
+    GREATEST(s.sale_total - s.paid_total, 0)::numeric(14, 2) AS remaining,
+    s.status AS account_status
+"""
+
+# Ventas cuyo saldo difiere de v_sale_statement (fuente de verdad)
+BALANCE_DRIFT_SQL = text("""
+    SELECT s.id AS sale_id,
+           s.sale_total, v.sale_total AS expected_sale_total,
+           s.paid_total, v.paid_total AS expected_paid_total,
+           s.status, v.account_status AS expected_status
+    FROM joyas.sale s
+    JOIN joyas.v_sale_statement v ON v.sale_id = s.id
+    WHERE s.sale_total <> v.sale_total OR s.paid_total <> v.paid_total OR s.status <> v.account_status
+    ORDER BY s.id
+""")
+
+BALANCE_REBUILD_SQL = text("SELECT joyas.sale_balance_rebuild()")
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Benchmark: búsqueda de clientes ILIKE '%term%' vs. búsqueda rankeada con pg_trgm.
+
+Completa la base de prueba hasta --customers clientes sintéticos (y --items
+items con código de producto), aplica la migración 0002 si se pide y mide
+ambas queries para una lista de términos, indicando si el plan usa seq scan.
+
+Usar SIEMPRE una base de prueba: el script inserta datos en joyas.*.
+
+    python benchmarks/bench_customer_search.py --dsn postgresql://postgres:pw@localhost/joyas_bench \\
+        --customers 100000 --items 50000 --apply-migration
+"""
+import argparse
+import json
+import time
+
+from sqlalchemy import create_engine, text
+
+from common import API_DIR, percentiles, sqlalchemy_url
+from search import CUSTOMER_SEARCH_SQL, customer_search_params
+
+FIRST_NAMES = [
+    "José", "María", "Ana", "Luis", "Carmen", "Jorge", "Lucía", "Andrés", "Sofía", "Martín",
+    "Valentina", "Ramón", "Inés", "Nicolás", "Mónica", "Óscar", "Julián", "Belén", "Raúl", "Noelia",
+]
+LAST_NAMES = [
+    "Pérez", "González", "Benítez", "Martínez", "Giménez", "Núñez", "Ramírez", "Fernández", "Acuña",
+    "Ortiz", "López", "Báez", "Duarte", "Villalba", "Cáceres", "Rojas", "Sánchez", "Ibáñez", "Franco", "Ayala",
+]
+DEFAULT_TERMS = ["perez", "Benítez", "nunez", "ana gim", "0981", "55512", "ANI-12", "zzz"]
+
+LEGACY_ILIKE_SQL = text("""
+    SELECT id, full_name, phone, created_at
+    FROM joyas.customer
+    WHERE full_name ILIKE :pattern
+    ORDER BY created_at DESC
+    LIMIT :limit
+""")
+
+
+def seed(conn, customers: int, items: int):
+    current = conn.execute(text("SELECT COUNT(*) FROM joyas.customer")).scalar_one()
+    missing = max(0, customers - current)
+    if missing:
+        conn.execute(
+            text("""
+                INSERT INTO joyas.customer (full_name, phone)
+                SELECT ((:first)::text[])[1 + (g * 7) % cardinality((:first)::text[])]
+                       || ' ' || ((:last)::text[])[1 + (g * 13) % cardinality((:last)::text[])]
+                       || ' ' || ((:last)::text[])[1 + (g * 3) % cardinality((:last)::text[])],
+                       '09' || lpad(((g * 7919) % 100000000)::text, 8, '0')
+                FROM generate_series(1, :n) AS g
+            """),
+            {"first": FIRST_NAMES, "last": LAST_NAMES, "n": missing},
+        )
+
+    current_items = conn.execute(text("SELECT COUNT(*) FROM joyas.sale_item")).scalar_one()
+    missing_items = max(0, items - current_items)
+    if missing_items:
+        # Una venta por item, repartidas entre los clientes existentes
+        conn.execute(
+            text("""
+                WITH c AS (SELECT array_agg(id) AS ids FROM joyas.customer),
+                new_sales AS (
+                    INSERT INTO joyas.sale (customer_id, delivery_address)
+                    SELECT c.ids[1 + (g * 31) % cardinality(c.ids)], 'Dirección de prueba'
+                    FROM generate_series(1, :n) AS g, c
+                    RETURNING id
+                )
+                INSERT INTO joyas.sale_item (sale_id, product_code, jewel_type, quantity, unit_price)
+                SELECT id, 'ANI-' || (id % 5000), 'Anillo', 1, 100000
+                FROM new_sales
+            """),
+            {"n": missing_items},
+        )
+    conn.execute(text("ANALYZE joyas.customer"))
+    conn.execute(text("ANALYZE joyas.sale_item"))
+
+
+def plan_uses_seq_scan(conn, statement, params) -> bool:
+    plan = conn.execute(text("EXPLAIN (FORMAT JSON) " + str(statement)), params).scalar_one()
+    return '"Seq Scan"' in json.dumps(plan)
+
+
+def measure(conn, statement, params, repeat: int) -> list[float]:
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn.execute(statement, params).fetchall()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", required=True, help="URL de una base de PRUEBA")
+    parser.add_argument("--customers", type=int, default=100_000)
+    parser.add_argument("--items", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--apply-migration", action="store_true", help="aplicar migrations/0002 antes de medir")
+    parser.add_argument("--terms", nargs="*", default=DEFAULT_TERMS)
+    args = parser.parse_args()
+
+    engine = create_engine(sqlalchemy_url(args.dsn))
+    with engine.begin() as conn:
+        seed(conn, args.customers, args.items)
+        if args.apply_migration:
+            conn.exec_driver_sql((API_DIR / "migrations" / "0002_customer_trigram_search.sql").read_text())
+
+    report = {"customers": args.customers, "items": args.items, "repeat": args.repeat, "terms": {}}
+    with engine.connect() as conn:
+        for term in args.terms:
+            legacy_params = {"pattern": f"%{term}%", "limit": args.limit}
+            ranked_params = customer_search_params(term, args.limit)
+            report["terms"][term] = {
+                "ilike": {
+                    **percentiles(measure(conn, LEGACY_ILIKE_SQL, legacy_params, args.repeat)),
+                    "seq_scan": plan_uses_seq_scan(conn, LEGACY_ILIKE_SQL, legacy_params),
+                    "results": len(conn.execute(LEGACY_ILIKE_SQL, legacy_params).fetchall()),
+                },
+                "ranked": {
+                    **percentiles(measure(conn, CUSTOMER_SEARCH_SQL, ranked_params, args.repeat)),
+                    "seq_scan": plan_uses_seq_scan(conn, CUSTOMER_SEARCH_SQL, ranked_params),
+                    "results": len(conn.execute(CUSTOMER_SEARCH_SQL, ranked_params).fetchall()),
+                },
+            }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Benchmark: bytes transferidos por página de ventas con fotos originales vs.
+variantes WebP (srcset).
+
+Sube --photos fotos sintéticas tamaño celular, crea --sales ventas con un
+item por foto y recorre una página del listado como lo hace la PWA: GET
+/sales, GET /sales/{id}/full de cada venta y la imagen de cada item. "Antes"
+descarga photo_url (el original); "después" descarga la variante que elegiría
+el navegador del srcset para --display-px CSS a --dpr. Reporta también la
+latencia de la primera descarga de cada variante (puede incluir generarla).
+
+Usar una base de PRUEBA: el script crea un cliente, ventas y fotos.
+
+Uso (con la API corriendo):
+    python benchmarks/bench_image_variants.py --base-url http://localhost:8000 \\
+        --username admin --password secreto --sales 20 --photos 3 --display-px 64 --dpr 2
+"""
+import argparse
+import asyncio
+import io
+import json
+import random
+import time
+
+import httpx
+from PIL import Image, ImageDraw, ImageFilter
+
+from common import percentiles
+
+
+def synthetic_photo(seed: int, width: int, height: int) -> bytes:
+    """JPEG con gradiente, formas y ruido: comprime parecido a una foto real"""
+    rng = random.Random(seed)
+    image = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    for _ in range(40):
+        x, y = rng.randrange(width), rng.randrange(height)
+        radius = rng.randrange(width // 20, width // 4)
+        color = tuple(rng.randrange(256) for _ in range(3))
+        draw.ellipse((x - radius, y - radius, x + radius, y + radius), fill=color)
+    image = image.filter(ImageFilter.GaussianBlur(3))
+    noise = Image.effect_noise((width, height), 24).convert("RGB")
+    image = Image.blend(image, noise, 0.15)
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=88)
+    return buffer.getvalue()
+
+
+def pick_from_srcset(srcset: str, needed_px: float) -> str:
+    """Candidato más chico que cubre `needed_px` (o el más grande), como el navegador"""
+    candidates = []
+    for entry in srcset.split(", "):
+        url, descriptor = entry.rsplit(" ", 1)
+        candidates.append((int(descriptor.rstrip("w")), url))
+    candidates.sort()
+    for width, url in candidates:
+        if width >= needed_px:
+            return url
+    return candidates[-1][1]
+
+
+async def fetch_bytes(client: httpx.AsyncClient, path: str, headers: dict) -> tuple[int, float]:
+    start = time.perf_counter()
+    response = await client.get(path, headers=headers)
+    response.raise_for_status()
+    return len(response.content), time.perf_counter() - start
+
+
+async def seed(client: httpx.AsyncClient, headers: dict, args) -> None:
+    photo_urls = []
+    for i in range(args.photos):
+        content = synthetic_photo(i, args.photo_width, args.photo_width * 4 // 3)
+        response = await client.post(
+            "/upload/image", files={"file": (f"foto{i}.jpg", content, "image/jpeg")}, headers=headers
+        )
+        response.raise_for_status()
+        photo_urls.append(response.json()["url"])
+
+    response = await client.post("/customers", json={"full_name": "Cliente Benchmark Fotos"}, headers=headers)
+    response.raise_for_status()
+    customer_id = response.json()["id"]
+    for i in range(args.sales):
+        items = [
+            {"jewel_type": "Anillo", "product_code": f"IMG-{i}-{j}", "quantity": 1,
+             "unit_price": 150000, "photo_url": url}
+            for j, url in enumerate(photo_urls)
+        ]
+        response = await client.post(
+            "/sales", json={"customer_id": customer_id, "delivery_address": "Benchmark", "items": items}, headers=headers
+        )
+        response.raise_for_status()
+
+
+async def walk_page(client: httpx.AsyncClient, headers: dict, args, use_variants: bool) -> dict:
+    """Bytes de una página de ventas: listado + detalle + una imagen por item"""
+    json_bytes = image_bytes = images = 0
+    image_latencies = []
+    response = await client.get("/sales", params={"page_size": args.sales}, headers=headers)
+    response.raise_for_status()
+    json_bytes += len(response.content)
+    for sale in response.json()["items"]:
+        response = await client.get(f"/sales/{sale['id']}/full", headers=headers)
+        response.raise_for_status()
+        json_bytes += len(response.content)
+        detail = response.json()
+        for item in detail["items"]:
+            if not item.get("photo_url"):
+                continue
+            if use_variants and item.get("photo_variants"):
+                path = pick_from_srcset(item["photo_variants"]["srcset"], args.display_px * args.dpr)
+            else:
+                path = item["photo_url"]
+            size, elapsed = await fetch_bytes(client, path, headers)
+            image_bytes += size
+            images += 1
+            image_latencies.append(elapsed)
+    return {
+        "json_bytes": json_bytes,
+        "image_bytes": image_bytes,
+        "images": images,
+        "total_bytes": json_bytes + image_bytes,
+        "image_fetch": percentiles(image_latencies),
+    }
+
+
+async def run(args) -> dict:
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=120) as client:
+        response = await client.post("/auth/login", json={"username": args.username, "password": args.password})
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        if not args.skip_seed:
+            await seed(client, headers, args)
+        before = await walk_page(client, headers, args, use_variants=False)
+        after_cold = await walk_page(client, headers, args, use_variants=True)
+        after = await walk_page(client, headers, args, use_variants=True)
+
+    return {
+        "sales_per_page": args.sales,
+        "display_px": args.display_px,
+        "dpr": args.dpr,
+        "before_originals": before,
+        "after_variants_first_load": after_cold,
+        "after_variants": after,
+        "bytes_saved_ratio": round(1 - after["total_bytes"] / before["total_bytes"], 4)
+        if before["total_bytes"] else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--sales", type=int, default=20, help="ventas por página")
+    parser.add_argument("--photos", type=int, default=3, help="fotos distintas (una por item de cada venta)")
+    parser.add_argument("--photo-width", type=int, default=2400, help="ancho de las fotos sintéticas en px")
+    parser.add_argument("--display-px", type=int, default=64, help="ancho CSS en que se muestra la miniatura")
+    parser.add_argument("--dpr", type=float, default=2, help="densidad de pixeles del dispositivo")
+    parser.add_argument("--skip-seed", action="store_true", help="usar las ventas ya cargadas")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
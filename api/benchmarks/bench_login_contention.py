@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Benchmark: latencia de /dashboard/kpis mientras hay logins concurrentes.
+
+Mide primero la latencia del dashboard sin carga y luego con N clientes
+haciendo login en bucle (bcrypt). Con bcrypt dentro del event loop la
+latencia del dashboard se dispara; con el pool acotado debe mantenerse
+estable y los logins excedentes reciben 503.
+
+Uso (con la API corriendo):
+    python benchmarks/bench_login_contention.py --base-url http://localhost:8000 \\
+        --username admin --password secreto --logins 20 --duration 10
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from common import percentiles
+
+
+async def probe_dashboard(client: httpx.AsyncClient, headers: dict, stop_at: float) -> list[float]:
+    latencies = []
+    while time.perf_counter() < stop_at:
+        start = time.perf_counter()
+        response = await client.get("/dashboard/kpis", headers=headers)
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def login_loop(client: httpx.AsyncClient, credentials: dict, stop_at: float, counters: dict):
+    while time.perf_counter() < stop_at:
+        response = await client.post("/auth/login", json=credentials)
+        key = str(response.status_code)
+        counters[key] = counters.get(key, 0) + 1
+        if response.status_code == 503:
+            await asyncio.sleep(0.05)
+
+
+async def run(args) -> dict:
+    credentials = {"username": args.username, "password": args.password}
+    limits = httpx.Limits(max_connections=args.logins + 4)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=60, limits=limits) as client:
+        response = await client.post("/auth/login", json=credentials)
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        baseline = await probe_dashboard(client, headers, time.perf_counter() + args.duration)
+
+        counters: dict = {}
+        stop_at = time.perf_counter() + args.duration
+        logins = [login_loop(client, credentials, stop_at, counters) for _ in range(args.logins)]
+        results = await asyncio.gather(probe_dashboard(client, headers, stop_at), *logins)
+
+    return {
+        "concurrent_logins": args.logins,
+        "duration_s": args.duration,
+        "dashboard_baseline": percentiles(baseline),
+        "dashboard_under_logins": percentiles(results[0]),
+        "login_status_counts": counters,
+        "logins_per_s": round(sum(counters.values()) / args.duration, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--logins", type=int, default=20, help="clientes haciendo login en paralelo")
+    parser.add_argument("--duration", type=float, default=10.0, help="segundos por fase")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
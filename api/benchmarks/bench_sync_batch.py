@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Benchmark: replay de la cola offline uno por uno vs. POST /sync/batch.
+
+Genera N operaciones (ventas y pagos, como las encola la PWA) y las envía
+primero con un request por operación (POST /sales, POST /payments, como el
+offlineQueue.sync() anterior) y después en lotes a /sync/batch.
+--latency-ms agrega una espera por request para simular la red móvil.
+
+Usar una base de PRUEBA: el script crea un cliente, ventas y pagos.
+
+Uso (con la API corriendo):
+    python benchmarks/bench_sync_batch.py --base-url http://localhost:8000 \\
+        --username admin --password secreto --operations 300 --latency-ms 150
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from common import percentiles
+
+
+def build_operations(customer_id: int, sale_id: int, count: int) -> list[dict]:
+    """Dos ventas por cada pago, sobre un cliente y una venta existentes"""
+    operations = []
+    for i in range(count):
+        if i % 3 == 2:
+            operations.append({"type": "create_payment", "data": {"sale_id": sale_id, "amount": 10}})
+        else:
+            operations.append({
+                "type": "create_sale",
+                "data": {
+                    "customer_id": customer_id,
+                    "delivery_address": "Benchmark",
+                    "items": [
+                        {"jewel_type": "Anillo", "product_code": f"BEN-{i}", "quantity": 1, "unit_price": 150000},
+                        {"jewel_type": "Aro", "quantity": 2, "unit_price": 50000},
+                    ],
+                },
+            })
+    return operations
+
+
+async def post(client: httpx.AsyncClient, path: str, body: dict, headers: dict, latency: float) -> httpx.Response:
+    if latency:
+        await asyncio.sleep(latency)
+    response = await client.post(path, json=body, headers=headers)
+    response.raise_for_status()
+    return response
+
+
+async def replay_one_by_one(client, operations, headers, latency) -> tuple[float, list[float]]:
+    latencies = []
+    start = time.perf_counter()
+    for op in operations:
+        path = "/sales" if op["type"] == "create_sale" else "/payments"
+        op_start = time.perf_counter()
+        await post(client, path, op["data"], headers, latency)
+        latencies.append(time.perf_counter() - op_start)
+    return time.perf_counter() - start, latencies
+
+
+async def replay_batched(client, operations, headers, latency, batch_size) -> tuple[float, list[float], int]:
+    latencies = []
+    applied = 0
+    start = time.perf_counter()
+    for offset in range(0, len(operations), batch_size):
+        batch_start = time.perf_counter()
+        response = await post(client, "/sync/batch", {"operations": operations[offset:offset + batch_size]}, headers, latency)
+        latencies.append(time.perf_counter() - batch_start)
+        applied += response.json()["applied"]
+    return time.perf_counter() - start, latencies, applied
+
+
+async def run(args) -> dict:
+    latency = args.latency_ms / 1000
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=120) as client:
+        response = await client.post("/auth/login", json={"username": args.username, "password": args.password})
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        customer = (await post(client, "/customers", {"full_name": "Cliente Benchmark Sync"}, headers, 0)).json()
+        sale = (await post(client, "/sales", build_operations(customer["id"], 0, 1)[0]["data"], headers, 0)).json()
+        operations = build_operations(customer["id"], sale["id"], args.operations)
+
+        single_total, single_latencies = await replay_one_by_one(client, operations, headers, latency)
+        batch_total, batch_latencies, applied = await replay_batched(
+            client, operations, headers, latency, args.batch_size
+        )
+
+    return {
+        "operations": args.operations,
+        "latency_ms": args.latency_ms,
+        "one_by_one": {
+            "requests": len(operations),
+            "total_s": round(single_total, 3),
+            "per_request": percentiles(single_latencies),
+        },
+        "batch": {
+            "requests": len(batch_latencies),
+            "batch_size": args.batch_size,
+            "applied": applied,
+            "total_s": round(batch_total, 3),
+            "per_request": percentiles(batch_latencies),
+        },
+        "speedup": round(single_total / batch_total, 2) if batch_total else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--operations", type=int, default=300)
+    parser.add_argument("--batch-size", type=int, default=100, help="operaciones por request a /sync/batch")
+    parser.add_argument("--latency-ms", type=float, default=0, help="espera por request (red simulada)")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""Utilidades compartidas por los scripts de benchmarks"""
+import statistics
+import sys
+from pathlib import Path
+
+# Permite importar los módulos de la API (search, models, ...) desde los scripts
+API_DIR = Path(__file__).resolve().parent.parent
+if str(API_DIR) not in sys.path:
+    sys.path.insert(0, str(API_DIR))
+
+
+def percentiles(samples: list[float]) -> dict:
+    """Resumen de latencias (en segundos) como p50/p95/p99/max/mean en milisegundos"""
+    if not samples:
+        return {"n": 0}
+    ordered = sorted(samples)
+
+    def pct(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 2)
+
+    return {
+        "n": len(ordered),
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "max_ms": round(ordered[-1] * 1000, 2),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 2),
+    }
+
+
+def sqlalchemy_url(dsn: str) -> str:
+    """Convierte postgresql:// o postgres:// al driver psycopg (v3)"""
+    for prefix in ("postgresql://", "postgres://"):
+        if dsn.startswith(prefix):
+            return "postgresql+psycopg://" + dsn[len(prefix):]
+    return dsn
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Dataset sintético de joyería para benchmarks y load tests.
+
+Borra el esquema joyas de la base indicada, lo recrea con migrations/ (desde
+0000, el esquema base) y carga --customers clientes, --sales ventas,
+--items items y --payments pagos, generados en la base con generate_series en
+lotes de --chunk filas. Los datos se cargan con las migraciones ya aplicadas:
+los triggers (snapshot de KPIs, rollup mensual) se mantienen en cada lote, y
+no hace falta el backfill de las migraciones sobre tablas llenas (el de 0003
+recorre sale_item por cada venta). Con la misma --seed los datos son los mismos.
+
+Crea además el usuario --username/--password para load_test.py.
+
+BORRA el esquema joyas: usar SOLO una base de prueba (--reset es obligatorio
+si el esquema ya existe).
+
+    python benchmarks/dataset.py --dsn postgresql://postgres:pw@localhost/joyas_bench --reset
+    python benchmarks/dataset.py --dsn ... --reset --scale 0.01   # 1k clientes, 10k ventas, 50k items/pagos
+"""
+import argparse
+import json
+import random
+import sys
+import time
+
+from passlib.context import CryptContext
+from sqlalchemy import create_engine, text
+
+from bench_customer_search import FIRST_NAMES, LAST_NAMES
+from common import sqlalchemy_url
+from schema_migrations import migrate
+
+# migrations/0000: tablas y vistas anteriores a las migraciones de performance
+BASELINE_VERSION = "0000"
+
+JEWEL_TYPES = ["Anillo", "Aro", "Cadena", "Pulsera", "Dije", "Reloj", "Gargantilla", "Tobillera"]
+STREETS = ["Mcal. López", "España", "Artigas", "Eusebio Ayala", "Santa Teresa", "Brasilia", "Sacramento", "Aviadores"]
+
+# Días de historia: las fechas de compra crecen con el id, como en la base real
+HISTORY_DAYS = 3 * 365
+
+CUSTOMERS_SQL = text("""
+    INSERT INTO joyas.customer (full_name, phone, created_at)
+    SELECT (CAST(:first AS text[]))[1 + floor(random() * cardinality(CAST(:first AS text[])))::int]
+           || ' ' || (CAST(:last AS text[]))[1 + floor(random() * cardinality(CAST(:last AS text[])))::int]
+           || ' ' || (CAST(:last AS text[]))[1 + floor(random() * cardinality(CAST(:last AS text[])))::int],
+           CASE WHEN random() < 0.85 THEN '09' || lpad(floor(random() * 1e8)::bigint::text, 8, '0') END,
+           now() - make_interval(days => :days) * (1 - g::float8 / :total)
+    FROM generate_series(CAST(:start AS bigint), CAST(:stop AS bigint)) AS g
+""")
+
+# Los clientes más viejos compran más (power sesga hacia ids bajos)
+SALES_SQL = text("""
+    INSERT INTO joyas.sale (customer_id, purchase_date, payment_due_date, delivery_date,
+                            delivery_address, notes, created_at)
+    SELECT customer_id, d, d + 30,
+           CASE WHEN random() < 0.7 THEN d + floor(random() * 15)::int END,
+           (CAST(:streets AS text[]))[1 + floor(random() * cardinality(CAST(:streets AS text[])))::int]
+               || ' ' || (100 + floor(random() * 3000)::int),
+           CASE WHEN random() < 0.1 THEN 'Entregar por la tarde' END,
+           d + make_interval(hours => 8 + floor(random() * 12)::int)
+    FROM (
+        SELECT 1 + floor(power(random(), 2) * :customers)::bigint AS customer_id,
+               current_date - (floor((1 - g::float8 / :total) * :days) + floor(random() * 3))::int AS d
+        FROM generate_series(CAST(:start AS bigint), CAST(:stop AS bigint)) AS g
+    ) s
+""")
+
+# Cada venta tiene al menos un item (los primeros :sales van uno por venta)
+ITEMS_SQL = text("""
+    INSERT INTO joyas.sale_item (sale_id, product_code, jewel_type, quantity, unit_price, created_at)
+    SELECT s.id, upper(left(x.jewel_type, 3)) || '-' || (1 + floor(random() * 5000)::int), x.jewel_type,
+           1 + (random() < 0.2)::int + (random() < 0.05)::int,
+           round((50000 + random() * 1950000)::numeric, -3),
+           s.created_at
+    FROM (
+        SELECT CASE WHEN g <= :sales THEN g ELSE 1 + floor(random() * :sales)::bigint END AS sale_id,
+               (CAST(:types AS text[]))[1 + floor(random() * cardinality(CAST(:types AS text[])))::int] AS jewel_type
+        FROM generate_series(CAST(:start AS bigint), CAST(:stop AS bigint)) AS g
+    ) x
+    JOIN joyas.sale s ON s.id = x.sale_id
+""")
+
+# Pagos sobre el 80% más viejo de las ventas: las recientes quedan pendientes y
+# el monto alcanza para que parte de las ventas queden pagadas y parte parciales
+PAYMENTS_SQL = text("""
+    INSERT INTO joyas.payment (sale_id, paid_at, amount, created_at)
+    SELECT s.id, p.paid_at, p.amount, p.paid_at
+    FROM (
+        SELECT 1 + floor(random() * :sales * 0.8)::bigint AS sale_id,
+               round(((0.2 + random() * 1.6) * :avg_payment)::numeric, -3) + 1000 AS amount,
+               random() AS r
+        FROM generate_series(CAST(:start AS bigint), CAST(:stop AS bigint)) AS g
+    ) x
+    JOIN joyas.sale s ON s.id = x.sale_id
+    CROSS JOIN LATERAL (
+        SELECT LEAST(s.created_at + x.r * interval '60 days', now()) AS paid_at, x.amount
+    ) p
+""")
+
+
+def chunk_seed(seed: int, table: str, start: int) -> float:
+    """Semilla de random() por lote en [-1, 1], para que cada lote sea reproducible"""
+    return random.Random(f"{seed}:{table}:{start}").uniform(-1, 1)
+
+
+def load_table(engine, table: str, statement, total: int, chunk: int, seed: int, params: dict) -> float:
+    start_time = time.perf_counter()
+    for start in range(1, total + 1, chunk):
+        stop = min(start + chunk - 1, total)
+        with engine.begin() as conn:
+            conn.execute(text("SELECT setseed(:s)"), {"s": chunk_seed(seed, table, start)})
+            conn.execute(statement, {**params, "start": start, "stop": stop, "total": total})
+        print(f"  {table}: {stop}/{total}", file=sys.stderr)
+    return round(time.perf_counter() - start_time, 2)
+
+
+def build(args) -> dict:
+    engine = create_engine(sqlalchemy_url(args.dsn))
+    customers, sales, items, payments = (
+        max(1, int(n * args.scale)) for n in (args.customers, args.sales, args.items, args.payments)
+    )
+    items = max(items, sales)
+    timings = {}
+
+    with engine.begin() as conn:
+        exists = conn.execute(text("SELECT 1 FROM pg_namespace WHERE nspname = 'joyas'")).scalar()
+        if exists and not args.reset:
+            raise SystemExit("La base ya tiene el esquema joyas: usar --reset para borrarlo (SOLO en una base de prueba)")
+        conn.exec_driver_sql("DROP SCHEMA IF EXISTS joyas CASCADE")
+
+    print("Aplicando migraciones", file=sys.stderr)
+    start = time.perf_counter()
+    applied = migrate(engine, target=BASELINE_VERSION if args.no_migrations else None, skip=tuple(args.skip_migration))
+    timings["migrations"] = round(time.perf_counter() - start, 2)
+    with engine.begin() as conn:
+        conn.execute(
+            text("INSERT INTO joyas.app_user (username, password_hash) VALUES (:username, :password_hash)"),
+            {"username": args.username, "password_hash": CryptContext(schemes=["bcrypt"]).hash(args.password)},
+        )
+
+    print("Cargando datos", file=sys.stderr)
+    # Precio promedio de un item * cantidad promedio (1.25) * items por venta / pagos por venta pagada
+    avg_payment = 1_025_000 * 1.25 * (items / sales) / max(payments / (sales * 0.8), 1e-9)
+    timings["customer"] = load_table(engine, "customer", CUSTOMERS_SQL, customers, args.chunk, args.seed, {
+        "first": FIRST_NAMES, "last": LAST_NAMES, "days": HISTORY_DAYS,
+    })
+    timings["sale"] = load_table(engine, "sale", SALES_SQL, sales, args.chunk, args.seed, {
+        "customers": customers, "streets": STREETS, "days": HISTORY_DAYS,
+    })
+    timings["sale_item"] = load_table(engine, "sale_item", ITEMS_SQL, items, args.chunk, args.seed, {
+        "sales": sales, "types": JEWEL_TYPES,
+    })
+    timings["payment"] = load_table(engine, "payment", PAYMENTS_SQL, payments, args.chunk, args.seed, {
+        "sales": sales, "avg_payment": avg_payment,
+    })
+
+    start = time.perf_counter()
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql("VACUUM ANALYZE")
+    timings["vacuum_analyze"] = round(time.perf_counter() - start, 2)
+
+    with engine.connect() as conn:
+        statuses = dict(conn.execute(text(
+            "SELECT account_status, COUNT(*) FROM joyas.v_sale_statement GROUP BY 1"
+        )).all())
+    return {
+        "seed": args.seed,
+        "migrations": applied,
+        "rows": {"customer": customers, "sale": sales, "sale_item": items, "payment": payments},
+        "account_status": statuses,
+        "timings_s": timings,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", required=True, help="URL de una base de PRUEBA")
+    parser.add_argument("--reset", action="store_true", help="borrar el esquema joyas si existe")
+    parser.add_argument("--customers", type=int, default=100_000)
+    parser.add_argument("--sales", type=int, default=1_000_000)
+    parser.add_argument("--items", type=int, default=5_000_000)
+    parser.add_argument("--payments", type=int, default=5_000_000)
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplica todas las cantidades")
+    parser.add_argument("--chunk", type=int, default=100_000, help="filas por INSERT")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--username", default="bench")
+    parser.add_argument("--password", default="bench")
+    parser.add_argument("--no-migrations", action="store_true", help="solo el esquema base (migrations/0000)")
+    parser.add_argument(
+        "--skip-migration", action="append", default=[], metavar="NNNN",
+        help="no aplicar esa migración (ej. 0002 si no hay pg_trgm); repetible",
+    )
+    args = parser.parse_args()
+    print(json.dumps(build(args), indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Load test de la API sobre el dataset sintético de benchmarks/dataset.py.
+
+Levanta la app real (main.app con su lifespan: pool, caches, LISTEN) en este
+proceso y la recorre con un cliente ASGI de httpx, sin red ni uvicorn en el
+medio; con --base-url mide en cambio una API ya corriendo. Cada endpoint se
+mide por separado: --concurrency clientes pidiéndolo en bucle durante
+--duration segundos, después de --warmup segundos sin medir. Los ids de
+ventas y clientes se eligen al azar (con --seed) dentro del dataset.
+
+Imprime en JSON, por endpoint, latencia p50/p95/p99, throughput y errores,
+más los metadatos de la corrida (commit, DB_MODE, tamaño del dataset) para
+poder comparar corridas: --compare anterior.json agrega la diferencia.
+
+Con el cliente ASGI el generador de carga comparte el event loop con la app:
+sirve para comparar cambios entre sí, no como capacidad absoluta.
+
+    python benchmarks/load_test.py --dsn postgresql://postgres:pw@localhost/joyas_bench \\
+        --concurrency 16 --duration 20 --output antes.json
+    python benchmarks/load_test.py --dsn ... --output despues.json --compare antes.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import httpx
+from sqlalchemy import create_engine, text
+
+from common import API_DIR, percentiles, sqlalchemy_url
+
+SEARCH_TERMS = ["perez", "Benítez", "nunez", "ana gim", "0981", "mart", "rojas", "villa"]
+STATUSES = ["PAGADO", "PARCIAL", "PENDIENTE"]
+
+
+class Dataset:
+    """Rango de ids y fechas del dataset, para armar requests válidos"""
+
+    def __init__(self, dsn: str):
+        engine = create_engine(sqlalchemy_url(dsn))
+        with engine.connect() as conn:
+            row = conn.execute(text("""
+                SELECT (SELECT COUNT(*) FROM joyas.customer) AS customers,
+                       (SELECT max(id) FROM joyas.customer) AS max_customer_id,
+                       (SELECT COUNT(*) FROM joyas.sale) AS sales,
+                       (SELECT max(id) FROM joyas.sale) AS max_sale_id,
+                       (SELECT COUNT(*) FROM joyas.sale_item) AS items,
+                       (SELECT COUNT(*) FROM joyas.payment) AS payments,
+                       (SELECT min(purchase_date) FROM joyas.sale) AS first_purchase
+            """)).one()
+        engine.dispose()
+        self.rows = {
+            "customer": row.customers, "sale": row.sales, "sale_item": row.items, "payment": row.payments,
+        }
+        self.max_customer_id = row.max_customer_id or 1
+        self.max_sale_id = row.max_sale_id or 1
+        self.first_year = row.first_purchase.year if row.first_purchase else datetime.now().year
+
+
+# Endpoints medidos: nombre -> función (rng, dataset) -> (método, path, query, body)
+ENDPOINTS = {
+    "list_sales": lambda rng, d: ("GET", "/sales", {"page_size": 20}, None),
+    "list_sales_by_status": lambda rng, d: (
+        "GET", "/sales", {"page_size": 20, "status_filter": rng.choice(STATUSES)}, None
+    ),
+    "list_sales_by_customer": lambda rng, d: (
+        "GET", "/sales", {"page_size": 20, "customer_id": rng.randint(1, d.max_customer_id)}, None
+    ),
+    "sale_full": lambda rng, d: ("GET", f"/sales/{rng.randint(1, d.max_sale_id)}/full", None, None),
+    "sale_statement": lambda rng, d: ("GET", f"/sales/{rng.randint(1, d.max_sale_id)}/statement", None, None),
+    "list_customers": lambda rng, d: ("GET", "/customers", {"page_size": 20}, None),
+    "customer": lambda rng, d: ("GET", f"/customers/{rng.randint(1, d.max_customer_id)}", None, None),
+    "customer_search": lambda rng, d: ("GET", "/customers/search", {"q": rng.choice(SEARCH_TERMS)}, None),
+    "list_payments": lambda rng, d: (
+        "GET", "/payments", {"page_size": 20, "sale_id": rng.randint(1, d.max_sale_id)}, None
+    ),
+    "dashboard_kpis": lambda rng, d: ("GET", "/dashboard/kpis", None, None),
+    "sales_statements": lambda rng, d: ("GET", "/dashboard/sales-statements", {"page_size": 20}, None),
+    "sales_statements_by_status": lambda rng, d: (
+        "GET", "/dashboard/sales-statements", {"page_size": 20, "status_filter": rng.choice(STATUSES)}, None
+    ),
+    "history_monthly": lambda rng, d: ("GET", "/history/monthly", None, None),
+    "history_monthly_year": lambda rng, d: (
+        "GET", "/history/monthly", {"year": rng.randint(d.first_year, datetime.now().year)}, None
+    ),
+}
+# Escriben en la base: solo con --writes
+WRITE_ENDPOINTS = {
+    "create_payment": lambda rng, d: (
+        "POST", "/payments", None, {"sale_id": rng.randint(1, d.max_sale_id), "amount": 1000}
+    ),
+}
+
+
+async def measure(client, headers, build_request, dataset, rng, concurrency: int, duration: float) -> dict:
+    latencies: list[float] = []
+    statuses: dict[str, int] = {}
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            method, path, params, body = build_request(rng, dataset)
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, params=params, json=body, headers=headers)
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    errors = sum(count for status, count in statuses.items() if not status.startswith("2"))
+    return {
+        **percentiles(latencies),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "errors": errors,
+        "status": dict(sorted(statuses.items())),
+    }
+
+
+async def run_endpoints(client, args, dataset) -> dict:
+    response = await client.post("/auth/login", json={"username": args.username, "password": args.password})
+    response.raise_for_status()
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    endpoints = {**ENDPOINTS, **(WRITE_ENDPOINTS if args.writes else {})}
+    selected = args.endpoints or list(endpoints)
+    unknown = set(selected) - set(endpoints)
+    if unknown:
+        raise SystemExit(f"Endpoints desconocidos: {', '.join(sorted(unknown))}")
+
+    results = {}
+    for name in selected:
+        rng = random.Random(f"{args.seed}:{name}")
+        if args.warmup:
+            await measure(client, headers, endpoints[name], dataset, rng, args.concurrency, args.warmup)
+        results[name] = await measure(client, headers, endpoints[name], dataset, rng, args.concurrency, args.duration)
+        print(
+            f"  {name}: p50 {results[name].get('p50_ms')} ms, p99 {results[name].get('p99_ms')} ms, "
+            f"{results[name]['throughput_rps']} req/s, {results[name]['errors']} errores",
+            file=sys.stderr,
+        )
+    return results
+
+
+async def run(args, dataset) -> tuple[dict, dict]:
+    limits = httpx.Limits(max_connections=args.concurrency + 4)
+    if args.base_url:
+        async with httpx.AsyncClient(base_url=args.base_url, timeout=60, limits=limits) as client:
+            return await run_endpoints(client, args, dataset), {"target": args.base_url}
+
+    # La configuración se lee al importar la app: el entorno tiene que estar listo antes
+    os.environ["DATABASE_URL"] = args.dsn
+    os.environ.setdefault("JWT_SECRET", "load-test-" + os.urandom(16).hex())
+    if args.db_mode:
+        os.environ["DB_MODE"] = args.db_mode
+    if args.no_response_cache:
+        os.environ["RESPONSE_CACHE_TTL_SECONDS"] = "{}"
+    from main import app
+    from config import settings
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://load-test", timeout=60) as client:
+            results = await run_endpoints(client, args, dataset)
+    return results, {
+        "target": "asgi",
+        "db_mode": settings.db_mode,
+        "db_pool_size": settings.db_pool_size,
+        "db_max_overflow": settings.db_max_overflow,
+        "response_cache": settings.response_cache_ttl_seconds,
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=API_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: dict, previous: dict) -> dict:
+    """Diferencia porcentual de latencias y throughput por endpoint contra una corrida anterior"""
+    diff = {}
+    for name, result in current["endpoints"].items():
+        before = previous.get("endpoints", {}).get(name)
+        if not before:
+            continue
+        diff[name] = {}
+        for metric in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps"):
+            if before.get(metric) and result.get(metric) is not None:
+                diff[name][metric] = {
+                    "before": before[metric],
+                    "after": result[metric],
+                    "change_pct": round((result[metric] - before[metric]) / before[metric] * 100, 1),
+                }
+    return {"previous_commit": previous.get("meta", {}).get("commit"), "endpoints": diff}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=os.environ.get("DATABASE_URL"), help="base con el dataset (por defecto DATABASE_URL)")
+    parser.add_argument("--base-url", help="medir una API corriendo en vez de la app en este proceso")
+    parser.add_argument("--username", default="bench")
+    parser.add_argument("--password", default="bench")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20, help="segundos medidos por endpoint")
+    parser.add_argument("--warmup", type=float, default=3, help="segundos sin medir antes de cada endpoint")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--endpoints", nargs="*", help=f"subconjunto de: {', '.join([*ENDPOINTS, *WRITE_ENDPOINTS])}")
+    parser.add_argument("--writes", action="store_true", help="incluir endpoints que escriben (create_payment)")
+    parser.add_argument("--db-mode", choices=["async", "sync"], help="DB_MODE de la app en este proceso")
+    parser.add_argument("--no-response-cache", action="store_true", help="desactivar el cache de respuestas")
+    parser.add_argument("--output", help="guardar el reporte JSON en este archivo")
+    parser.add_argument("--compare", help="reporte JSON anterior contra el que comparar")
+    args = parser.parse_args()
+    if not args.dsn:
+        parser.error("--dsn (o DATABASE_URL) es obligatorio")
+
+    dataset = Dataset(args.dsn)
+    started_at = datetime.now(timezone.utc).isoformat()
+    results, target = asyncio.run(run(args, dataset))
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "started_at": started_at,
+            "python": platform.python_version(),
+            **target,
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "warmup_s": args.warmup,
+            "seed": args.seed,
+            "dataset": dataset.rows,
+        },
+        "endpoints": results,
+    }
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            report["compare"] = compare(report, json.load(f))
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
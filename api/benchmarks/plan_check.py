@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Chequeo de planes: falla si una consulta de los endpoints calientes hace seq
+scan sobre una tabla grande del dataset de benchmarks/dataset.py.
+
+Levanta la app en este proceso (sin cache de respuestas), pide cada endpoint
+de load_test.py un par de veces y captura las sentencias que manda a la base.
+Después hace EXPLAIN de cada SELECT con sus parámetros y reporta los Seq Scan
+sobre tablas de joyas con más de --min-rows filas. Sale con 1 si hay alguno que
+no esté en ALLOWED_SEQ_SCANS (agregar ahí solo los que se justifican, con el
+motivo). Usar el dataset completo o --scale 0.1: con pocas filas el planner
+prefiere seq scans que en producción no haría.
+
+    python benchmarks/plan_check.py --dsn postgresql://postgres:pw@localhost/joyas_bench
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+
+import httpx
+from sqlalchemy import create_engine, event, text
+
+from common import sqlalchemy_url
+from load_test import ENDPOINTS, Dataset
+
+# Seq scans conocidos y aceptados: (endpoint, tabla, comienzo del SQL normalizado) -> motivo
+ALLOWED_SEQ_SCANS = {
+    ("list_sales", "sale", "SELECT COUNT(*)"): "total de la primera página (include_total=false o cursor lo evitan)",
+    ("list_customers", "customer", "SELECT COUNT(*)"): "total de la primera página (include_total=false o cursor lo evitan)",
+    ("sales_statements", "sale", "SELECT COUNT(*)"): "total de la primera página (include_total=false o cursor lo evitan)",
+    ("sales_statements_by_status", "sale", "SELECT COUNT(*)"): "total de la primera página: un estado es una fracción grande de las ventas",
+    ("history_monthly", "customer", ""): "nombres de todos los clientes con ventas en el período (hash join)",
+    ("history_monthly_year", "customer", ""): "nombres de todos los clientes con ventas en el período (hash join)",
+    ("history_monthly_year", "history_month_customer", ""): "un año es una fracción grande del rollup",
+}
+
+
+def _allowed(endpoint: str, relation: str, sql: str):
+    for (allowed_endpoint, allowed_relation, prefix), reason in ALLOWED_SEQ_SCANS.items():
+        if (allowed_endpoint, allowed_relation) == (endpoint, relation) and sql.upper().startswith(prefix):
+            return reason
+    return None
+
+
+def _seq_scans(plan: dict):
+    if plan.get("Node Type") == "Seq Scan" and plan.get("Schema") == "joyas":
+        yield plan["Relation Name"]
+    for child in plan.get("Plans", []):
+        yield from _seq_scans(child)
+
+
+async def capture(args, dataset) -> dict[str, list[tuple[str, object]]]:
+    """Sentencias SELECT que manda cada endpoint, en orden y sin repetir"""
+    os.environ["DATABASE_URL"] = args.dsn
+    os.environ.setdefault("JWT_SECRET", "plan-check-" + os.urandom(16).hex())
+    os.environ["RESPONSE_CACHE_TTL_SECONDS"] = "{}"
+    from main import app
+    import database
+
+    captured: dict[str, list[tuple[str, object]]] = {}
+    current = {"endpoint": None}
+
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        name = current["endpoint"]
+        if name is None or executemany or not statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            return
+        if all(statement != seen for seen, _ in captured.setdefault(name, [])):
+            captured[name].append((statement, parameters))
+
+    engines = [database.engine] + ([database.async_engine.sync_engine] if database.async_engine is not None else [])
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", before_execute)
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://plan-check", timeout=120) as client:
+            response = await client.post("/auth/login", json={"username": args.username, "password": args.password})
+            response.raise_for_status()
+            headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+            for name in args.endpoints or ENDPOINTS:
+                rng = random.Random(f"{args.seed}:{name}")
+                current["endpoint"] = name
+                for _ in range(args.requests):
+                    method, path, params, body = ENDPOINTS[name](rng, dataset)
+                    response = await client.request(method, path, params=params, json=body, headers=headers)
+                    if response.status_code >= 500:
+                        raise SystemExit(f"{name}: {method} {path} respondió {response.status_code}")
+                current["endpoint"] = None
+    return captured
+
+
+def check(args, captured: dict) -> dict:
+    from slow_queries import normalize_sql
+
+    engine = create_engine(sqlalchemy_url(args.dsn))
+    findings, checked = [], 0
+    with engine.connect() as conn:
+        sizes = dict(conn.execute(text("""
+            SELECT c.relname, c.reltuples::bigint
+            FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = 'joyas' AND c.relkind IN ('r', 'm')
+        """)).all())
+        for endpoint, statements in captured.items():
+            for statement, parameters in statements:
+                checked += 1
+                plan = conn.exec_driver_sql(f"EXPLAIN (VERBOSE, FORMAT JSON) {statement}", parameters).scalar()[0]["Plan"]
+                for relation in sorted(set(_seq_scans(plan))):
+                    rows = sizes.get(relation, 0)
+                    if rows < args.min_rows:
+                        continue
+                    sql = normalize_sql(statement)
+                    findings.append({
+                        "endpoint": endpoint,
+                        "relation": f"joyas.{relation}",
+                        "rows": rows,
+                        "allowed": _allowed(endpoint, relation, sql),
+                        "sql": sql[:args.sql_chars],
+                    })
+                conn.rollback()
+    engine.dispose()
+    failures = [f for f in findings if not f["allowed"]]
+    return {
+        "status": "fail" if failures else "ok",
+        "statements_checked": checked,
+        "min_rows": args.min_rows,
+        "seq_scans": findings,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=os.environ.get("DATABASE_URL"), help="base con el dataset (por defecto DATABASE_URL)")
+    parser.add_argument("--username", default="bench")
+    parser.add_argument("--password", default="bench")
+    parser.add_argument("--requests", type=int, default=2, help="requests por endpoint")
+    parser.add_argument("--min-rows", type=int, default=10_000, help="ignorar seq scans sobre tablas más chicas")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--endpoints", nargs="*", help=f"subconjunto de: {', '.join(ENDPOINTS)}")
+    parser.add_argument("--sql-chars", type=int, default=300, help="largo del SQL en el reporte")
+    args = parser.parse_args()
+    if not args.dsn:
+        parser.error("--dsn (o DATABASE_URL) es obligatorio")
+
+    dataset = Dataset(args.dsn)
+    report = check(args, asyncio.run(capture(args, dataset)))
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    return 1 if report["status"] == "fail" else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from pagination import decode_cursor, encode_cursor
+
+# Entidades de GET /changes: clave en la respuesta -> (tabla, columnas)
+CHANGE_ENTITIES = {
+    "customers": ("customer", "id, full_name, phone, created_at, updated_at"),
+    "sales": (
+        "sale",
+        "id, customer_id, purchase_date, payment_due_date, delivery_date, "
+        "delivery_address, notes, created_at, updated_at",
+    ),
+    "sale_items": (
+        "sale_item",
+        "id, sale_id, product_code, jewel_type, quantity, unit_price, photo_url, created_at, updated_at",
+    ),
+    "payments": ("payment", "id, sale_id, paid_at, amount, created_at, updated_at"),
+}
+ENTITY_BY_TABLE = {table: entity for entity, (table, _) in CHANGE_ENTITIES.items()}
+
+# Transacciones con xid menor a este ya terminaron: es el límite seguro del cursor
+HORIZON_SQL = text("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint")
+PURGED_BEFORE_SQL = text(
+    "SELECT purged_before_xid::text::bigint FROM joyas.tombstone_horizon WHERE id = 1"
+)
+
+# Rango [since, upto) de change_xid, en orden de transacción
+_CHANGED_ROWS_SQL = """
+    SELECT {columns}, change_xid::text::bigint AS change_xid
+    FROM joyas.{table}
+    WHERE change_xid >= CAST(:since AS text)::xid8 AND change_xid < CAST(:upto AS text)::xid8
+    ORDER BY change_xid, id
+    {{limit_clause}}
+"""
+_TOMBSTONES_SQL = """
+    SELECT entity, entity_id, deleted_at, change_xid::text::bigint AS change_xid
+    FROM joyas.tombstone
+    WHERE change_xid >= CAST(:since AS text)::xid8 AND change_xid < CAST(:upto AS text)::xid8
+    ORDER BY change_xid, id
+    {limit_clause}
+"""
+
+QUERIES = {
+    entity: _CHANGED_ROWS_SQL.format(columns=columns, table=table)
+    for entity, (table, columns) in CHANGE_ENTITIES.items()
+}
+QUERIES["deleted"] = _TOMBSTONES_SQL
+
+# Borra tombstones viejos y corre el horizonte: cursores anteriores reciben 410
+PURGE_TOMBSTONES_SQL = text("""
+    WITH purged AS (
+        DELETE FROM joyas.tombstone
+        WHERE deleted_at < now() - make_interval(days => :days)
+        RETURNING change_xid::text::bigint AS xid
+    ),
+    horizon AS (
+        UPDATE joyas.tombstone_horizon
+        SET purged_before_xid = GREATEST(purged_before_xid, ((SELECT max(xid) FROM purged) + 1)::text::xid8)
+        WHERE id = 1 AND EXISTS (SELECT 1 FROM purged)
+    )
+    SELECT count(*) FROM purged
+""")
+
+
+async def _fetch(db: AsyncSession, sql: str, since: int, upto: int, limit: Optional[int]) -> list:
+    limit_clause = "LIMIT :limit" if limit is not None else ""
+    params = {"since": since, "upto": upto}
+    if limit is not None:
+        params["limit"] = limit
+    return (await db.execute(text(sql.format(limit_clause=limit_clause)), params)).fetchall()
+
+
+def _serialize(entity: str, row) -> dict:
+    if entity == "deleted":
+        return {"entity": ENTITY_BY_TABLE.get(row.entity, row.entity), "id": row.entity_id, "deleted_at": row.deleted_at}
+    data = dict(row._mapping)
+    data.pop("change_xid")
+    return data
+
+
+async def get_changes(db: AsyncSession, cursor: Optional[str], limit: int) -> dict:
+    """
+    Filas creadas/modificadas y borradas desde `cursor` (sin cursor: todo).
+    Cada página corta en un límite de transacción: si una entidad tiene más
+    de `limit` cambios, la página termina antes de la transacción que no entró
+    entera y `has_more` indica que hay que pedir la siguiente.
+    """
+    # El cursor lleva (xid, initial): initial=1 mientras se recorre todo desde cero,
+    # caso en el que no importa que falten tombstones purgados
+    since, initial = decode_cursor(cursor, int, int) if cursor else (0, 1)
+
+    purged_before = (await db.execute(PURGED_BEFORE_SQL)).scalar() or 0
+    if not initial and since < purged_before:
+        raise HTTPException(
+            status_code=410,
+            detail="El cursor es anterior a los borrados conservados: sincronizar completo (sin cursor)"
+        )
+
+    horizon = (await db.execute(HORIZON_SQL)).scalar()
+    upto = horizon
+    pages = {}
+    for entity, sql in QUERIES.items():
+        rows = await _fetch(db, sql, since, upto, limit + 1)
+        if len(rows) > limit:
+            # Cortar antes de la primera transacción que no entró completa
+            upto = min(upto, rows[limit].change_xid)
+        pages[entity] = rows
+
+    if upto == since < horizon:
+        # Una sola transacción (ya terminada) con más de `limit` filas: se devuelve entera
+        upto = since + 1
+        pages = {entity: await _fetch(db, sql, since, upto, None) for entity, sql in QUERIES.items()}
+
+    response = {
+        entity: [_serialize(entity, row) for row in rows if row.change_xid < upto]
+        for entity, rows in pages.items()
+    }
+    response["has_more"] = upto < horizon
+    response["cursor"] = encode_cursor(upto, 1 if initial and response["has_more"] else 0)
+    return response
@@ -0,0 +1,140 @@
+import hashlib
+from collections import Counter
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Optional
+
+from fastapi import Request, Response
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from response_cache import cached_response, version_cache
+
+# El navegador guarda la respuesta pero revalida siempre con If-None-Match
+CACHE_CONTROL = "private, no-cache"
+
+# Por endpoint: not_modified (304), modified (200 con ETag), uncacheable (200 sin ETag)
+conditional_stats: dict[str, Counter] = {}
+
+
+def etag_for(version: str) -> str:
+    return '"' + hashlib.sha1(version.encode()).hexdigest()[:20] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Comparación débil de If-None-Match (admite lista, W/ y *)"""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+@lru_cache(maxsize=None)
+def _table_version_sql(tables: tuple[str, ...]):
+    # max(change_xid) usa los índices (change_xid, id) de la migración 0006
+    maxes = ", ".join(
+        f"(SELECT max(change_xid)::text::bigint FROM joyas.{table})" for table in (*tables, "tombstone")
+    )
+    return text(f"""
+        SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint AS xmin,
+               COALESCE(GREATEST({maxes}), 0) AS max_xid
+    """)
+
+
+def cacheable_version(version: str, xmin: int, max_xid: int) -> Optional[str]:
+    """
+    `version` si ya terminaron todas las transacciones anteriores a `max_xid`.
+    Si alguna sigue abierta, su commit cambiaría los datos sin subir el
+    change_xid máximo: sin ETag (None) hasta que termine.
+    """
+    return version if xmin > max_xid else None
+
+
+async def table_version(db: AsyncSession, *tables: str) -> Optional[str]:
+    """Versión del contenido de las tablas (y de los borrados) o None si no es confiable"""
+    row = (await db.execute(_table_version_sql(tables))).first()
+    return cacheable_version(str(row.max_xid), row.xmin, row.max_xid)
+
+
+async def request_version(request: Request, db: AsyncSession, *tables: str) -> Optional[str]:
+    """
+    Versión de las tablas para el ETag. Con If-None-Match se consulta siempre
+    (decide el 304); sin él se reusa la última que consultó este proceso. Una
+    versión reusada nunca es posterior a los datos que se responden: a lo
+    sumo la próxima revalidación devuelve 200 en vez de 304.
+    """
+    if not request.headers.get("if-none-match"):
+        version = version_cache.get(tables)
+        if version is not None:
+            return version
+    version = await table_version(db, *tables)
+    if version is not None:
+        version_cache.set(tables, version)
+    return version
+
+
+def _request_etag(request: Request, endpoint: str, version: str) -> str:
+    # Los query params cambian el contenido: forman parte del ETag
+    return etag_for(f"{endpoint}?{request.url.query}:{version}")
+
+
+def not_modified(request: Request, response: Response, endpoint: str, version: Optional[str]) -> Optional[Response]:
+    """
+    Llamar antes de consultar los datos. Si el If-None-Match del request
+    coincide devuelve el 304 a retornar; si no, agrega ETag a `response` y
+    devuelve None. Con version=None no hay ETag.
+    """
+    counter = conditional_stats.setdefault(endpoint, Counter())
+    if version is None:
+        counter["uncacheable"] += 1
+        return None
+    etag = _request_etag(request, endpoint, version)
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        counter["not_modified"] += 1
+        return Response(status_code=304, headers=headers)
+    counter["modified"] += 1
+    response.headers.update(headers)
+    return None
+
+
+async def cached_conditional_response(
+    request: Request,
+    response: Response,
+    db: AsyncSession,
+    endpoint: str,
+    tables: tuple[str, ...],
+    params: dict,
+    compute: Callable[[], Awaitable[Any]],
+    ttl: Optional[float] = -1,
+) -> Any:
+    """
+    GET con ETag servido desde el cache de respuestas (ver cached_response).
+    Cada entrada guarda la versión de las tablas con la que se calculó y el
+    ETag sale de ella: un acierto sin If-None-Match no consulta la base.
+    """
+    version = None
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        version = await request_version(request, db, *tables)
+        if version is not None and etag_matches(if_none_match, _request_etag(request, endpoint, version)):
+            return not_modified(request, response, endpoint, version)
+
+    async def compute_versioned():
+        return version or await request_version(request, db, *tables), await compute()
+
+    entry_version, body = await cached_response(endpoint, params, compute_versioned, ttl=ttl)
+    return not_modified(request, response, endpoint, entry_version) or body
+
+
+def stats() -> dict:
+    """Contadores por endpoint y proporción de 304 (hit_ratio)"""
+    result = {}
+    for endpoint, counter in sorted(conditional_stats.items()):
+        total = sum(counter.values())
+        result[endpoint] = {
+            "not_modified": counter["not_modified"],
+            "modified": counter["modified"],
+            "uncacheable": counter["uncacheable"],
+            "hit_ratio": round(counter["not_modified"] / total, 4) if total else 0.0,
+        }
+    return result
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from typing import Optional
+from typing import Literal, Optional
 
 
 class Settings(BaseSettings):
@@ -8,6 +8,78 @@ class Settings(BaseSettings):
     jwt_algorithm: str = "HS256"
     jwt_expiration_hours: int = 24
     cors_origins: Optional[str] = None
+    # Modo de acceso a DB: "async" (AsyncSession sobre psycopg 3) o "sync" (Session clásica)
+    db_mode: Literal["async", "sync"] = "async"
+    # Pool de conexiones: tamaño, conexiones extra en picos y espera máxima por una conexión
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout_seconds: float = 30
+    # Reabrir conexiones con más de N segundos (-1 nunca) y verificarlas al sacarlas del pool
+    db_pool_recycle_seconds: int = 1800
+    db_pool_pre_ping: bool = True
+    # Conexiones que se abren al arrancar (None = db_pool_size, 0 desactiva)
+    db_pool_warmup: Optional[int] = None
+    db_connect_timeout_seconds: int = 10
+    # statement_timeout de Postgres para las conexiones del pool (0 = sin límite)
+    db_statement_timeout_ms: int = 0
+    # Registro de consultas lentas: umbral en ms (0 desactiva), EXPLAIN (ANALYZE, BUFFERS) de los
+    # SELECT lentos, máximo registrado por minuto, EXPLAIN por consulta cada N segundos y entradas guardadas
+    slow_query_ms: int = 0
+    slow_query_explain: bool = True
+    slow_query_max_per_minute: int = 30
+    slow_query_explain_interval_seconds: int = 300
+    slow_query_explain_timeout_ms: int = 10000
+    slow_query_log_size: int = 200
+    # Usuarios que pueden usar los endpoints /admin/* (JSON). Ej: ADMIN_USERNAMES='["admin"]'
+    admin_usernames: list[str] = []
+    # Cache de usuarios autenticados (0 desactiva el cache)
+    user_cache_ttl_seconds: int = 60
+    user_cache_max_size: int = 1024
+    # Tomar id/username del JWT sin consultar app_user
+    auth_trust_claims: bool = False
+    # Estrategia de carga del cliente de cada venta, por endpoint: "selectin" o "joined"
+    # Ej: SALE_CUSTOMER_LOADING='{"list_sales": "joined", "get_sale": "joined"}'
+    sale_customer_loading: dict[str, Literal["selectin", "joined"]] = {
+        "list_sales": "selectin",
+        "get_sale": "joined",
+        "update_sale": "joined",
+    }
+    # Origen de /kpis y /dashboard/kpis: "snapshot" (tabla joyas.kpi_snapshot, migración 0003) o "views"
+    kpi_source: Literal["snapshot", "views"] = "snapshot"
+    # Origen de /history/monthly: "rollup" (tabla joyas.history_month_customer, migración 0004) o "views"
+    history_source: Literal["rollup", "views"] = "rollup"
+    # Cache de respuestas de lectura, TTL en segundos por endpoint (0 desactiva ese endpoint)
+    # Ej: RESPONSE_CACHE_TTL_SECONDS='{"kpis": 10, "history_monthly": 600}'
+    response_cache_ttl_seconds: dict[str, int] = {
+        "kpis": 30,
+        "sales_statements": 30,
+        "history_monthly": 300,
+    }
+    response_cache_max_size: int = 512
+    # Escuchar NOTIFY de Postgres para invalidar el cache cuando escribe otro worker
+    response_cache_listen: bool = True
+    # Vigencia de las Idempotency-Key guardadas (migración 0005)
+    idempotency_key_ttl_hours: int = 48
+    # Máximo de operaciones por request en POST /sync/batch
+    sync_batch_max_operations: int = 500
+    # Tamaño máximo de POST /upload/image en MB
+    upload_max_mb: int = 5
+    # Variantes WebP de las fotos: hilos del pool, anchos en px (srcset) y calidad
+    # Ej: IMAGE_VARIANT_WIDTHS='[160, 480]'
+    image_workers: int = 2
+    image_variant_widths: list[int] = [160, 480, 960]
+    image_variant_quality: int = 75
+    # Dónde se guardan las fotos: "local" (api/uploads/images) o "s3" (bucket S3 o compatible, requiere boto3)
+    image_storage: Literal["local", "s3"] = "local"
+    s3_bucket: Optional[str] = None
+    s3_prefix: str = "images/"
+    # Para MinIO/R2/etc.; vacío usa AWS
+    s3_endpoint_url: Optional[str] = None
+    # URL pública del bucket (o CDN) a la que se redirigen /uploads/images/*
+    s3_public_url: Optional[str] = None
+    # Pool de bcrypt: hilos dedicados y máximo de operaciones en espera antes de responder 503
+    password_hash_workers: int = 1
+    password_hash_max_queue: int = 8
 
     model_config = SettingsConfigDict(
         env_file=".env",
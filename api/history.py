@@ -0,0 +1,55 @@
+from datetime import date
+from typing import Optional
+
+from sqlalchemy import text
+
+HISTORY_COLUMNS = "month, customer_id, customer_name, sales_count, total_vendido, ganancia_40"
+
+# Rollup mes × cliente mantenido por triggers (migrations/0004_history_month_rollup.sql).
+# Filtra por rango de `month` para usar la PK (month, customer_id).
+HISTORY_ROLLUP_SQL = """
+    SELECT h.month, h.customer_id, c.full_name AS customer_name, h.sales_count,
+           h.total_vendido, round(h.total_vendido * 0.40, 2) AS ganancia_40
+    FROM joyas.history_month_customer h
+    JOIN joyas.customer c ON c.id = h.customer_id
+    {where_clause}
+    ORDER BY h.month DESC, h.total_vendido DESC
+"""
+
+HISTORY_VIEW_SQL = f"""
+    SELECT {HISTORY_COLUMNS}
+    FROM joyas.v_history_month_customer
+    {{where_clause}}
+    ORDER BY month DESC, total_vendido DESC
+"""
+
+# Filas en las que el rollup difiere de la vista (fuente de verdad)
+HISTORY_DRIFT_SQL = text("""
+    SELECT COALESCE(v.month, h.month) AS month,
+           COALESCE(v.customer_id, h.customer_id) AS customer_id,
+           h.sales_count AS rollup_sales_count, v.sales_count AS expected_sales_count,
+           h.total_vendido AS rollup_total_vendido, v.total_vendido AS expected_total_vendido
+    FROM joyas.v_history_month_customer v
+    FULL JOIN joyas.history_month_customer h
+        ON h.month = v.month AND h.customer_id = v.customer_id
+    WHERE h.month IS NULL OR v.month IS NULL
+       OR h.sales_count <> v.sales_count OR h.total_vendido <> v.total_vendido
+    ORDER BY 1, 2
+""")
+
+HISTORY_REBUILD_SQL = text("SELECT joyas.history_month_rebuild()")
+
+
+def month_range(year: int, month: Optional[int] = None) -> tuple[date, date]:
+    """Rango [inicio, fin) de un mes, o del año completo si no se indica mes"""
+    if month is None:
+        return date(year, 1, 1), date(year + 1, 1, 1)
+    start = date(year, month, 1)
+    end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return start, end
+
+
+def is_closed_period(end: date, today: Optional[date] = None) -> bool:
+    """Un período está cerrado si terminó antes del mes en curso"""
+    today = today or date.today()
+    return end <= date(today.year, today.month, 1)
@@ -0,0 +1,146 @@
+import hashlib
+import json
+from typing import Optional
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+# Claves vigentes de un usuario (tabla de migrations/0005_idempotency_keys.sql)
+LOOKUP_SQL = text("""
+    SELECT key, scope, request_hash, status_code, response
+    FROM joyas.idempotency_key
+    WHERE user_id = :user_id AND key = ANY(:keys) AND expires_at > now()
+""")
+
+# Guarda las respuestas de una o varias claves. Una clave vencida se reutiliza;
+# una vigente no se pisa y no aparece en RETURNING (la guardó otro request).
+SAVE_SQL = text("""
+    INSERT INTO joyas.idempotency_key AS k
+        (user_id, key, scope, request_hash, status_code, response, expires_at)
+    SELECT :user_id, u.key, u.scope, u.request_hash, u.status_code, u.response::jsonb,
+           now() + make_interval(hours => :ttl_hours)
+    FROM unnest(
+        CAST(:keys AS text[]), CAST(:scopes AS text[]), CAST(:hashes AS text[]),
+        CAST(:status_codes AS int[]), CAST(:responses AS text[])
+    ) AS u(key, scope, request_hash, status_code, response)
+    ON CONFLICT (user_id, key) DO UPDATE SET
+        scope = EXCLUDED.scope,
+        request_hash = EXCLUDED.request_hash,
+        status_code = EXCLUDED.status_code,
+        response = EXCLUDED.response,
+        created_at = now(),
+        expires_at = EXCLUDED.expires_at
+    WHERE k.expires_at <= now()
+    RETURNING k.key
+""")
+
+PURGE_SQL = text("DELETE FROM joyas.idempotency_key WHERE expires_at <= now()")
+
+
+def validate_key(key: str) -> str:
+    key = key.strip()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{IDEMPOTENCY_HEADER} inválida (1 a {MAX_KEY_LENGTH} caracteres)"
+        )
+    return key
+
+
+def request_hash(payload: BaseModel) -> str:
+    """sha256 del cuerpo ya validado, con claves ordenadas"""
+    raw = json.dumps(payload.model_dump(mode="json"), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+async def lookup(db: AsyncSession, user_id: int, keys: list[str]) -> dict:
+    """Respuestas guardadas y vigentes por clave"""
+    if not keys:
+        return {}
+    result = await db.execute(LOOKUP_SQL, {"user_id": user_id, "keys": list(keys)})
+    return {row.key: row for row in result}
+
+
+async def save(db: AsyncSession, user_id: int, entries: list[tuple[str, str, str, int, object]]) -> set[str]:
+    """
+    Guarda (key, scope, request_hash, status_code, response) en la transacción
+    actual. Devuelve las claves guardadas; las que falten ya las guardó un
+    request concurrente con la misma clave.
+    """
+    if not entries:
+        return set()
+    keys, scopes, hashes, status_codes, responses = zip(*entries)
+    result = await db.execute(SAVE_SQL, {
+        "user_id": user_id,
+        "keys": list(keys),
+        "scopes": list(scopes),
+        "hashes": list(hashes),
+        "status_codes": list(status_codes),
+        "responses": [json.dumps(jsonable_encoder(response)) for response in responses],
+        "ttl_hours": settings.idempotency_key_ttl_hours,
+    })
+    return set(result.scalars().all())
+
+
+def check_reuse(stored, scope: str, payload_hash: str) -> None:
+    """422 si la clave ya se usó para otro endpoint u otro contenido"""
+    if stored.scope != scope or stored.request_hash != payload_hash:
+        raise HTTPException(
+            status_code=422,
+            detail=f"La {IDEMPOTENCY_HEADER} ya se usó con otro contenido"
+        )
+
+
+class IdempotentRequest:
+    """
+    Idempotencia de un endpoint de escritura:
+    1. `replay()` antes de escribir: si la clave ya tiene respuesta, devolverla.
+    2. `save(response)` antes del commit, en la misma transacción que la escritura.
+       Si devuelve False, otro request con la misma clave ganó: hacer rollback
+       y devolver `replay_after_conflict()`.
+    """
+
+    def __init__(self, key: str, user_id: int, scope: str, payload: BaseModel):
+        self.key = validate_key(key)
+        self.user_id = user_id
+        self.scope = scope
+        self.request_hash = request_hash(payload)
+
+    @classmethod
+    def from_header(cls, key: Optional[str], user_id: int, scope: str, payload: BaseModel):
+        return cls(key, user_id, scope, payload) if key is not None else None
+
+    async def replay(self, db: AsyncSession) -> Optional[JSONResponse]:
+        stored = (await lookup(db, self.user_id, [self.key])).get(self.key)
+        if stored is None:
+            return None
+        check_reuse(stored, self.scope, self.request_hash)
+        return JSONResponse(
+            content=stored.response,
+            status_code=stored.status_code,
+            headers={REPLAYED_HEADER: "true"},
+        )
+
+    async def save(self, db: AsyncSession, response, status_code: int = 200) -> bool:
+        saved = await save(db, self.user_id, [(self.key, self.scope, self.request_hash, status_code, response)])
+        return self.key in saved
+
+    async def replay_after_conflict(self, db: AsyncSession) -> JSONResponse:
+        replay = await self.replay(db)
+        if replay is None:
+            raise HTTPException(
+                status_code=409,
+                detail="Hay otro request en curso con la misma Idempotency-Key",
+                headers={"Retry-After": "1"},
+            )
+        return replay
@@ -0,0 +1,219 @@
+import asyncio
+import logging
+import re
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Optional
+
+from PIL import Image, ImageOps
+from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
+from starlette.exceptions import HTTPException
+from starlette.responses import RedirectResponse, Response
+from starlette.types import Receive, Scope, Send
+
+from config import settings
+from storage import IMMUTABLE_CACHE_CONTROL, UPLOAD_DIR, UPLOAD_URL, ImmutableStaticFiles, image_storage
+
+logger = logging.getLogger(__name__)
+
+# Versiones reducidas en WebP de cada foto: variants/<nombre>_<ancho>w.webp. El
+# nombre de una foto subida es el hash de su contenido (ver uploads.receive_image),
+# así que una variante nunca cambia y ya generada no se vuelve a generar.
+VARIANTS_SUBDIR = "variants"
+VARIANTS_DIR = UPLOAD_DIR / VARIANTS_SUBDIR
+VARIANTS_URL = f"{UPLOAD_URL}/{VARIANTS_SUBDIR}"
+SOURCE_EXTENSIONS = ("jpg", "png", "webp")
+
+_PHOTO_URL_RE = re.compile(rf"^{re.escape(UPLOAD_URL)}/([A-Za-z0-9-]+)\.(jpg|png|webp)$")
+_PHOTO_NAME_RE = re.compile(r"^([A-Za-z0-9-]+)\.(jpg|png|webp)$")
+_VARIANT_NAME_RE = re.compile(r"^([A-Za-z0-9-]+)_(\d+)w\.webp$")
+
+# Redimensionar y codificar WebP es CPU: pool propio para no ocupar el threadpool
+# de FastAPI (Pillow libera el GIL mientras procesa)
+_image_executor = ThreadPoolExecutor(max_workers=settings.image_workers, thread_name_prefix="images")
+image_pool_stats = {"queued": 0, "generated": 0, "failed": 0}
+
+
+def variant_name(stem: str, width: int) -> str:
+    return f"{stem}_{width}w.webp"
+
+
+def variant_key(stem: str, width: int) -> str:
+    """Nombre de la variante dentro del almacenamiento"""
+    return f"{VARIANTS_SUBDIR}/{variant_name(stem, width)}"
+
+
+def generate_variants(source: str) -> int:
+    """
+    Genera las variantes WebP que falten de la foto `source` (sin agrandar la
+    imagen). Cada una se escribe a un temporal y se guarda con put. Devuelve
+    cuántas generó.
+    """
+    stem = Path(source).stem
+    widths = sorted(settings.image_variant_widths)
+    missing = [width for width in widths if not image_storage.exists(variant_key(stem, width))]
+    if not missing:
+        return 0
+    with image_storage.open(source) as file, Image.open(file) as image:
+        # JPEG: decodificar directamente a una escala reducida (mucho más rápido)
+        image.draft("RGB", (max(missing), max(missing)))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB")
+        for width in missing:
+            variant = image.copy()
+            variant.thumbnail((width, width * 4), Image.LANCZOS)
+            # Temporal único: la misma variante puede generarse a la vez al subir y al pedirla
+            tmp = image_storage.tmp_dir / f".{variant_name(stem, width)}.{uuid.uuid4().hex}.part"
+            try:
+                variant.save(tmp, "WEBP", quality=settings.image_variant_quality, method=4)
+                image_storage.put(variant_key(stem, width), tmp, "image/webp")
+            finally:
+                tmp.unlink(missing_ok=True)
+    return len(missing)
+
+
+def _generate(source: str) -> None:
+    try:
+        image_pool_stats["generated"] += generate_variants(source)
+    except Exception as e:
+        image_pool_stats["failed"] += 1
+        logger.error(f"Error al generar variantes de {source}: {str(e)}", exc_info=True)
+    finally:
+        image_pool_stats["queued"] -= 1
+
+
+def schedule_variants(filename: str) -> None:
+    """Encola la generación de variantes de una foto recién subida (no espera)"""
+    image_pool_stats["queued"] += 1
+    asyncio.get_running_loop().run_in_executor(_image_executor, _generate, filename)
+
+
+def _source_for(variant: str) -> Optional[str]:
+    """Foto original de una variante pedida, si el nombre y el ancho son válidos"""
+    match = _VARIANT_NAME_RE.match(variant)
+    if not match or int(match.group(2)) not in settings.image_variant_widths:
+        return None
+    for ext in SOURCE_EXTENSIONS:
+        source = f"{match.group(1)}.{ext}"
+        if image_storage.exists(source):
+            return source
+    return None
+
+
+async def _generate_on_request(variant: str) -> bool:
+    """Genera en el pool la variante pedida si su original existe; False si no hay variante"""
+    source = await run_in_threadpool(_source_for, variant)
+    if source is None:
+        return False
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(_image_executor, generate_variants, source)
+    except Exception as e:
+        # Foto que no se puede decodificar: no hay variante
+        logger.warning(f"No se pudo generar la variante {variant}: {str(e)}")
+        return False
+    return True
+
+
+class VariantStaticFiles(ImmutableStaticFiles):
+    """
+    Sirve las variantes del almacenamiento local y genera en el momento las
+    que todavía no existen (foto subida hace instantes o anterior a las variantes).
+    """
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        try:
+            return await super().get_response(path, scope)
+        except HTTPException as e:
+            if e.status_code != 404 or not await _generate_on_request(path):
+                raise
+        return await super().get_response(path, scope)
+
+
+class StorageRedirects:
+    """
+    Con almacenamiento remoto (S3): redirige cada foto o variante a su URL
+    pública, generando antes la variante si falta. La redirección también es
+    immutable porque el nombre nunca cambia de contenido.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        path = scope["path"].removeprefix(scope.get("root_path", "")).lstrip("/")
+        name = path.removeprefix(f"{VARIANTS_SUBDIR}/")
+        if scope["method"] not in ("GET", "HEAD"):
+            response = Response(status_code=405, headers={"Allow": "GET, HEAD"})
+        elif name == path and _PHOTO_NAME_RE.match(name):
+            response = self.redirect(path)
+        elif name != path and _VARIANT_NAME_RE.match(name) and (
+            await run_in_threadpool(image_storage.exists, path) or await _generate_on_request(name)
+        ):
+            response = self.redirect(path)
+        else:
+            response = Response("Not Found", status_code=404)
+        await response(scope, receive, send)
+
+    @staticmethod
+    def redirect(name: str) -> Response:
+        return RedirectResponse(
+            image_storage.url(name), status_code=307, headers={"Cache-Control": IMMUTABLE_CACHE_CONTROL}
+        )
+
+
+# Fotos en uso: las que referencia algún item (las URLs viejas incluidas)
+REFERENCED_PHOTOS_SQL = text(f"""
+    SELECT DISTINCT photo_url FROM joyas.sale_item WHERE photo_url LIKE '{UPLOAD_URL}/%'
+""")
+
+
+def collect_garbage(referenced_urls: set[str], min_age: timedelta, dry_run: bool = False) -> dict:
+    """
+    Borra las fotos que ningún item referencia y son más viejas que `min_age`
+    (una foto recién subida puede estar en una venta que todavía no se
+    sincronizó), más las variantes sin original o de anchos que ya no se usan.
+    """
+    cutoff = datetime.now(timezone.utc) - min_age
+    referenced = {url.removeprefix(f"{UPLOAD_URL}/") for url in referenced_urls}
+    kept_stems = set()
+    deleted_photos = []
+    for photo in image_storage.list():
+        if photo.name in referenced or photo.modified_at > cutoff:
+            kept_stems.add(Path(photo.name).stem)
+        else:
+            deleted_photos.append(photo.name)
+
+    deleted_variants = []
+    for variant in image_storage.list(VARIANTS_SUBDIR):
+        match = _VARIANT_NAME_RE.match(variant.name.removeprefix(f"{VARIANTS_SUBDIR}/"))
+        if not match or match.group(1) not in kept_stems or int(match.group(2)) not in settings.image_variant_widths:
+            deleted_variants.append(variant.name)
+
+    if not dry_run:
+        for name in deleted_photos + deleted_variants:
+            image_storage.delete(name)
+    return {
+        "kept_photos": len(kept_stems),
+        "deleted_photos": len(deleted_photos),
+        "deleted_variants": len(deleted_variants),
+        "dry_run": dry_run,
+    }
+
+
+def photo_variants(photo_url: Optional[str]) -> Optional[dict]:
+    """
+    URL de la miniatura y srcset ("url 160w, url 480w, ...") de una foto
+    subida, o None si no es una foto propia. Las URLs no dependen de que las
+    variantes ya existan: si falta alguna se genera al pedirla.
+    """
+    match = _PHOTO_URL_RE.match(photo_url or "")
+    if not match or not settings.image_variant_widths:
+        return None
+    stem = match.group(1)
+    widths = sorted(settings.image_variant_widths)
+    return {
+        "thumbnail_url": f"{VARIANTS_URL}/{variant_name(stem, widths[0])}",
+        "srcset": ", ".join(f"{VARIANTS_URL}/{variant_name(stem, width)} {width}w" for width in widths),
+    }
@@ -0,0 +1,39 @@
+from decimal import Decimal
+from sqlalchemy import text
+
+KPI_FIELDS = (
+    "total_joyas_vendidas",
+    "total_ya_pagado",
+    "dinero_faltante",
+    "total_vendido",
+    "dinero_a_entregar",
+    "ganancia_40",
+)
+
+# Fila única mantenida por triggers (migrations/0003_kpi_snapshot.sql)
+KPI_SNAPSHOT_SQL = text(f"""
+    SELECT {", ".join(KPI_FIELDS)}, updated_at
+    FROM joyas.kpi_snapshot
+    WHERE id = 1
+""")
+
+# Agregado completo desde las vistas (fuente de verdad para el chequeo de consistencia)
+KPI_VIEWS_SQL = text("""
+    SELECT k.total_joyas_vendidas, k.total_ya_pagado, k.dinero_faltante,
+           p.total_vendido, p.dinero_a_entregar, p.ganancia_40
+    FROM joyas.v_kpis k
+    LEFT JOIN joyas.v_profit_kpis p ON true
+""")
+
+KPI_REBUILD_SQL = text("SELECT joyas.kpi_snapshot_rebuild()")
+
+
+def kpi_drift(snapshot, expected) -> dict:
+    """Campos en los que el snapshot difiere del agregado completo: {campo: {snapshot, expected}}"""
+    drift = {}
+    for field in KPI_FIELDS:
+        got = Decimal(getattr(snapshot, field) or 0) if snapshot is not None else None
+        want = Decimal(getattr(expected, field) or 0) if expected is not None else Decimal("0")
+        if got != want:
+            drift[field] = {"snapshot": str(got) if got is not None else None, "expected": str(want)}
+    return drift
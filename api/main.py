@@ -1,42 +1,89 @@
-from fastapi import FastAPI, Depends, HTTPException, Query, Response, UploadFile, File
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from sqlalchemy.orm import Session
-from sqlalchemy import func, or_, and_, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy import func, or_, and_, text, select, delete
 from typing import Optional
 from datetime import date, datetime
 from decimal import Decimal
 import os
-import uuid
+import asyncio
 import logging
-from pathlib import Path
+from contextlib import asynccontextmanager
 
-from database import get_db
-from auth import authenticate_user, create_access_token, get_current_user, get_password_hash
+import metrics
+from database import get_db, engine, async_engine, pool_stats, warm_up_pool
+from slow_queries import slow_query_log
+from auth import (
+    authenticate_user, create_access_token, get_admin_user, get_current_user, get_password_hash_async, user_cache
+)
 from models import AppUser, Customer, Sale, SaleItem, Payment
 from schemas import (
     LoginRequest, TokenResponse,
-    CustomerCreate, CustomerResponse,
-    SaleCreate, SaleResponse, SaleUpdate, SaleItemCreate, SaleItemResponse,
+    CustomerCreate, CustomerResponse, CustomerSearchResult,
+    SaleCreate, SaleResponse, SaleUpdate, SaleItemResponse,
     PaymentCreate, PaymentResponse,
-    SaleStatementResponse, KPIsResponse,
+    SaleStatementResponse, SaleFullResponse, KPIsResponse,
     HistoryMonthCustomerResponse,
+    SyncBatchRequest, SyncBatchResponse, ChangesResponse,
     PaginatedResponse
 )
 from config import settings
+from pagination import decode_cursor, encode_cursor, fetch_page
+from search import search_customers
+from kpis import KPI_FIELDS, KPI_SNAPSHOT_SQL
+from balances import SALE_BALANCE_COLUMNS
+from offline_sync import apply_sync_batch
+from sale_writes import insert_items, insert_sale, sync_items
+from sale_detail import get_sale_full, get_sale_version
+import conditional
+from conditional import cached_conditional_response, not_modified, request_version
+from uploads import receive_image
+from storage import UPLOAD_DIR, UPLOAD_URL, ImmutableStaticFiles, LocalStorage, image_storage
+from images import (
+    VARIANTS_DIR, VARIANTS_URL, StorageRedirects, VariantStaticFiles,
+    image_pool_stats, photo_variants, schedule_variants,
+)
+from changes import get_changes
+from idempotency import IDEMPOTENCY_HEADER, IdempotentRequest
+from history import HISTORY_ROLLUP_SQL, HISTORY_VIEW_SQL, is_closed_period, month_range
+from response_cache import (
+    invalidate_local, listen_for_invalidations, notify_invalidation, response_cache, version_cache
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Abrir las conexiones del pool antes de recibir requests
+    warmup = settings.db_pool_size if settings.db_pool_warmup is None else settings.db_pool_warmup
+    await warm_up_pool(warmup)
+    # Invalidación del cache de respuestas entre workers (LISTEN/NOTIFY)
+    listener = None
+    if settings.response_cache_listen:
+        listener = asyncio.create_task(listen_for_invalidations())
+    yield
+    if listener is not None:
+        listener.cancel()
+        try:
+            await listener
+        except asyncio.CancelledError:
+            pass
+    if async_engine is not None:
+        await async_engine.dispose()
+
 
-app = FastAPI(title="Joyas API", version="1.0.0")
+app = FastAPI(title="Joyas API", version="1.0.0", lifespan=lifespan)
 
 # Configurar logging
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
-# Configurar directorio de uploads
-UPLOAD_DIR = Path(__file__).parent / "uploads" / "images"
-UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
-
-# Montar StaticFiles para servir imágenes
-app.mount("/uploads/images", StaticFiles(directory=str(UPLOAD_DIR)), name="uploads-images")
+# Servir imágenes con cache immutable (las variantes primero: se generan si faltan)
+if isinstance(image_storage, LocalStorage):
+    app.mount(VARIANTS_URL, VariantStaticFiles(directory=str(VARIANTS_DIR)), name="uploads-image-variants")
+    app.mount(UPLOAD_URL, ImmutableStaticFiles(directory=str(UPLOAD_DIR)), name="uploads-images")
+else:
+    app.mount(UPLOAD_URL, StorageRedirects(), name="uploads-images")
 
 # Configurar CORS desde variables de entorno
 cors_origins = [
@@ -63,11 +110,57 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Por fuera de CORS: mide el request completo (ver GET /metrics)
+app.add_middleware(metrics.MetricsMiddleware, route_app=app)
+
+
+CURSOR_DESCRIPTION = "Cursor opaco de `next_cursor` para paginación keyset (ignora `page`)"
+INCLUDE_TOTAL_DESCRIPTION = "Calcular `total`/`total_pages` (por defecto sí, salvo cuando se usa `cursor`)"
+
+
+def _wants_total(include_total: Optional[bool], cursor: Optional[str]) -> bool:
+    return include_total if include_total is not None else not cursor
+
+
+async def _count(db: AsyncSession, query) -> int:
+    """Cuenta las filas de un select() sin paginar"""
+    result = await db.execute(select(func.count()).select_from(query.order_by(None).subquery()))
+    return result.scalar_one()
+
+
+def _paginated(items: list, total: Optional[int], page: int, page_size: int, next_cursor: Optional[str]):
+    return PaginatedResponse(
+        items=items,
+        total=total,
+        page=page,
+        page_size=page_size,
+        total_pages=(total + page_size - 1) // page_size if total is not None else None,
+        next_cursor=next_cursor
+    )
+
+
+def _sale_customer_option(endpoint: str):
+    """Opción de carga del cliente de la venta según la estrategia configurada para el endpoint"""
+    strategy = settings.sale_customer_loading.get(endpoint, "selectin")
+    if strategy == "joined":
+        return joinedload(Sale.customer)
+    return selectinload(Sale.customer)
+
+
+async def _get_sale_with_customer(db: AsyncSession, sale_id: int, endpoint: str) -> Optional[Sale]:
+    """Carga una venta con su cliente (Sale.customer no admite lazy loading)"""
+    result = await db.execute(
+        select(Sale)
+        .options(_sale_customer_option(endpoint))
+        .where(Sale.id == sale_id)
+        .execution_options(populate_existing=True)
+    )
+    return result.scalars().first()
 
 
 # ========== AUTH ==========
 @app.post("/auth/login", response_model=TokenResponse)
-async def login(credentials: LoginRequest, db: Session = Depends(get_db)):
+async def login(credentials: LoginRequest, db: AsyncSession = Depends(get_db)):
     """
     Endpoint de login. Maneja errores de forma segura sin exponer información sensible.
     """
@@ -76,11 +169,11 @@ async def login(credentials: LoginRequest, db: Session = Depends(get_db)):
         if not credentials.username or not credentials.password:
             raise HTTPException(status_code=401, detail="Usuario o contraseña incorrectos")
         
-        user = authenticate_user(db, credentials.username, credentials.password)
+        user = await authenticate_user(db, credentials.username, credentials.password)
         if not user:
             raise HTTPException(status_code=401, detail="Usuario o contraseña incorrectos")
         
-        access_token = create_access_token(data={"sub": user.username})
+        access_token = create_access_token(data={"sub": user.username, "uid": user.id})
         return {"access_token": access_token, "token_type": "bearer"}
     except HTTPException:
         # Re-lanzar HTTPException (401, etc.) sin logging
@@ -102,14 +195,14 @@ async def login(credentials: LoginRequest, db: Session = Depends(get_db)):
 
 
 @app.post("/auth/register")
-async def register(credentials: LoginRequest, db: Session = Depends(get_db)):
-    existing = db.query(AppUser).filter(AppUser.username == credentials.username).first()
-    if existing:
+async def register(credentials: LoginRequest, db: AsyncSession = Depends(get_db)):
+    result = await db.execute(select(AppUser).where(AppUser.username == credentials.username))
+    if result.scalars().first():
         raise HTTPException(status_code=400, detail="El usuario ya existe")
-    hashed = get_password_hash(credentials.password)
+    hashed = await get_password_hash_async(credentials.password)
     user = AppUser(username=credentials.username, password_hash=hashed)
     db.add(user)
-    db.commit()
+    await db.commit()
     return {"message": "Usuario creado exitosamente"}
 
 
@@ -117,47 +210,89 @@ async def register(credentials: LoginRequest, db: Session = Depends(get_db)):
 @app.post("/customers", response_model=CustomerResponse)
 async def create_customer(
     customer: CustomerCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: AppUser = Depends(get_current_user)
 ):
     db_customer = Customer(**customer.model_dump())
     db.add(db_customer)
-    db.commit()
-    db.refresh(db_customer)
+    await db.commit()
+    await db.refresh(db_customer)
     return db_customer
 
 
 @app.get("/customers", response_model=PaginatedResponse)
 async def list_customers(
+    request: Request,
+    response: Response,
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
     search: Optional[str] = Query(None),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(None, description=CURSOR_DESCRIPTION),
+    include_total: Optional[bool] = Query(None, description=INCLUDE_TOTAL_DESCRIPTION),
+    db: AsyncSession = Depends(get_db),
     current_user: AppUser = Depends(get_current_user)
 ):
-    query = db.query(Customer)
+    if cached := not_modified(request, response, "list_customers", await request_version(request, db, "customer")):
+        return cached
+    
+    query = select(Customer)
     if search:
-        query = query.filter(Customer.full_name.ilike(f"%{search}%"))
+        query = query.where(Customer.full_name.ilike(f"%{search}%"))
     
-    total = query.count()
-    items = query.order_by(Customer.created_at.desc()).offset((page - 1) * page_size).limit(page_size).all()
+    total = await _count(db, query) if _wants_total(include_total, cursor) else None
+    items, next_cursor = await fetch_page(
+        db, query, (Customer.created_at, Customer.id), (datetime.fromisoformat, int),
+        page, page_size, cursor
+    )
     
-    return PaginatedResponse(
-        items=[CustomerResponse.model_validate(item) for item in items],
-        total=total,
-        page=page,
-        page_size=page_size,
-        total_pages=(total + page_size - 1) // page_size
+    return _paginated(
+        [CustomerResponse.model_validate(item) for item in items], total, page, page_size, next_cursor
     )
 
 
+@app.get("/customers/search", response_model=list[CustomerSearchResult])
+async def search_customers_ranked(
+    request: Request,
+    response: Response,
+    q: str = Query(..., min_length=2, max_length=100),
+    limit: int = Query(20, ge=1, le=50),
+    db: AsyncSession = Depends(get_db),
+    current_user: AppUser = Depends(get_current_user)
+):
+    """
+    Búsqueda de clientes por nombre (sin distinguir acentos), teléfono o código
+    de producto vendido, ordenada por similitud. Requiere la migración 0002 (pg_trgm).
+    """
+    version = await request_version(request, db, "customer", "sale", "sale_item")
+    if cached := not_modified(request, response, "search_customers", version):
+        return cached
+    
+    rows = await search_customers(db, q, limit)
+    return [
+        CustomerSearchResult(
+            id=row.id,
+            full_name=row.full_name,
+            phone=row.phone,
+            created_at=row.created_at,
+            score=round(row.score, 4),
+            matched_on=row.matched_on
+        )
+        for row in rows
+    ]
+
+
 @app.get("/customers/{customer_id}", response_model=CustomerResponse)
 async def get_customer(
     customer_id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
     current_user: AppUser = Depends(get_current_user)
 ):
-    customer = db.query(Customer).filter(Customer.id == customer_id).first()
+    if cached := not_modified(request, response, "get_customer", await request_version(request, db, "customer")):
+        return cached
+    
+    customer = await db.get(Customer, customer_id)
     if not customer:
         raise HTTPException(status_code=404, detail="Cliente no encontrado")
     return customer
@@ -167,145 +302,128 @@ async def get_customer(
 @app.post("/sales", response_model=SaleResponse)
 async def create_sale(
     sale: SaleCreate,
-    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER),
+    db: AsyncSession = Depends(get_db),
     current_user: AppUser = Depends(get_current_user)
 ):
-    # Verificar que el cliente existe
-    customer = db.query(Customer).filter(Customer.id == sale.customer_id).first()
-    if not customer:
-        raise HTTPException(status_code=404, detail="Cliente no encontrado")
+    # Reintento con la misma Idempotency-Key: devolver la respuesta guardada
+    idempotent = IdempotentRequest.from_header(idempotency_key, current_user.id, "POST /sales", sale)
+    if idempotent and (replay := await idempotent.replay(db)):
+        return replay
     
-    # Validar items antes de crear la venta (validación defensiva adicional)
-    if not sale.items or len(sale.items) == 0:
+    if not sale.items:
         raise HTTPException(status_code=422, detail="La venta debe tener al menos un item")
     
-    for idx, item in enumerate(sale.items):
-        # Validación defensiva de cantidad
-        if not isinstance(item.quantity, int):
-            raise HTTPException(
-                status_code=422, 
-                detail=f"Item {idx + 1}: Cantidad debe ser un número entero"
-            )
-        if item.quantity <= 0:
-            raise HTTPException(
-                status_code=422, 
-                detail=f"Item {idx + 1}: Cantidad debe ser mayor a 0"
-            )
-        
-        # Validación defensiva de precio unitario
-        if not isinstance(item.unit_price, (Decimal, int, float)):
-            raise HTTPException(
-                status_code=422, 
-                detail=f"Item {idx + 1}: Precio unitario debe ser un número válido"
-            )
-        try:
-            unit_price_decimal = Decimal(str(item.unit_price))
-            if unit_price_decimal <= 0:
-                raise HTTPException(
-                    status_code=422, 
-                    detail=f"Item {idx + 1}: Precio unitario debe ser mayor a 0"
-                )
-        except (ValueError, TypeError) as e:
-            raise HTTPException(
-                status_code=422, 
-                detail=f"Item {idx + 1}: Precio unitario inválido: {str(e)}"
-            )
-    
-    sale_data = sale.model_dump(exclude={"items"})
-    if not sale_data.get("purchase_date"):
-        sale_data["purchase_date"] = date.today()
-    
-    db_sale = Sale(**sale_data)
-    db.add(db_sale)
-    db.flush()
-    
-    for item_data in sale.items:
-        # Asegurar que los valores sean correctos antes de guardar
-        item_dict = item_data.model_dump()
-        item_dict['quantity'] = int(item_dict['quantity'])
-        item_dict['unit_price'] = Decimal(str(item_dict['unit_price']))
-        db_item = SaleItem(sale_id=db_sale.id, **item_dict)
-        db.add(db_item)
-    
-    db.commit()
-    db.refresh(db_sale)
-    return db_sale
+    # Venta e items en dos INSERT (el del cliente inexistente no inserta nada)
+    db_sale = await insert_sale(db, sale)
+    if db_sale is None:
+        raise HTTPException(status_code=404, detail="Cliente no encontrado")
+    await insert_items(db, db_sale.id, sale.items)
+    
+    customer = await db.get(Customer, sale.customer_id)
+    response = SaleResponse.model_validate({**db_sale._mapping, "customer": customer})
+    if idempotent and not await idempotent.save(db, response):
+        await db.rollback()
+        return await idempotent.replay_after_conflict(db)
+    
+    await notify_invalidation(db)
+    await db.commit()
+    invalidate_local()
+    return response
 
 
 @app.get("/sales", response_model=PaginatedResponse)
 async def list_sales(
+    request: Request,
+    response: Response,
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
     status_filter: Optional[str] = Query(None, description="PAGADO|PARCIAL|PENDIENTE"),
     customer_id: Optional[int] = Query(None),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(None, description=CURSOR_DESCRIPTION),
+    include_total: Optional[bool] = Query(None, description=INCLUDE_TOTAL_DESCRIPTION),
+    db: AsyncSession = Depends(get_db),
     current_user: AppUser = Depends(get_current_user)
 ):
+    version = await request_version(request, db, "sale", "customer", "sale_item", "payment")
+    if cached := not_modified(request, response, "list_sales", version):
+        return cached
+    
     # Query base de ventas
-    query = db.query(Sale)
+    query = select(Sale).options(_sale_customer_option("list_sales"))
     
     if customer_id:
-        query = query.filter(Sale.customer_id == customer_id)
-    
-    total = query.count()
-    sales = query.order_by(Sale.purchase_date.desc()).offset((page - 1) * page_size).limit(page_size).all()
+        query = query.where(Sale.customer_id == customer_id)
     
-    # Si hay filtro de estado, necesitamos usar la vista
+    # Estado de cuenta mantenido en la venta (migración 0008), con índice (status, fecha, id)
     if status_filter:
-        # Obtener IDs de ventas con el estado deseado
-        stmt = text("""
-            SELECT sale_id FROM joyas.v_sale_statement
-            WHERE account_status = :status_filter
-        """)
-        result = db.execute(stmt, {"status_filter": status_filter})
-        sale_ids = [row[0] for row in result]
-        
-        if sale_ids:
-            query = db.query(Sale).filter(Sale.id.in_(sale_ids))
-            if customer_id:
-                query = query.filter(Sale.customer_id == customer_id)
-            total = query.count()
-            sales = query.order_by(Sale.purchase_date.desc()).offset((page - 1) * page_size).limit(page_size).all()
-        else:
-            sales = []
-            total = 0
+        query = query.where(Sale.status == status_filter)
+    
+    total = await _count(db, query) if _wants_total(include_total, cursor) else None
+    sales, next_cursor = await fetch_page(
+        db, query, (Sale.purchase_date, Sale.id), (date.fromisoformat, int),
+        page, page_size, cursor
+    )
     
     items = [SaleResponse.model_validate(sale) for sale in sales]
     
-    return PaginatedResponse(
-        items=items,
-        total=total,
-        page=page,
-        page_size=page_size,
-        total_pages=(total + page_size - 1) // page_size
-    )
+    return _paginated(items, total, page, page_size, next_cursor)
 
 
 @app.get("/sales/{sale_id}", response_model=SaleResponse)
 async def get_sale(
     sale_id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
     current_user: AppUser = Depends(get_current_user)
 ):
-    sale = db.query(Sale).filter(Sale.id == sale_id).first()
+    if cached := not_modified(request, response, "get_sale", await get_sale_version(db, sale_id)):
+        return cached
+    
+    sale = await _get_sale_with_customer(db, sale_id, "get_sale")
     if not sale:
         raise HTTPException(status_code=404, detail="Venta no encontrada")
     return sale
 
 
+@app.get("/sales/{sale_id}/full", response_model=SaleFullResponse)
+async def get_sale_full_detail(
+    sale_id: int,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+    current_user: AppUser = Depends(get_current_user)
+):
+    """Venta con cliente, items, pagos y saldo (pantalla de detalle) en un request"""
+    # Revalidación: solo la query de versión, sin armar la respuesta
+    if cached := not_modified(request, response, "get_sale_full", await get_sale_version(db, sale_id)):
+        return cached
+    
+    body = await get_sale_full(db, sale_id)
+    if body is None:
+        raise HTTPException(status_code=404, detail="Venta no encontrada")
+    return body
+
+
 @app.get("/sales/{sale_id}/statement", response_model=SaleStatementResponse)
 async def get_sale_statement(
     sale_id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
     current_user: AppUser = Depends(get_current_user)
 ):
-    stmt = text("""
-        SELECT sale_id, customer_id, purchase_date, payment_due_date,
-               delivery_date, delivery_address, sale_total, paid_total, remaining, account_status
-        FROM joyas.v_sale_statement
-        WHERE sale_id = :sale_id
+    if cached := not_modified(request, response, "get_sale_statement", await get_sale_version(db, sale_id)):
+        return cached
+    
+    stmt = text(f"""
+        SELECT s.id AS sale_id, s.customer_id, s.purchase_date, s.payment_due_date,
+               s.delivery_date, s.delivery_address, {SALE_BALANCE_COLUMNS}
+        FROM joyas.sale s
+        WHERE s.id = :sale_id
     """)
-    result = db.execute(stmt, {"sale_id": sale_id}).first()
+    result = (await db.execute(stmt, {"sale_id": sale_id})).first()
     
     if not result:
         raise HTTPException(status_code=404, detail="Venta no encontrada")
@@ -327,23 +445,30 @@ async def get_sale_statement(
 @app.get("/sales/{sale_id}/items", response_model=list[SaleItemResponse])
 async def get_sale_items(
     sale_id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
     current_user: AppUser = Depends(get_current_user)
 ):
-    items = db.query(SaleItem).filter(SaleItem.sale_id == sale_id).all()
-    return items
+    # Una venta inexistente responde [] (sin ETag), como antes de los GET condicionales
+    version = await get_sale_version(db, sale_id, required=False)
+    if cached := not_modified(request, response, "get_sale_items", version):
+        return cached
+    
+    result = await db.execute(select(SaleItem).where(SaleItem.sale_id == sale_id))
+    return result.scalars().all()
 
 
 @app.put("/sales/{sale_id}", response_model=SaleResponse)
 async def update_sale(
     sale_id: int,
     sale_update: SaleUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: AppUser = Depends(get_current_user)
 ):
     """Actualizar una venta existente"""
-    # Verificar que la venta existe
-    sale = db.query(Sale).filter(Sale.id == sale_id).first()
+    # Verificar que la venta existe (bloqueada: el diff de items no debe competir con otra edición)
+    sale = await db.get(Sale, sale_id, with_for_update=True)
     if not sale:
         raise HTTPException(status_code=404, detail="Venta no encontrada")
     
@@ -354,63 +479,21 @@ async def update_sale(
         for field, value in update_data.items():
             setattr(sale, field, value)
         
-        # Si se proporcionan items, actualizar items
+        # Si se proporcionan items, aplicar solo las diferencias
         if sale_update.items is not None:
-            # Validar items antes de actualizar
             if len(sale_update.items) == 0:
                 raise HTTPException(status_code=422, detail="La venta debe tener al menos un item")
-            
-            for idx, item in enumerate(sale_update.items):
-                # Validación defensiva de cantidad
-                if not isinstance(item.quantity, int):
-                    raise HTTPException(
-                        status_code=422,
-                        detail=f"Item {idx + 1}: Cantidad debe ser un número entero"
-                    )
-                if item.quantity <= 0:
-                    raise HTTPException(
-                        status_code=422,
-                        detail=f"Item {idx + 1}: Cantidad debe ser mayor a 0"
-                    )
-                
-                # Validación defensiva de precio unitario
-                if not isinstance(item.unit_price, (Decimal, int, float)):
-                    raise HTTPException(
-                        status_code=422,
-                        detail=f"Item {idx + 1}: Precio unitario debe ser un número válido"
-                    )
-                try:
-                    unit_price_decimal = Decimal(str(item.unit_price))
-                    if unit_price_decimal <= 0:
-                        raise HTTPException(
-                            status_code=422,
-                            detail=f"Item {idx + 1}: Precio unitario debe ser mayor a 0"
-                        )
-                except (ValueError, TypeError) as e:
-                    raise HTTPException(
-                        status_code=422,
-                        detail=f"Item {idx + 1}: Precio unitario inválido: {str(e)}"
-                    )
-            
-            # Eliminar items existentes
-            db.query(SaleItem).filter(SaleItem.sale_id == sale_id).delete()
-            
-            # Crear nuevos items
-            for item_data in sale_update.items:
-                item_dict = item_data.model_dump()
-                item_dict['quantity'] = int(item_dict['quantity'])
-                item_dict['unit_price'] = Decimal(str(item_dict['unit_price']))
-                db_item = SaleItem(sale_id=sale_id, **item_dict)
-                db.add(db_item)
+            await sync_items(db, sale_id, sale_update.items)
         
-        db.commit()
-        db.refresh(sale)
-        return sale
+        await notify_invalidation(db)
+        await db.commit()
+        invalidate_local()
+        return await _get_sale_with_customer(db, sale_id, "update_sale")
     except HTTPException:
-        db.rollback()
+        await db.rollback()
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Error al actualizar venta {sale_id}: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail="Error interno al actualizar la venta")
 
@@ -418,31 +501,32 @@ async def update_sale(
 @app.delete("/sales/{sale_id}")
 async def delete_sale(
     sale_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: AppUser = Depends(get_current_user)
 ):
     """Eliminar una venta de forma permanente"""
     # Verificar que la venta existe
-    sale = db.query(Sale).filter(Sale.id == sale_id).first()
+    sale = await db.get(Sale, sale_id)
     if not sale:
         raise HTTPException(status_code=404, detail="Venta no encontrada")
     
     # Iniciar transacción para eliminar en cascada
     try:
         # Eliminar pagos relacionados (si existen)
-        from models import Payment
-        db.query(Payment).filter(Payment.sale_id == sale_id).delete()
+        await db.execute(delete(Payment).where(Payment.sale_id == sale_id))
         
         # Eliminar items relacionados (si existen)
-        db.query(SaleItem).filter(SaleItem.sale_id == sale_id).delete()
+        await db.execute(delete(SaleItem).where(SaleItem.sale_id == sale_id))
         
         # Eliminar la venta
-        db.delete(sale)
+        await db.delete(sale)
         
-        db.commit()
+        await notify_invalidation(db)
+        await db.commit()
+        invalidate_local()
         return {"message": "Venta eliminada correctamente"}
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Error al eliminar venta {sale_id}: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail="Error interno al eliminar la venta")
 
@@ -451,11 +535,17 @@ async def delete_sale(
 @app.post("/payments", response_model=PaymentResponse)
 async def create_payment(
     payment: PaymentCreate,
-    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER),
+    db: AsyncSession = Depends(get_db),
     current_user: AppUser = Depends(get_current_user)
 ):
+    # Reintento con la misma Idempotency-Key: devolver la respuesta guardada
+    idempotent = IdempotentRequest.from_header(idempotency_key, current_user.id, "POST /payments", payment)
+    if idempotent and (replay := await idempotent.replay(db)):
+        return replay
+    
     # Verificar que la venta existe
-    sale = db.query(Sale).filter(Sale.id == payment.sale_id).first()
+    sale = await db.get(Sale, payment.sale_id)
     if not sale:
         raise HTTPException(status_code=404, detail="Venta no encontrada")
     
@@ -465,38 +555,108 @@ async def create_payment(
     
     db_payment = Payment(**payment_data)
     db.add(db_payment)
-    db.commit()
-    db.refresh(db_payment)
-    return db_payment
+    await db.flush()
+    await db.refresh(db_payment)
+    response = PaymentResponse.model_validate(db_payment)
+    if idempotent and not await idempotent.save(db, response):
+        await db.rollback()
+        return await idempotent.replay_after_conflict(db)
+    
+    await notify_invalidation(db)
+    await db.commit()
+    invalidate_local()
+    return response
 
 
 @app.get("/payments", response_model=PaginatedResponse)
 async def list_payments(
+    request: Request,
+    response: Response,
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
     sale_id: Optional[int] = Query(None),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(None, description=CURSOR_DESCRIPTION),
+    include_total: Optional[bool] = Query(None, description=INCLUDE_TOTAL_DESCRIPTION),
+    db: AsyncSession = Depends(get_db),
     current_user: AppUser = Depends(get_current_user)
 ):
-    query = db.query(Payment)
+    if cached := not_modified(request, response, "list_payments", await request_version(request, db, "payment")):
+        return cached
+    
+    query = select(Payment)
     if sale_id:
-        query = query.filter(Payment.sale_id == sale_id)
+        query = query.where(Payment.sale_id == sale_id)
     
-    total = query.count()
-    items = query.order_by(Payment.paid_at.desc()).offset((page - 1) * page_size).limit(page_size).all()
+    total = await _count(db, query) if _wants_total(include_total, cursor) else None
+    items, next_cursor = await fetch_page(
+        db, query, (Payment.paid_at, Payment.id), (datetime.fromisoformat, int),
+        page, page_size, cursor
+    )
     
-    return PaginatedResponse(
-        items=[PaymentResponse.model_validate(item) for item in items],
-        total=total,
-        page=page,
-        page_size=page_size,
-        total_pages=(total + page_size - 1) // page_size
+    return _paginated(
+        [PaymentResponse.model_validate(item) for item in items], total, page, page_size, next_cursor
     )
 
 
+# ========== SYNC OFFLINE ==========
+@app.post("/sync/batch", response_model=SyncBatchResponse)
+async def sync_batch(
+    batch: SyncBatchRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: AppUser = Depends(get_current_user)
+):
+    """
+    Aplica en una sola transacción las operaciones encoladas offline
+    (create_sale / create_payment), en orden, con un resultado por operación.
+    """
+    if len(batch.operations) > settings.sync_batch_max_operations:
+        raise HTTPException(
+            status_code=413,
+            detail=f"El lote supera el máximo de {settings.sync_batch_max_operations} operaciones"
+        )
+    
+    try:
+        results = await apply_sync_batch(db, batch.operations, current_user.id)
+        applied = sum(1 for result in results if result.status == "ok")
+        if any(result.status == "ok" and not result.replayed for result in results):
+            await notify_invalidation(db)
+            await db.commit()
+            invalidate_local()
+    except HTTPException:
+        await db.rollback()
+        raise
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Error al aplicar lote de sync ({len(batch.operations)} operaciones): {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Error interno al sincronizar operaciones")
+    
+    return SyncBatchResponse(applied=applied, failed=len(results) - applied, results=results)
+
+
+@app.get("/changes", response_model=ChangesResponse)
+async def list_changes(
+    since: Optional[str] = Query(None, description="`cursor` de la respuesta anterior (sin valor: todo)"),
+    limit: int = Query(1000, ge=1, le=5000, description="Máximo aproximado de filas por entidad"),
+    db: AsyncSession = Depends(get_db),
+    current_user: AppUser = Depends(get_current_user)
+):
+    """
+    Clientes, ventas, items y pagos creados o modificados desde `since`, más los borrados.
+    Repetir con el `cursor` devuelto mientras `has_more` sea true.
+    """
+    return await get_changes(db, since, limit)
+
+
 # ========== DASHBOARD / KPIs ==========
-async def _get_kpis_internal(db: Session):
+async def _get_kpis_internal(db: AsyncSession):
     """Función interna para obtener KPIs"""
+    # Snapshot mantenido por triggers: una sola fila, O(1)
+    if settings.kpi_source == "snapshot":
+        snapshot = (await db.execute(KPI_SNAPSHOT_SQL)).first()
+        if snapshot:
+            return KPIsResponse(**{field: getattr(snapshot, field) for field in KPI_FIELDS})
+        logger.warning("joyas.kpi_snapshot vacío: calculando KPIs desde las vistas")
+    
     # Leer de v_kpis
     stmt_kpis = text("""
         SELECT 
@@ -505,7 +665,7 @@ async def _get_kpis_internal(db: Session):
             dinero_faltante
         FROM joyas.v_kpis
     """)
-    result_kpis = db.execute(stmt_kpis).first()
+    result_kpis = (await db.execute(stmt_kpis)).first()
     
     # Leer de v_profit_kpis
     stmt_profit = text("""
@@ -515,7 +675,7 @@ async def _get_kpis_internal(db: Session):
             ganancia_40
         FROM joyas.v_profit_kpis
     """)
-    result_profit = db.execute(stmt_profit).first()
+    result_profit = (await db.execute(stmt_profit)).first()
     
     if not result_kpis:
         return KPIsResponse(
@@ -539,33 +699,63 @@ async def _get_kpis_internal(db: Session):
 
 @app.get("/kpis", response_model=KPIsResponse)
 async def get_kpis_simple(
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
     current_user: AppUser = Depends(get_current_user)
 ):
     """Endpoint simplificado para KPIs (alias de /dashboard/kpis)"""
-    return await _get_kpis_internal(db)
+    return await get_kpis(request, response, db, current_user)
 
 
 @app.get("/dashboard/kpis", response_model=KPIsResponse)
 async def get_kpis(
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
     current_user: AppUser = Depends(get_current_user)
 ):
     """Endpoint completo para KPIs"""
-    return await _get_kpis_internal(db)
+    return await cached_conditional_response(
+        request, response, db, "kpis", ("sale_item", "payment"), {}, lambda: _get_kpis_internal(db)
+    )
 
 
 @app.get("/dashboard/sales-statements", response_model=PaginatedResponse)
 async def get_sales_statements(
+    request: Request,
+    response: Response,
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
     status_filter: Optional[str] = Query(None),
     search: Optional[str] = Query(None),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(None, description=CURSOR_DESCRIPTION),
+    include_total: Optional[bool] = Query(None, description=INCLUDE_TOTAL_DESCRIPTION),
+    db: AsyncSession = Depends(get_db),
     current_user: AppUser = Depends(get_current_user)
 ):
+    params = {
+        "page": page, "page_size": page_size, "status_filter": status_filter,
+        "search": search, "cursor": cursor, "include_total": include_total,
+    }
+    return await cached_conditional_response(
+        request, response, db, "sales_statements", ("sale", "customer", "sale_item", "payment"), params,
+        lambda: _get_sales_statements_internal(db, **params)
+    )
+
+
+async def _get_sales_statements_internal(
+    db: AsyncSession,
+    page: int,
+    page_size: int,
+    status_filter: Optional[str],
+    search: Optional[str],
+    cursor: Optional[str],
+    include_total: Optional[bool],
+):
+    # Saldo y estado desde las columnas de la venta (migración 0008), sin agregar items y pagos
     base_query = """
-        FROM joyas.v_sales_active s
+        FROM joyas.sale s
         LEFT JOIN joyas.customer c ON c.id = s.customer_id
         WHERE 1=1
     """
@@ -573,7 +763,7 @@ async def get_sales_statements(
     conditions = []
     
     if status_filter:
-        conditions.append("s.account_status = :status_filter")
+        conditions.append("s.status = :status_filter")
         params["status_filter"] = status_filter
     
     if search:
@@ -582,23 +772,37 @@ async def get_sales_statements(
     
     where_clause = " AND " + " AND ".join(conditions) if conditions else ""
     
-    # Contar total
-    count_sql = f"SELECT COUNT(*) {base_query}{where_clause}"
-    total = db.execute(text(count_sql), params).scalar() or 0
+    # Contar total (opcional: los clientes con scroll infinito no lo necesitan)
+    total = None
+    if _wants_total(include_total, cursor):
+        count_sql = f"SELECT COUNT(*) {base_query}{where_clause}"
+        total = (await db.execute(text(count_sql), params)).scalar() or 0
+    
+    # Paginación keyset si hay cursor, si no OFFSET
+    if cursor:
+        params["cursor_date"], params["cursor_id"] = decode_cursor(cursor, date.fromisoformat, int)
+        where_clause += " AND (s.purchase_date, s.id) < (:cursor_date, :cursor_id)"
+        offset_clause = ""
+    else:
+        params["offset"] = (page - 1) * page_size
+        offset_clause = "OFFSET :offset"
     
-    # Obtener datos paginados
+    # Obtener datos paginados (una fila extra para saber si hay página siguiente)
     query_sql = f"""
-        SELECT s.sale_id, s.customer_id, s.purchase_date, s.payment_due_date,
-               s.delivery_date, s.delivery_address, s.sale_total, s.paid_total, s.remaining, s.account_status,
+        SELECT s.id AS sale_id, s.customer_id, s.purchase_date, s.payment_due_date,
+               s.delivery_date, s.delivery_address, {SALE_BALANCE_COLUMNS},
                c.full_name as customer_name
         {base_query}{where_clause}
-        ORDER BY s.purchase_date DESC
-        LIMIT :limit OFFSET :offset
+        ORDER BY s.purchase_date DESC, s.id DESC
+        LIMIT :limit {offset_clause}
     """
-    params["limit"] = page_size
-    params["offset"] = (page - 1) * page_size
+    params["limit"] = page_size + 1
     
-    results = db.execute(text(query_sql), params).fetchall()
+    results = (await db.execute(text(query_sql), params)).fetchall()
+    next_cursor = None
+    if len(results) > page_size:
+        results = results[:page_size]
+        next_cursor = encode_cursor(results[-1].purchase_date, results[-1].sale_id)
     
     items = []
     for row in results:
@@ -616,106 +820,88 @@ async def get_sales_statements(
             "account_status": row.account_status
         })
     
-    return PaginatedResponse(
-        items=items,
-        total=total,
-        page=page,
-        page_size=page_size,
-        total_pages=(total + page_size - 1) // page_size
-    )
+    return _paginated(items, total, page, page_size, next_cursor)
 
 
-@app.post("/upload/image")
+# El cuerpo se lee en streaming (no con UploadFile): se documenta el form a mano
+UPLOAD_IMAGE_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                }
+            }
+        },
+    }
+}
+
+
+@app.post("/upload/image", openapi_extra=UPLOAD_IMAGE_OPENAPI)
 async def upload_image(
-    file: UploadFile = File(...),
+    request: Request,
     current_user: AppUser = Depends(get_current_user)
 ):
     """
     Sube una imagen y devuelve la URL.
-    Valida: jpg/png/webp, máximo 5MB.
+    Valida: jpg/png/webp (por contenido, no por Content-Type), máximo UPLOAD_MAX_MB.
     """
-    # Validar content-type
-    allowed_types = ["image/jpeg", "image/png", "image/webp"]
-    if file.content_type not in allowed_types:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Tipo de archivo no permitido. Solo: {', '.join(allowed_types)}"
-        )
-    
-    # Leer contenido para validar tamaño
-    contents = await file.read()
-    file_size_mb = len(contents) / (1024 * 1024)
-    
-    if file_size_mb > 5:
-        raise HTTPException(
-            status_code=400,
-            detail="El archivo excede el límite de 5MB"
-        )
-    
-    # Generar nombre único con UUID
-    file_ext = ""
-    if file.content_type == "image/jpeg":
-        file_ext = ".jpg"
-    elif file.content_type == "image/png":
-        file_ext = ".png"
-    elif file.content_type == "image/webp":
-        file_ext = ".webp"
-    
-    filename = f"{uuid.uuid4()}{file_ext}"
-    file_path = UPLOAD_DIR / filename
-    
-    # Guardar archivo
     try:
-        with open(file_path, "wb") as f:
-            f.write(contents)
-    except Exception as e:
+        filename = await receive_image(request, image_storage, settings.upload_max_mb * 1024 * 1024)
+    except OSError as e:
+        logger.error(f"Error al guardar imagen: {str(e)}", exc_info=True)
         raise HTTPException(
             status_code=500,
-            detail=f"Error al guardar el archivo: {str(e)}"
+            detail="Error al guardar el archivo"
         )
     
-    # Devolver URL relativa
-    return {"url": f"/uploads/images/{filename}"}
+    # Miniaturas y WebP en segundo plano
+    schedule_variants(filename)
+    url = f"{UPLOAD_URL}/{filename}"
+    return {"url": url, "variants": photo_variants(url)}
 
 
 @app.get("/history/monthly", response_model=list[HistoryMonthCustomerResponse])
 async def get_history_monthly(
+    request: Request,
+    response: Response,
     year: Optional[int] = Query(None, ge=2000, le=2100),
     month: Optional[int] = Query(None, ge=1, le=12),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: AppUser = Depends(get_current_user)
 ):
     """
     Obtiene historial mensual por cliente.
     Si no se especifican year y month, devuelve los últimos 12 meses.
     """
+    # Meses ya cerrados no cambian salvo por escrituras, que vacían el cache: sin TTL
+    ttl = None if year and is_closed_period(month_range(year, month)[1]) else -1
+    return await cached_conditional_response(
+        request, response, db, "history_monthly", ("sale", "customer", "sale_item"), {"year": year, "month": month},
+        lambda: _get_history_monthly_internal(db, year, month), ttl=ttl
+    )
+
+
+async def _get_history_monthly_internal(db: AsyncSession, year: Optional[int], month: Optional[int]):
     params = {}
     conditions = []
     
-    if year and month:
-        # Filtrar por año y mes específicos
-        conditions.append("EXTRACT(YEAR FROM month) = :year")
-        conditions.append("EXTRACT(MONTH FROM month) = :month")
-        params["year"] = year
-        params["month"] = month
-    elif year:
-        # Filtrar solo por año
-        conditions.append("EXTRACT(YEAR FROM month) = :year")
-        params["year"] = year
+    if year:
+        # Rango [inicio, fin) sobre month: usa el índice en lugar de EXTRACT por fila
+        params["start"], params["end"] = month_range(year, month)
+        conditions.append("month >= :start")
+        conditions.append("month < :end")
     else:
         # Últimos 12 meses
         conditions.append("month >= DATE_TRUNC('month', CURRENT_DATE) - INTERVAL '12 months'")
     
-    where_clause = " WHERE " + " AND ".join(conditions) if conditions else ""
-    
-    query_sql = f"""
-        SELECT month, customer_id, customer_name, sales_count, total_vendido, ganancia_40
-        FROM joyas.v_history_month_customer
-        {where_clause}
-        ORDER BY month DESC, total_vendido DESC
-    """
+    query_template = HISTORY_ROLLUP_SQL if settings.history_source == "rollup" else HISTORY_VIEW_SQL
+    query_sql = query_template.format(where_clause=" WHERE " + " AND ".join(conditions))
     
-    results = db.execute(text(query_sql), params).fetchall()
+    results = (await db.execute(text(query_sql), params)).fetchall()
     
     items = []
     for row in results:
@@ -743,20 +929,90 @@ async def health():
     return {"status": "ok"}
 
 
+# /health/db consulta la DB solo si el pool no se usó en este tiempo
+HEALTH_DB_IDLE_SECONDS = 30
+
+
 @app.get("/health/db")
 async def health_db():
-    """Healthcheck de base de datos (sin exponer credenciales)"""
+    """
+    Healthcheck de base de datos (sin exponer credenciales) con el estado del
+    pool. Si hubo un checkout reciente la DB respondió y no se consulta; si
+    no, hace SELECT 1 con una conexión del pool (lo que además la mantiene viva).
+    """
+    stats = pool_stats()
+    if stats["seconds_since_checkout"] is not None and stats["seconds_since_checkout"] < HEALTH_DB_IDLE_SECONDS:
+        return {"status": "ok", "pool": stats}
     try:
-        from database import engine
-        # Intentar conectar a la base de datos
-        with engine.connect() as conn:
-            # Ejecutar una query simple para verificar conexión
-            conn.execute(text("SELECT 1"))
-        return {"status": "ok"}
+        if async_engine is not None:
+            async with async_engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+        else:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+        return {"status": "ok", "pool": pool_stats()}
     except Exception as e:
         # Loggear error sin exponer credenciales
         logger.error(f"Error de conexión a DB - Tipo: {type(e).__name__}", exc_info=False)
-        return {"status": "error"}
+        return {"status": "error", "pool": pool_stats()}
+
+
+@app.get("/health/cache")
+async def health_cache():
+    """Contadores de aciertos/fallos de los caches en memoria del proceso y de los 304"""
+    return {
+        "user_cache": user_cache.stats(),
+        "response_cache": response_cache.stats(),
+        "version_cache": version_cache.stats(),
+        "conditional_get": conditional.stats(),
+        "image_variants": image_pool_stats,
+    }
+
+
+metrics.register(metrics.Gauges(
+    "joyas_cache", "Contadores de los caches en memoria", ("cache", "stat"),
+    lambda: {
+        (cache, stat): value
+        for cache, stats in (("user", user_cache.stats()), ("response", response_cache.stats()))
+        for stat, value in stats.items()
+        if stat in ("hits", "misses", "size")
+    },
+))
+metrics.register(metrics.Gauges(
+    "joyas_conditional_get", "Respuestas de los GET con ETag por endpoint", ("endpoint", "result"),
+    lambda: {
+        (endpoint, result): value
+        for endpoint, stats in conditional.stats().items()
+        for result, value in stats.items()
+        if result != "hit_ratio"
+    },
+))
+metrics.register(metrics.Gauges(
+    "joyas_image_variants", "Pool de variantes de imágenes", ("stat",),
+    lambda: {(stat,): value for stat, value in image_pool_stats.items()},
+))
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    """Métricas del proceso en formato de texto de Prometheus"""
+    return Response(content=metrics.render(), media_type=metrics.PROMETHEUS_CONTENT_TYPE)
+
+
+@app.get("/admin/slow-queries")
+async def admin_slow_queries(
+    limit: int = Query(50, ge=1, le=500),
+    current_user: AppUser = Depends(get_admin_user)
+):
+    """Últimas consultas lentas de este proceso (SLOW_QUERY_MS), con su plan si es un SELECT"""
+    return slow_query_log.snapshot(limit)
+
+
+@app.delete("/admin/slow-queries", status_code=204)
+async def admin_clear_slow_queries(current_user: AppUser = Depends(get_admin_user)):
+    """Vacía el registro de consultas lentas de este proceso"""
+    slow_query_log.clear()
+    return Response(status_code=204)
 
 
 @app.get("/health/cors")
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Comandos de mantenimiento de la base de datos.
+
+    python manage.py migrate            # aplica las migraciones pendientes de migrations/
+    python manage.py migrate --status   # aplicadas, salteadas y pendientes
+    python manage.py migrate --stamp 0006   # registra como aplicadas (base migrada a mano con psql; verifica sus objetos)
+    python manage.py migrate --skip 0002    # la saltea (queda registrada como salteada)
+    python manage.py migrate --apply-skipped 0002   # aplica una salteada
+    python manage.py kpi-check          # compara joyas.kpi_snapshot con las vistas
+    python manage.py kpi-check --fix    # y lo recalcula si hay diferencias
+    python manage.py history-check      # compara joyas.history_month_customer con la vista
+    python manage.py history-check --fix
+    python manage.py balance-check      # compara el saldo de cada venta con v_sale_statement
+    python manage.py balance-check --fix
+    python manage.py purge-idempotency-keys   # borra las Idempotency-Key vencidas
+    python manage.py purge-tombstones --days 90   # borra registros de borrados viejos
+    python manage.py image-variants     # genera las variantes WebP que falten de las fotos
+    python manage.py gc-images --dry-run     # fotos y variantes que ya no usa ningún item
+"""
+import argparse
+import json
+import sys
+from datetime import timedelta
+
+from balances import BALANCE_DRIFT_SQL, BALANCE_REBUILD_SQL
+from changes import PURGE_TOMBSTONES_SQL
+from database import engine
+from history import HISTORY_DRIFT_SQL, HISTORY_REBUILD_SQL
+from idempotency import PURGE_SQL
+from images import REFERENCED_PHOTOS_SQL, collect_garbage, generate_variants
+from kpis import KPI_REBUILD_SQL, KPI_SNAPSHOT_SQL, KPI_VIEWS_SQL, kpi_drift
+from schema_migrations import MigrationError, migrate, status
+from storage import image_storage
+from uploads import IMAGE_FORMATS
+
+
+def migrate_command(args) -> int:
+    """Aplica las migraciones pendientes (o las lista / las registra sin ejecutarlas)"""
+    try:
+        if args.status:
+            print(json.dumps(status(engine), indent=2))
+            return 0
+        done = migrate(
+            engine,
+            target=args.stamp or args.target,
+            stamp=args.stamp is not None,
+            skip=tuple(args.skip),
+            apply_skipped=tuple(args.apply_skipped),
+        )
+    except MigrationError as e:
+        print(str(e), file=sys.stderr)
+        return 1
+    print(json.dumps(done, indent=2))
+    return 0
+
+
+def kpi_check(args) -> int:
+    """Recalcula los KPIs desde las vistas y reporta diferencias con el snapshot"""
+    with engine.begin() as conn:
+        snapshot = conn.execute(KPI_SNAPSHOT_SQL).first()
+        expected = conn.execute(KPI_VIEWS_SQL).first()
+        drift = kpi_drift(snapshot, expected)
+        report = {"status": "drift" if drift else "ok", "drift": drift}
+        if drift and args.fix:
+            conn.execute(KPI_REBUILD_SQL)
+            report["status"] = "fixed"
+            report["remaining_drift"] = kpi_drift(conn.execute(KPI_SNAPSHOT_SQL).first(), expected)
+    print(json.dumps(report, indent=2))
+    return 1 if drift and not args.fix else 0
+
+
+def history_check(args) -> int:
+    """Compara el rollup mensual con v_history_month_customer y reporta las filas distintas"""
+    with engine.begin() as conn:
+        drift = [dict(row._mapping) for row in conn.execute(HISTORY_DRIFT_SQL)]
+        report = {"status": "drift" if drift else "ok", "drift": drift}
+        if drift and args.fix:
+            conn.execute(HISTORY_REBUILD_SQL)
+            report["status"] = "fixed"
+            report["remaining_drift"] = len(conn.execute(HISTORY_DRIFT_SQL).fetchall())
+    print(json.dumps(report, indent=2, default=str))
+    return 1 if drift and not args.fix else 0
+
+
+def balance_check(args) -> int:
+    """Compara sale_total/paid_total/status de cada venta con v_sale_statement"""
+    with engine.begin() as conn:
+        drift = [dict(row._mapping) for row in conn.execute(BALANCE_DRIFT_SQL)]
+        report = {"status": "drift" if drift else "ok", "drift_count": len(drift), "drift": drift[:args.limit]}
+        if drift and args.fix:
+            report["fixed"] = conn.execute(BALANCE_REBUILD_SQL).scalar()
+            report["status"] = "fixed"
+            report["remaining_drift"] = len(conn.execute(BALANCE_DRIFT_SQL).fetchall())
+    print(json.dumps(report, indent=2, default=str))
+    return 1 if drift and not args.fix else 0
+
+
+def purge_idempotency_keys(args) -> int:
+    """Borra las claves de idempotencia vencidas"""
+    with engine.begin() as conn:
+        deleted = conn.execute(PURGE_SQL).rowcount
+    print(json.dumps({"deleted": deleted}))
+    return 0
+
+
+def purge_tombstones(args) -> int:
+    """Borra tombstones de más de --days días; los clientes con cursores anteriores deben resincronizar"""
+    with engine.begin() as conn:
+        deleted = conn.execute(PURGE_TOMBSTONES_SQL, {"days": args.days}).scalar()
+    print(json.dumps({"deleted": deleted}))
+    return 0
+
+
+def image_variants(args) -> int:
+    """Genera las variantes que falten de las fotos ya subidas (por ejemplo, anteriores a las variantes)"""
+    generated = failed = 0
+    extensions = tuple(IMAGE_FORMATS.values())
+    for photo in sorted(image_storage.list()):
+        if not photo.name.endswith(extensions):
+            continue
+        try:
+            generated += generate_variants(photo.name)
+        except Exception as e:
+            failed += 1
+            print(f"{photo.name}: {e}", file=sys.stderr)
+    print(json.dumps({"generated": generated, "failed": failed}))
+    return 1 if failed else 0
+
+
+def gc_images(args) -> int:
+    """Borra las fotos sin referencias de más de --min-age-hours y sus variantes"""
+    with engine.connect() as conn:
+        referenced = set(conn.execute(REFERENCED_PHOTOS_SQL).scalars())
+    result = collect_garbage(referenced, timedelta(hours=args.min_age_hours), dry_run=args.dry_run)
+    print(json.dumps(result))
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = commands.add_parser("migrate", help="aplicar las migraciones pendientes de migrations/")
+    migrate_mode = migrate_parser.add_mutually_exclusive_group()
+    migrate_mode.add_argument("--target", metavar="NNNN", help="aplicar solo hasta esta versión")
+    migrate_mode.add_argument(
+        "--stamp", metavar="NNNN",
+        help="registrar hasta esta versión como aplicada sin ejecutarla (verifica que existan sus objetos)",
+    )
+    migrate_mode.add_argument("--status", action="store_true", help="listar aplicadas, salteadas y pendientes")
+    migrate_parser.add_argument(
+        "--skip", action="append", default=[], metavar="NNNN",
+        help="registrar esta versión como salteada sin ejecutarla (ej. 0002 sin pg_trgm); repetible",
+    )
+    migrate_parser.add_argument(
+        "--apply-skipped", action="append", default=[], metavar="NNNN",
+        help="aplicar una versión salteada antes; repetible",
+    )
+    migrate_parser.set_defaults(func=migrate_command)
+
+    kpi = commands.add_parser("kpi-check", help="verificar el snapshot de KPIs contra las vistas")
+    kpi.add_argument("--fix", action="store_true", help="recalcular el snapshot si hay diferencias")
+    kpi.set_defaults(func=kpi_check)
+
+    history = commands.add_parser("history-check", help="verificar el rollup mensual contra la vista")
+    history.add_argument("--fix", action="store_true", help="recalcular el rollup si hay diferencias")
+    history.set_defaults(func=history_check)
+
+    balance = commands.add_parser("balance-check", help="verificar el saldo mantenido de cada venta contra la vista")
+    balance.add_argument("--fix", action="store_true", help="recalcular los saldos que difieren")
+    balance.add_argument("--limit", type=int, default=100, help="ventas con diferencias a listar")
+    balance.set_defaults(func=balance_check)
+
+    purge = commands.add_parser("purge-idempotency-keys", help="borrar Idempotency-Key vencidas")
+    purge.set_defaults(func=purge_idempotency_keys)
+
+    tombstones = commands.add_parser("purge-tombstones", help="borrar tombstones de /changes más viejos que --days")
+    tombstones.add_argument("--days", type=int, default=90)
+    tombstones.set_defaults(func=purge_tombstones)
+
+    variants = commands.add_parser("image-variants", help="generar las variantes WebP que falten de las fotos")
+    variants.set_defaults(func=image_variants)
+
+    gc = commands.add_parser("gc-images", help="borrar fotos que ningún item usa y sus variantes")
+    gc.add_argument("--min-age-hours", type=float, default=168, help="no borrar fotos más nuevas (ventas offline sin sincronizar)")
+    gc.add_argument("--dry-run", action="store_true", help="solo contar, sin borrar")
+    gc.set_defaults(func=gc_images)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,222 @@
+import bisect
+import contextvars
+import threading
+import time
+from typing import Callable, Iterable, Optional
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Métricas en memoria del proceso, en formato de texto de Prometheus. Cada
+# worker tiene las suyas: Prometheus las distingue por instancia.
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+# Ruta de los requests que no matchean ninguna (evita una serie por URL)
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name, self.help, self.label_names = name, help, labels
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            yield f"{self.name}{_labels(self.label_names, labels)} {_number(value)}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name, self.help, self.label_names = name, help, labels
+        self.buckets = tuple(sorted(buckets))
+        # Por serie: [conteo por bucket..., +Inf], suma
+        self._series: dict[tuple, tuple[list[int], list[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._series.setdefault(labels, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = sorted((labels, (list(counts), total[0])) for labels, (counts, total) in self._series.items())
+        for labels, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                yield f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.label_names, labels)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}"
+
+
+class Gauges:
+    """Valores que se leen al exportar (estado del pool, caches, ...)"""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...], read: Callable[[], dict[tuple, float]]):
+        self.name, self.help, self.label_names, self.read = name, help, labels, read
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        for labels, value in sorted(self.read().items()):
+            yield f"{self.name}{_labels(self.label_names, labels)} {_number(value)}"
+
+
+REGISTRY: list = []
+
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+HTTP_REQUESTS = register(Counter(
+    "joyas_http_requests_total", "Requests por ruta y status", ("method", "route", "status")
+))
+HTTP_DURATION = register(Histogram(
+    "joyas_http_request_duration_seconds", "Latencia por ruta (hasta el último byte)", ("method", "route")
+))
+HTTP_RESPONSE_SIZE = register(Histogram(
+    "joyas_http_response_size_bytes", "Tamaño del cuerpo de la respuesta", ("method", "route"), SIZE_BUCKETS
+))
+DB_STATEMENTS = register(Histogram(
+    "joyas_db_statements_per_request", "Sentencias SQL por request", ("route",), COUNT_BUCKETS
+))
+DB_TIME = register(Histogram(
+    "joyas_db_time_per_request_seconds", "Tiempo en SQL por request (suma de sus sentencias)", ("route",)
+))
+DB_STATEMENT_DURATION = register(Histogram(
+    "joyas_db_statement_duration_seconds", "Duración de cada sentencia SQL"
+))
+DB_POOL_WAIT = register(Histogram(
+    "joyas_db_pool_wait_seconds", "Espera para obtener una conexión del pool",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+))
+AUTH_DURATION = register(Histogram(
+    "joyas_auth_duration_seconds", "Resolución del usuario del JWT según de dónde sale", ("source",)
+))
+
+
+class _RequestStats:
+    __slots__ = ("statements", "db_seconds")
+
+    def __init__(self):
+        self.statements = 0
+        self.db_seconds = 0.0
+
+
+# Estadísticas del request en curso (None fuera de un request: scripts, LISTEN, warm-up)
+_current: contextvars.ContextVar[Optional[_RequestStats]] = contextvars.ContextVar("request_stats", default=None)
+
+
+def record_statement(seconds: float) -> None:
+    """Llamar al terminar cada sentencia SQL (ver database.py)"""
+    DB_STATEMENT_DURATION.observe(seconds)
+    stats = _current.get()
+    if stats is not None:
+        stats.statements += 1
+        stats.db_seconds += seconds
+
+
+def _route_template(app, scope: Scope) -> str:
+    """Plantilla de la ruta que atendió el request (/sales/{sale_id}), no la URL"""
+    endpoint = scope.get("endpoint")
+    if endpoint is not None:
+        for route in app.router.routes:
+            if getattr(route, "endpoint", None) is endpoint:
+                return route.path
+    # Mounts (StaticFiles): el prefijo montado
+    root_path = scope.get("root_path", "")
+    app_root_path = scope.get("app_root_path", "")
+    if root_path and root_path != app_root_path:
+        return root_path.removeprefix(app_root_path) or UNMATCHED_ROUTE
+    return UNMATCHED_ROUTE
+
+
+class MetricsMiddleware:
+    """Mide latencia, tamaño de respuesta y SQL de cada request HTTP"""
+
+    def __init__(self, app: ASGIApp, route_app=None):
+        self.app = app
+        # La app FastAPI, para traducir el endpoint a su plantilla de ruta
+        self.route_app = route_app
+        self._templates: dict = {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = _RequestStats()
+        token = _current.set(stats)
+        status = 500
+        size = 0
+        start = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            _current.reset(token)
+            route = self._route(scope)
+            method = scope["method"]
+            HTTP_REQUESTS.inc(method, route, str(status))
+            HTTP_DURATION.observe(elapsed, method, route)
+            HTTP_RESPONSE_SIZE.observe(size, method, route)
+            DB_STATEMENTS.observe(stats.statements, route)
+            DB_TIME.observe(stats.db_seconds, route)
+
+    def _route(self, scope: Scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is not None and endpoint in self._templates:
+            return self._templates[endpoint]
+        route = _route_template(self.route_app, scope) if self.route_app is not None else UNMATCHED_ROUTE
+        if endpoint is not None:
+            self._templates[endpoint] = route
+        return route
+
+
+def render() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
@@ -0,0 +1,84 @@
+-- Esquema base de joyas: las tablas y vistas que ya existían antes de 0001.
+-- Reconstruido a partir de models.py y de las columnas que leen las consultas
+-- de la API; en producción las vistas pueden estar escritas de otra forma
+-- (mismas columnas). Una base existente no la ejecuta: se marca como aplicada
+-- con `manage.py migrate --stamp 0006` (ver README).
+
+CREATE SCHEMA IF NOT EXISTS joyas;
+
+CREATE TABLE joyas.app_user (
+    id BIGSERIAL PRIMARY KEY,
+    username VARCHAR(60) NOT NULL UNIQUE,
+    password_hash TEXT NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE TABLE joyas.customer (
+    id BIGSERIAL PRIMARY KEY,
+    full_name VARCHAR(120) NOT NULL,
+    phone VARCHAR(30),
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE TABLE joyas.sale (
+    id BIGSERIAL PRIMARY KEY,
+    customer_id BIGINT NOT NULL REFERENCES joyas.customer(id),
+    purchase_date DATE NOT NULL DEFAULT CURRENT_DATE,
+    payment_due_date DATE,
+    delivery_date DATE,
+    delivery_address TEXT NOT NULL,
+    notes TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE TABLE joyas.sale_item (
+    id BIGSERIAL PRIMARY KEY,
+    sale_id BIGINT NOT NULL REFERENCES joyas.sale(id) ON DELETE CASCADE,
+    product_code VARCHAR(50),
+    jewel_type VARCHAR(80) NOT NULL,
+    quantity INTEGER NOT NULL DEFAULT 1 CHECK (quantity > 0),
+    unit_price NUMERIC(12, 2) NOT NULL CHECK (unit_price > 0),
+    photo_url TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE TABLE joyas.payment (
+    id BIGSERIAL PRIMARY KEY,
+    sale_id BIGINT NOT NULL REFERENCES joyas.sale(id) ON DELETE CASCADE,
+    paid_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    amount NUMERIC(12, 2) NOT NULL CHECK (amount > 0),
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE VIEW joyas.v_sale_statement AS
+SELECT s.id AS sale_id, s.customer_id, s.purchase_date, s.payment_due_date, s.delivery_date, s.delivery_address,
+       COALESCE(i.total, 0)::numeric(14,2) AS sale_total,
+       COALESCE(p.total, 0)::numeric(14,2) AS paid_total,
+       GREATEST(COALESCE(i.total, 0) - COALESCE(p.total, 0), 0)::numeric(14,2) AS remaining,
+       CASE WHEN COALESCE(i.total, 0) > 0 AND COALESCE(p.total, 0) >= COALESCE(i.total, 0) THEN 'PAGADO'
+            WHEN COALESCE(p.total, 0) > 0 THEN 'PARCIAL'
+            ELSE 'PENDIENTE' END AS account_status
+FROM joyas.sale s
+LEFT JOIN (SELECT sale_id, SUM(quantity * unit_price) AS total FROM joyas.sale_item GROUP BY sale_id) i ON i.sale_id = s.id
+LEFT JOIN (SELECT sale_id, SUM(amount) AS total FROM joyas.payment GROUP BY sale_id) p ON p.sale_id = s.id;
+
+-- Ventas que muestra el dashboard (acá todas)
+CREATE VIEW joyas.v_sales_active AS SELECT * FROM joyas.v_sale_statement;
+
+CREATE VIEW joyas.v_kpis AS
+SELECT (SELECT COALESCE(SUM(quantity), 0) FROM joyas.sale_item)::bigint AS total_joyas_vendidas,
+       (SELECT COALESCE(SUM(amount), 0) FROM joyas.payment)::numeric(14,2) AS total_ya_pagado,
+       (SELECT COALESCE(SUM(remaining), 0) FROM joyas.v_sale_statement)::numeric(14,2) AS dinero_faltante;
+
+CREATE VIEW joyas.v_profit_kpis AS
+SELECT t.total_vendido, (t.total_vendido * 0.60)::numeric(14,2) AS dinero_a_entregar, (t.total_vendido * 0.40)::numeric(14,2) AS ganancia_40
+FROM (SELECT COALESCE(SUM(quantity * unit_price), 0)::numeric(14,2) AS total_vendido FROM joyas.sale_item) t;
+
+CREATE VIEW joyas.v_history_month_customer AS
+SELECT date_trunc('month', s.purchase_date)::date AS month, s.customer_id, c.full_name AS customer_name,
+       COUNT(DISTINCT s.id)::int AS sales_count,
+       COALESCE(SUM(si.quantity * si.unit_price), 0)::numeric(14,2) AS total_vendido,
+       (COALESCE(SUM(si.quantity * si.unit_price), 0) * 0.40)::numeric(14,2) AS ganancia_40
+FROM joyas.sale s JOIN joyas.customer c ON c.id = s.customer_id
+LEFT JOIN joyas.sale_item si ON si.sale_id = s.id
+GROUP BY 1, 2, 3;
@@ -0,0 +1,23 @@
+-- Índices compuestos para la paginación keyset (fecha DESC, id DESC) de los listados.
+-- Permiten que "WHERE (fecha, id) < (:fecha, :id) ORDER BY fecha DESC, id DESC LIMIT n"
+-- lea solo n filas del índice, sin importar la profundidad de la página.
+
+-- GET /sales y /dashboard/sales-statements
+CREATE INDEX IF NOT EXISTS ix_sale_purchase_date_id
+    ON joyas.sale (purchase_date DESC, id DESC);
+
+-- GET /sales?customer_id=
+CREATE INDEX IF NOT EXISTS ix_sale_customer_purchase_date_id
+    ON joyas.sale (customer_id, purchase_date DESC, id DESC);
+
+-- GET /customers
+CREATE INDEX IF NOT EXISTS ix_customer_created_at_id
+    ON joyas.customer (created_at DESC, id DESC);
+
+-- GET /payments
+CREATE INDEX IF NOT EXISTS ix_payment_paid_at_id
+    ON joyas.payment (paid_at DESC, id DESC);
+
+-- GET /payments?sale_id=
+CREATE INDEX IF NOT EXISTS ix_payment_sale_paid_at_id
+    ON joyas.payment (sale_id, paid_at DESC, id DESC);
@@ -0,0 +1,30 @@
+-- Búsqueda de clientes con índices trigram (pg_trgm).
+-- Los ILIKE '%term%' existentes (/customers?search=, /dashboard/sales-statements?search=)
+-- pasan a usar los índices GIN sobre las columnas; GET /customers/search usa además
+-- una forma normalizada (minúsculas, sin acentos) con ranking por similitud.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE EXTENSION IF NOT EXISTS unaccent;
+
+-- unaccent() no es IMMUTABLE (depende del search_path): se envuelve fijando el
+-- diccionario para poder usarla en índices de expresión.
+CREATE OR REPLACE FUNCTION joyas.search_norm(value text)
+RETURNS text
+LANGUAGE sql
+IMMUTABLE PARALLEL SAFE STRICT
+AS $$
+    SELECT lower(public.unaccent('public.unaccent'::regdictionary, value))
+$$;
+
+-- ILIKE sobre el nombre sin normalizar
+CREATE INDEX IF NOT EXISTS ix_customer_full_name_trgm
+    ON joyas.customer USING gin (full_name gin_trgm_ops);
+
+-- Búsqueda rankeada (GET /customers/search)
+CREATE INDEX IF NOT EXISTS ix_customer_full_name_norm_trgm
+    ON joyas.customer USING gin (joyas.search_norm(full_name) gin_trgm_ops);
+-- Teléfono solo con dígitos: "0981 123-456" coincide con "123456"
+CREATE INDEX IF NOT EXISTS ix_customer_phone_digits_trgm
+    ON joyas.customer USING gin (regexp_replace(phone, '\D', '', 'g') gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS ix_sale_item_product_code_norm_trgm
+    ON joyas.sale_item USING gin (joyas.search_norm(product_code) gin_trgm_ops);
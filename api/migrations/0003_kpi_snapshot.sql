@@ -0,0 +1,190 @@
+-- Snapshot de KPIs del dashboard (una sola fila) mantenido incrementalmente.
+-- GET /kpis y /dashboard/kpis leen esta fila en lugar de agregar v_kpis y
+-- v_profit_kpis sobre todas las ventas, items y pagos.
+-- Los triggers son por sentencia (con tablas de transición): un INSERT/DELETE de
+-- muchas filas hace un solo ajuste.
+-- Verificar contra las vistas con: python manage.py kpi-check
+
+CREATE TABLE IF NOT EXISTS joyas.kpi_snapshot (
+    id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    total_joyas_vendidas BIGINT NOT NULL DEFAULT 0,
+    total_ya_pagado NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    dinero_faltante NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    total_vendido NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    dinero_a_entregar NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    ganancia_40 NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Vendido/pagado por venta según los deltas ya aplicados al snapshot. El saldo
+-- pendiente GREATEST(vendido - pagado, 0) no es aditivo: para ajustarlo hace falta
+-- el estado anterior de cada venta, y no se puede leer de las tablas porque en un
+-- DELETE en cascada los triggers de items y pagos corren cuando ambos ya se borraron.
+CREATE TABLE IF NOT EXISTS joyas.kpi_sale_balance (
+    sale_id BIGINT PRIMARY KEY,
+    sold NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    paid NUMERIC(14, 2) NOT NULL DEFAULT 0
+);
+
+-- Recalcula todo desde las tablas base (backfill y corrección de desvíos)
+CREATE OR REPLACE FUNCTION joyas.kpi_snapshot_rebuild()
+RETURNS void
+LANGUAGE sql
+AS $$
+    DELETE FROM joyas.kpi_sale_balance;
+
+    INSERT INTO joyas.kpi_sale_balance (sale_id, sold, paid)
+    SELECT s.id,
+           COALESCE((SELECT SUM(i.quantity * i.unit_price) FROM joyas.sale_item i WHERE i.sale_id = s.id), 0),
+           COALESCE((SELECT SUM(p.amount) FROM joyas.payment p WHERE p.sale_id = s.id), 0)
+    FROM joyas.sale s;
+
+    INSERT INTO joyas.kpi_snapshot AS k (
+        id, total_joyas_vendidas, total_ya_pagado, dinero_faltante,
+        total_vendido, dinero_a_entregar, ganancia_40, updated_at
+    )
+    SELECT 1,
+           (SELECT COALESCE(SUM(quantity), 0) FROM joyas.sale_item),
+           COALESCE(SUM(b.paid), 0),
+           COALESCE(SUM(GREATEST(b.sold - b.paid, 0)), 0),
+           COALESCE(SUM(b.sold), 0),
+           COALESCE(SUM(b.sold), 0) - round(COALESCE(SUM(b.sold), 0) * 0.40, 2),
+           round(COALESCE(SUM(b.sold), 0) * 0.40, 2),
+           now()
+    FROM joyas.kpi_sale_balance b
+    ON CONFLICT (id) DO UPDATE SET
+        total_joyas_vendidas = EXCLUDED.total_joyas_vendidas,
+        total_ya_pagado = EXCLUDED.total_ya_pagado,
+        dinero_faltante = EXCLUDED.dinero_faltante,
+        total_vendido = EXCLUDED.total_vendido,
+        dinero_a_entregar = EXCLUDED.dinero_a_entregar,
+        ganancia_40 = EXCLUDED.ganancia_40,
+        updated_at = EXCLUDED.updated_at;
+$$;
+
+-- Aplica deltas por venta: actualiza kpi_sale_balance y ajusta el snapshot con la
+-- diferencia de saldo pendiente entre el estado anterior y el nuevo de cada venta.
+CREATE OR REPLACE FUNCTION joyas.kpi_snapshot_apply(
+    p_sale_ids BIGINT[],
+    p_quantity BIGINT[],
+    p_sold NUMERIC[],
+    p_paid NUMERIC[]
+)
+RETURNS void
+LANGUAGE sql
+AS $$
+    WITH d AS (
+        SELECT u.sale_id, SUM(u.q) AS q, SUM(u.s) AS s, SUM(u.p) AS p
+        FROM unnest(p_sale_ids, p_quantity, p_sold, p_paid) AS u(sale_id, q, s, p)
+        GROUP BY u.sale_id
+    ),
+    balance AS (
+        INSERT INTO joyas.kpi_sale_balance AS b (sale_id, sold, paid)
+        SELECT sale_id, s, p FROM d
+        ON CONFLICT (sale_id) DO UPDATE SET
+            sold = b.sold + EXCLUDED.sold,
+            paid = b.paid + EXCLUDED.paid
+        RETURNING b.sale_id, b.sold, b.paid
+    ),
+    t AS (
+        SELECT COALESCE(SUM(d.q), 0) AS q,
+               COALESCE(SUM(d.s), 0) AS s,
+               COALESCE(SUM(d.p), 0) AS p,
+               COALESCE(SUM(GREATEST(b.sold - b.paid, 0)
+                            - GREATEST((b.sold - d.s) - (b.paid - d.p), 0)), 0) AS r
+        FROM d
+        JOIN balance b ON b.sale_id = d.sale_id
+    )
+    UPDATE joyas.kpi_snapshot k SET
+        total_joyas_vendidas = k.total_joyas_vendidas + t.q,
+        total_ya_pagado = k.total_ya_pagado + t.p,
+        dinero_faltante = k.dinero_faltante + t.r,
+        total_vendido = k.total_vendido + t.s,
+        dinero_a_entregar = (k.total_vendido + t.s) - round((k.total_vendido + t.s) * 0.40, 2),
+        ganancia_40 = round((k.total_vendido + t.s) * 0.40, 2),
+        updated_at = now()
+    FROM t
+    WHERE k.id = 1 AND (t.q <> 0 OR t.s <> 0 OR t.p <> 0 OR t.r <> 0);
+
+    -- Ventas sin items ni pagos (p. ej. eliminadas) no necesitan fila
+    DELETE FROM joyas.kpi_sale_balance
+    WHERE sale_id = ANY (p_sale_ids) AND sold = 0 AND paid = 0;
+$$;
+
+CREATE OR REPLACE FUNCTION joyas.kpi_snapshot_sale_item_trg()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM joyas.kpi_snapshot_apply(array_agg(sale_id), array_agg(quantity::bigint),
+                                         array_agg(quantity * unit_price), array_agg(0::numeric))
+        FROM new_rows;
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM joyas.kpi_snapshot_apply(array_agg(sale_id), array_agg(-quantity::bigint),
+                                         array_agg(-(quantity * unit_price)), array_agg(0::numeric))
+        FROM old_rows;
+    ELSE
+        PERFORM joyas.kpi_snapshot_apply(array_agg(x.sale_id), array_agg(x.q), array_agg(x.s), array_agg(0::numeric))
+        FROM (
+            SELECT sale_id, quantity::bigint AS q, quantity * unit_price AS s FROM new_rows
+            UNION ALL
+            SELECT sale_id, -quantity::bigint, -(quantity * unit_price) FROM old_rows
+        ) x;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION joyas.kpi_snapshot_payment_trg()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM joyas.kpi_snapshot_apply(array_agg(sale_id), array_agg(0::bigint),
+                                         array_agg(0::numeric), array_agg(amount))
+        FROM new_rows;
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM joyas.kpi_snapshot_apply(array_agg(sale_id), array_agg(0::bigint),
+                                         array_agg(0::numeric), array_agg(-amount))
+        FROM old_rows;
+    ELSE
+        PERFORM joyas.kpi_snapshot_apply(array_agg(x.sale_id), array_agg(0::bigint), array_agg(0::numeric), array_agg(x.p))
+        FROM (
+            SELECT sale_id, amount AS p FROM new_rows
+            UNION ALL
+            SELECT sale_id, -amount FROM old_rows
+        ) x;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS kpi_snapshot_sale_item_ins ON joyas.sale_item;
+DROP TRIGGER IF EXISTS kpi_snapshot_sale_item_upd ON joyas.sale_item;
+DROP TRIGGER IF EXISTS kpi_snapshot_sale_item_del ON joyas.sale_item;
+CREATE TRIGGER kpi_snapshot_sale_item_ins AFTER INSERT ON joyas.sale_item
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION joyas.kpi_snapshot_sale_item_trg();
+CREATE TRIGGER kpi_snapshot_sale_item_upd AFTER UPDATE ON joyas.sale_item
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION joyas.kpi_snapshot_sale_item_trg();
+CREATE TRIGGER kpi_snapshot_sale_item_del AFTER DELETE ON joyas.sale_item
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION joyas.kpi_snapshot_sale_item_trg();
+
+DROP TRIGGER IF EXISTS kpi_snapshot_payment_ins ON joyas.payment;
+DROP TRIGGER IF EXISTS kpi_snapshot_payment_upd ON joyas.payment;
+DROP TRIGGER IF EXISTS kpi_snapshot_payment_del ON joyas.payment;
+CREATE TRIGGER kpi_snapshot_payment_ins AFTER INSERT ON joyas.payment
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION joyas.kpi_snapshot_payment_trg();
+CREATE TRIGGER kpi_snapshot_payment_upd AFTER UPDATE ON joyas.payment
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION joyas.kpi_snapshot_payment_trg();
+CREATE TRIGGER kpi_snapshot_payment_del AFTER DELETE ON joyas.payment
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION joyas.kpi_snapshot_payment_trg();
+
+SELECT joyas.kpi_snapshot_rebuild();
@@ -0,0 +1,155 @@
+-- Rollup mes × cliente para GET /history/monthly, mantenido incrementalmente.
+-- Reemplaza el agregado de v_history_month_customer (que recorre todo el historial
+-- en cada request) por una tabla indexada por mes.
+-- Verificar contra la vista con: python manage.py history-check
+
+CREATE TABLE IF NOT EXISTS joyas.history_month_customer (
+    month DATE NOT NULL,
+    customer_id BIGINT NOT NULL,
+    sales_count INTEGER NOT NULL DEFAULT 0,
+    total_vendido NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (month, customer_id)
+);
+
+-- Recalcula la tabla completa desde sale/sale_item (backfill y corrección de desvíos)
+CREATE OR REPLACE FUNCTION joyas.history_month_rebuild()
+RETURNS void
+LANGUAGE sql
+AS $$
+    DELETE FROM joyas.history_month_customer;
+
+    INSERT INTO joyas.history_month_customer (month, customer_id, sales_count, total_vendido)
+    SELECT date_trunc('month', s.purchase_date)::date, s.customer_id, COUNT(*),
+           COALESCE(SUM(t.total), 0)
+    FROM joyas.sale s
+    LEFT JOIN (
+        SELECT sale_id, SUM(quantity * unit_price) AS total
+        FROM joyas.sale_item
+        GROUP BY sale_id
+    ) t ON t.sale_id = s.id
+    GROUP BY 1, 2;
+$$;
+
+-- Suma deltas a (mes, cliente) y borra las filas que quedan sin ventas
+CREATE OR REPLACE FUNCTION joyas.history_month_apply(
+    p_month DATE[],
+    p_customer_ids BIGINT[],
+    p_sales_count INTEGER[],
+    p_total NUMERIC[]
+)
+RETURNS void
+LANGUAGE sql
+AS $$
+    INSERT INTO joyas.history_month_customer AS h (month, customer_id, sales_count, total_vendido)
+    SELECT u.month, u.customer_id, SUM(u.n), SUM(u.total)
+    FROM unnest(p_month, p_customer_ids, p_sales_count, p_total) AS u(month, customer_id, n, total)
+    GROUP BY u.month, u.customer_id
+    ON CONFLICT (month, customer_id) DO UPDATE SET
+        sales_count = h.sales_count + EXCLUDED.sales_count,
+        total_vendido = h.total_vendido + EXCLUDED.total_vendido;
+
+    DELETE FROM joyas.history_month_customer h
+    USING unnest(p_month, p_customer_ids) AS u(month, customer_id)
+    WHERE h.month = u.month AND h.customer_id = u.customer_id AND h.sales_count <= 0;
+$$;
+
+-- Ventas: alta, baja y cambio de mes o cliente. La baja es BEFORE DELETE para
+-- descontar el total de sus items mientras todavía existen; los items borrados
+-- después (en cascada) ya no encuentran la venta y no se descuentan dos veces.
+CREATE OR REPLACE FUNCTION joyas.history_month_sale_trg()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_total NUMERIC;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM joyas.history_month_apply(
+            ARRAY[date_trunc('month', NEW.purchase_date)::date], ARRAY[NEW.customer_id], ARRAY[1], ARRAY[0::numeric]
+        );
+        RETURN NULL;
+    END IF;
+
+    SELECT COALESCE(SUM(quantity * unit_price), 0) INTO v_total
+    FROM joyas.sale_item
+    WHERE sale_id = OLD.id;
+
+    IF TG_OP = 'DELETE' THEN
+        PERFORM joyas.history_month_apply(
+            ARRAY[date_trunc('month', OLD.purchase_date)::date], ARRAY[OLD.customer_id], ARRAY[-1], ARRAY[-v_total]
+        );
+        RETURN OLD;
+    END IF;
+
+    -- UPDATE de purchase_date o customer_id: mover la venta de (mes, cliente)
+    PERFORM joyas.history_month_apply(
+        ARRAY[date_trunc('month', OLD.purchase_date)::date, date_trunc('month', NEW.purchase_date)::date],
+        ARRAY[OLD.customer_id, NEW.customer_id],
+        ARRAY[-1, 1],
+        ARRAY[-v_total, v_total]
+    );
+    RETURN NULL;
+END;
+$$;
+
+-- Items: por sentencia, con el mes y cliente de la venta actual
+CREATE OR REPLACE FUNCTION joyas.history_month_sale_item_trg()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM joyas.history_month_apply(
+            array_agg(date_trunc('month', s.purchase_date)::date), array_agg(s.customer_id),
+            array_agg(0), array_agg(r.quantity * r.unit_price)
+        )
+        FROM new_rows r JOIN joyas.sale s ON s.id = r.sale_id;
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM joyas.history_month_apply(
+            array_agg(date_trunc('month', s.purchase_date)::date), array_agg(s.customer_id),
+            array_agg(0), array_agg(-(r.quantity * r.unit_price))
+        )
+        FROM old_rows r JOIN joyas.sale s ON s.id = r.sale_id;
+    ELSE
+        PERFORM joyas.history_month_apply(
+            array_agg(date_trunc('month', s.purchase_date)::date), array_agg(s.customer_id),
+            array_agg(0), array_agg(x.total)
+        )
+        FROM (
+            SELECT sale_id, quantity * unit_price AS total FROM new_rows
+            UNION ALL
+            SELECT sale_id, -(quantity * unit_price) FROM old_rows
+        ) x
+        JOIN joyas.sale s ON s.id = x.sale_id;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS history_month_sale_ins ON joyas.sale;
+DROP TRIGGER IF EXISTS history_month_sale_upd ON joyas.sale;
+DROP TRIGGER IF EXISTS history_month_sale_del ON joyas.sale;
+CREATE TRIGGER history_month_sale_ins AFTER INSERT ON joyas.sale
+    FOR EACH ROW EXECUTE FUNCTION joyas.history_month_sale_trg();
+CREATE TRIGGER history_month_sale_upd AFTER UPDATE OF purchase_date, customer_id ON joyas.sale
+    FOR EACH ROW
+    WHEN (date_trunc('month', OLD.purchase_date) IS DISTINCT FROM date_trunc('month', NEW.purchase_date)
+          OR OLD.customer_id IS DISTINCT FROM NEW.customer_id)
+    EXECUTE FUNCTION joyas.history_month_sale_trg();
+CREATE TRIGGER history_month_sale_del BEFORE DELETE ON joyas.sale
+    FOR EACH ROW EXECUTE FUNCTION joyas.history_month_sale_trg();
+
+DROP TRIGGER IF EXISTS history_month_sale_item_ins ON joyas.sale_item;
+DROP TRIGGER IF EXISTS history_month_sale_item_upd ON joyas.sale_item;
+DROP TRIGGER IF EXISTS history_month_sale_item_del ON joyas.sale_item;
+CREATE TRIGGER history_month_sale_item_ins AFTER INSERT ON joyas.sale_item
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION joyas.history_month_sale_item_trg();
+CREATE TRIGGER history_month_sale_item_upd AFTER UPDATE ON joyas.sale_item
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION joyas.history_month_sale_item_trg();
+CREATE TRIGGER history_month_sale_item_del AFTER DELETE ON joyas.sale_item
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION joyas.history_month_sale_item_trg();
+
+SELECT joyas.history_month_rebuild();
@@ -0,0 +1,22 @@
+-- Claves de idempotencia de POST /sales, POST /payments y de las operaciones
+-- de POST /sync/batch. La clave se reclama en la misma transacción que la
+-- escritura, junto con la respuesta: un reintento con la misma clave devuelve
+-- la respuesta guardada sin volver a insertar.
+-- Las claves vencidas se borran con: python manage.py purge-idempotency-keys
+
+CREATE TABLE IF NOT EXISTS joyas.idempotency_key (
+    user_id BIGINT NOT NULL,
+    key VARCHAR(255) NOT NULL,
+    -- Endpoint u operación que usó la clave (p. ej. "POST /sales", "sync:create_sale")
+    scope VARCHAR(50) NOT NULL,
+    -- sha256 del cuerpo normalizado: la misma clave con otro contenido es un error
+    request_hash CHAR(64) NOT NULL,
+    status_code INTEGER NOT NULL,
+    response JSONB NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    expires_at TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (user_id, key)
+);
+
+CREATE INDEX IF NOT EXISTS idx_idempotency_key_expires_at
+    ON joyas.idempotency_key (expires_at);
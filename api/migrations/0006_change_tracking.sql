@@ -0,0 +1,113 @@
+-- Seguimiento de cambios para GET /changes (sync incremental de la PWA).
+-- Cada fila de customer, sale, sale_item y payment guarda cuándo cambió
+-- (updated_at) y en qué transacción (change_xid). Los borrados quedan en
+-- joyas.tombstone. El cursor de /changes es un xid: todas las transacciones
+-- anteriores al xmin del snapshot ya terminaron, así que un cambio que hace
+-- commit tarde no se saltea (con timestamps sí podría).
+-- Requerida por los modelos (columna updated_at).
+
+ALTER TABLE joyas.customer ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ;
+ALTER TABLE joyas.sale ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ;
+ALTER TABLE joyas.sale_item ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ;
+ALTER TABLE joyas.payment ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ;
+
+ALTER TABLE joyas.customer ADD COLUMN IF NOT EXISTS change_xid XID8;
+ALTER TABLE joyas.sale ADD COLUMN IF NOT EXISTS change_xid XID8;
+ALTER TABLE joyas.sale_item ADD COLUMN IF NOT EXISTS change_xid XID8;
+ALTER TABLE joyas.payment ADD COLUMN IF NOT EXISTS change_xid XID8;
+
+-- Backfill: las filas existentes quedan como cambiadas en esta transacción
+UPDATE joyas.customer SET updated_at = created_at, change_xid = pg_current_xact_id() WHERE updated_at IS NULL;
+UPDATE joyas.sale SET updated_at = created_at, change_xid = pg_current_xact_id() WHERE updated_at IS NULL;
+UPDATE joyas.sale_item SET updated_at = created_at, change_xid = pg_current_xact_id() WHERE updated_at IS NULL;
+UPDATE joyas.payment SET updated_at = created_at, change_xid = pg_current_xact_id() WHERE updated_at IS NULL;
+
+ALTER TABLE joyas.customer
+    ALTER COLUMN updated_at SET DEFAULT now(), ALTER COLUMN updated_at SET NOT NULL,
+    ALTER COLUMN change_xid SET DEFAULT pg_current_xact_id(), ALTER COLUMN change_xid SET NOT NULL;
+ALTER TABLE joyas.sale
+    ALTER COLUMN updated_at SET DEFAULT now(), ALTER COLUMN updated_at SET NOT NULL,
+    ALTER COLUMN change_xid SET DEFAULT pg_current_xact_id(), ALTER COLUMN change_xid SET NOT NULL;
+ALTER TABLE joyas.sale_item
+    ALTER COLUMN updated_at SET DEFAULT now(), ALTER COLUMN updated_at SET NOT NULL,
+    ALTER COLUMN change_xid SET DEFAULT pg_current_xact_id(), ALTER COLUMN change_xid SET NOT NULL;
+ALTER TABLE joyas.payment
+    ALTER COLUMN updated_at SET DEFAULT now(), ALTER COLUMN updated_at SET NOT NULL,
+    ALTER COLUMN change_xid SET DEFAULT pg_current_xact_id(), ALTER COLUMN change_xid SET NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_customer_change_xid ON joyas.customer (change_xid, id);
+CREATE INDEX IF NOT EXISTS idx_sale_change_xid ON joyas.sale (change_xid, id);
+CREATE INDEX IF NOT EXISTS idx_sale_item_change_xid ON joyas.sale_item (change_xid, id);
+CREATE INDEX IF NOT EXISTS idx_payment_change_xid ON joyas.payment (change_xid, id);
+
+-- UPDATE: marcar la fila como cambiada (el INSERT usa los defaults)
+CREATE OR REPLACE FUNCTION joyas.touch_row()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.updated_at := now();
+    NEW.change_xid := pg_current_xact_id();
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS touch_customer ON joyas.customer;
+DROP TRIGGER IF EXISTS touch_sale ON joyas.sale;
+DROP TRIGGER IF EXISTS touch_sale_item ON joyas.sale_item;
+DROP TRIGGER IF EXISTS touch_payment ON joyas.payment;
+CREATE TRIGGER touch_customer BEFORE UPDATE ON joyas.customer
+    FOR EACH ROW EXECUTE FUNCTION joyas.touch_row();
+CREATE TRIGGER touch_sale BEFORE UPDATE ON joyas.sale
+    FOR EACH ROW EXECUTE FUNCTION joyas.touch_row();
+CREATE TRIGGER touch_sale_item BEFORE UPDATE ON joyas.sale_item
+    FOR EACH ROW EXECUTE FUNCTION joyas.touch_row();
+CREATE TRIGGER touch_payment BEFORE UPDATE ON joyas.payment
+    FOR EACH ROW EXECUTE FUNCTION joyas.touch_row();
+
+-- Registro de borrados (entity = nombre de la tabla)
+CREATE TABLE IF NOT EXISTS joyas.tombstone (
+    id BIGSERIAL PRIMARY KEY,
+    entity VARCHAR(30) NOT NULL,
+    entity_id BIGINT NOT NULL,
+    deleted_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    change_xid XID8 NOT NULL DEFAULT pg_current_xact_id()
+);
+
+CREATE INDEX IF NOT EXISTS idx_tombstone_change_xid ON joyas.tombstone (change_xid, id);
+CREATE INDEX IF NOT EXISTS idx_tombstone_deleted_at ON joyas.tombstone (deleted_at);
+
+-- Cursores anteriores a este xid ya no tienen sus tombstones (ver manage.py purge-tombstones)
+CREATE TABLE IF NOT EXISTS joyas.tombstone_horizon (
+    id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    purged_before_xid XID8 NOT NULL DEFAULT '0'
+);
+INSERT INTO joyas.tombstone_horizon (id) VALUES (1) ON CONFLICT (id) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION joyas.tombstone_trg()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    INSERT INTO joyas.tombstone (entity, entity_id)
+    SELECT TG_TABLE_NAME, id FROM old_rows;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS tombstone_customer ON joyas.customer;
+DROP TRIGGER IF EXISTS tombstone_sale ON joyas.sale;
+DROP TRIGGER IF EXISTS tombstone_sale_item ON joyas.sale_item;
+DROP TRIGGER IF EXISTS tombstone_payment ON joyas.payment;
+CREATE TRIGGER tombstone_customer AFTER DELETE ON joyas.customer
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION joyas.tombstone_trg();
+CREATE TRIGGER tombstone_sale AFTER DELETE ON joyas.sale
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION joyas.tombstone_trg();
+CREATE TRIGGER tombstone_sale_item AFTER DELETE ON joyas.sale_item
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION joyas.tombstone_trg();
+CREATE TRIGGER tombstone_payment AFTER DELETE ON joyas.payment
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION joyas.tombstone_trg();
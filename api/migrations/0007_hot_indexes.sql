@@ -0,0 +1,10 @@
+-- Índice para el predicado más usado sin índice: los items de una venta.
+-- Lo usan GET /sales/{id}/full y /sales/{id}/items, el saldo de una venta en
+-- v_sale_statement (el filtro por venta llega al agregado de items), los
+-- triggers de KPIs e historial y la edición de items en PUT /sales/{id}.
+-- sale(customer_id, purchase_date) y payment(sale_id, paid_at) ya están en 0001
+-- y los trigram de búsqueda en 0002.
+-- Verificar los planes con benchmarks/plan_check.py.
+
+CREATE INDEX IF NOT EXISTS ix_sale_item_sale_id
+    ON joyas.sale_item (sale_id);
@@ -0,0 +1,158 @@
+-- Saldo de cada venta mantenido en joyas.sale: sale_total (suma de items),
+-- paid_total (suma de pagos) y status (PAGADO/PARCIAL/PENDIENTE, columna
+-- generada a partir de los dos). GET /sales, /sales/{id}/statement,
+-- /sales/{id}/full y /dashboard/sales-statements los leen de la venta en lugar
+-- de agregar items y pagos con v_sale_statement / v_sales_active, y el filtro
+-- por estado usa un índice.
+-- Los triggers son por sentencia, como los de 0003: corren en la misma
+-- transacción que la escritura (POST /sales, /payments, PUT y DELETE
+-- /sales/{id}, /sync/batch o SQL a mano).
+-- Obligatoria: los modelos usan estas columnas.
+-- Verificar contra v_sale_statement con: python manage.py balance-check
+
+ALTER TABLE joyas.sale
+    ADD COLUMN IF NOT EXISTS sale_total NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS paid_total NUMERIC(14, 2) NOT NULL DEFAULT 0;
+
+-- Misma regla que v_sale_statement.account_status
+ALTER TABLE joyas.sale
+    ADD COLUMN IF NOT EXISTS status TEXT GENERATED ALWAYS AS (
+        CASE WHEN sale_total > 0 AND paid_total >= sale_total THEN 'PAGADO'
+             WHEN paid_total > 0 THEN 'PARCIAL'
+             ELSE 'PENDIENTE' END
+    ) STORED;
+
+-- GET /sales?status_filter= y /dashboard/sales-statements?status_filter=
+-- (keyset por fecha DESC, id DESC dentro de cada estado)
+CREATE INDEX IF NOT EXISTS ix_sale_status_purchase_date_id
+    ON joyas.sale (status, purchase_date DESC, id DESC);
+
+-- Recalcula los totales desde sale_item y payment y corrige solo las ventas
+-- que difieren (backfill y corrección de desvíos); devuelve cuántas corrigió.
+-- Bloquea las escrituras de items y pagos mientras tanto: un pago que entrara
+-- durante el recálculo quedaría pisado por el total viejo.
+CREATE OR REPLACE FUNCTION joyas.sale_balance_rebuild()
+RETURNS bigint
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_fixed bigint;
+BEGIN
+    LOCK TABLE joyas.sale_item, joyas.payment IN SHARE MODE;
+
+    UPDATE joyas.sale s SET
+        sale_total = t.sale_total,
+        paid_total = t.paid_total
+    FROM (
+        SELECT s2.id, COALESCE(i.total, 0) AS sale_total, COALESCE(p.total, 0) AS paid_total
+        FROM joyas.sale s2
+        LEFT JOIN (
+            SELECT sale_id, SUM(quantity * unit_price) AS total FROM joyas.sale_item GROUP BY sale_id
+        ) i ON i.sale_id = s2.id
+        LEFT JOIN (
+            SELECT sale_id, SUM(amount) AS total FROM joyas.payment GROUP BY sale_id
+        ) p ON p.sale_id = s2.id
+    ) t
+    WHERE t.id = s.id AND (s.sale_total <> t.sale_total OR s.paid_total <> t.paid_total);
+
+    GET DIAGNOSTICS v_fixed = ROW_COUNT;
+    RETURN v_fixed;
+END;
+$$;
+
+-- Suma deltas a los totales de cada venta. Se suman en vez de recalcular con
+-- SUM: si dos pagos a la misma venta llegan a la vez, el UPDATE del segundo
+-- espera al primero y suma sobre su resultado (un SUM leído antes lo pisaría).
+-- En un DELETE en cascada la venta ya no existe y no hay nada que actualizar.
+CREATE OR REPLACE FUNCTION joyas.sale_balance_apply(
+    p_sale_ids BIGINT[],
+    p_sold NUMERIC[],
+    p_paid NUMERIC[]
+)
+RETURNS void
+LANGUAGE sql
+AS $$
+    UPDATE joyas.sale s SET
+        sale_total = s.sale_total + d.sold,
+        paid_total = s.paid_total + d.paid
+    FROM (
+        SELECT u.sale_id, SUM(u.sold) AS sold, SUM(u.paid) AS paid
+        FROM unnest(p_sale_ids, p_sold, p_paid) AS u(sale_id, sold, paid)
+        GROUP BY u.sale_id
+    ) d
+    WHERE s.id = d.sale_id AND (d.sold <> 0 OR d.paid <> 0);
+$$;
+
+CREATE OR REPLACE FUNCTION joyas.sale_balance_sale_item_trg()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM joyas.sale_balance_apply(array_agg(sale_id), array_agg(quantity * unit_price), array_agg(0::numeric))
+        FROM new_rows;
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM joyas.sale_balance_apply(array_agg(sale_id), array_agg(-(quantity * unit_price)), array_agg(0::numeric))
+        FROM old_rows;
+    ELSE
+        PERFORM joyas.sale_balance_apply(array_agg(x.sale_id), array_agg(x.s), array_agg(0::numeric))
+        FROM (
+            SELECT sale_id, quantity * unit_price AS s FROM new_rows
+            UNION ALL
+            SELECT sale_id, -(quantity * unit_price) FROM old_rows
+        ) x;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION joyas.sale_balance_payment_trg()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM joyas.sale_balance_apply(array_agg(sale_id), array_agg(0::numeric), array_agg(amount))
+        FROM new_rows;
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM joyas.sale_balance_apply(array_agg(sale_id), array_agg(0::numeric), array_agg(-amount))
+        FROM old_rows;
+    ELSE
+        PERFORM joyas.sale_balance_apply(array_agg(x.sale_id), array_agg(0::numeric), array_agg(x.p))
+        FROM (
+            SELECT sale_id, amount AS p FROM new_rows
+            UNION ALL
+            SELECT sale_id, -amount FROM old_rows
+        ) x;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS sale_balance_sale_item_ins ON joyas.sale_item;
+DROP TRIGGER IF EXISTS sale_balance_sale_item_upd ON joyas.sale_item;
+DROP TRIGGER IF EXISTS sale_balance_sale_item_del ON joyas.sale_item;
+CREATE TRIGGER sale_balance_sale_item_ins AFTER INSERT ON joyas.sale_item
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION joyas.sale_balance_sale_item_trg();
+CREATE TRIGGER sale_balance_sale_item_upd AFTER UPDATE ON joyas.sale_item
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION joyas.sale_balance_sale_item_trg();
+CREATE TRIGGER sale_balance_sale_item_del AFTER DELETE ON joyas.sale_item
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION joyas.sale_balance_sale_item_trg();
+
+DROP TRIGGER IF EXISTS sale_balance_payment_ins ON joyas.payment;
+DROP TRIGGER IF EXISTS sale_balance_payment_upd ON joyas.payment;
+DROP TRIGGER IF EXISTS sale_balance_payment_del ON joyas.payment;
+CREATE TRIGGER sale_balance_payment_ins AFTER INSERT ON joyas.payment
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION joyas.sale_balance_payment_trg();
+CREATE TRIGGER sale_balance_payment_upd AFTER UPDATE ON joyas.payment
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION joyas.sale_balance_payment_trg();
+CREATE TRIGGER sale_balance_payment_del AFTER DELETE ON joyas.payment
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION joyas.sale_balance_payment_trg();
+
+SELECT joyas.sale_balance_rebuild();
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, BigInteger, String, Text, Integer, Numeric, Date, DateTime, ForeignKey
+from sqlalchemy import Column, BigInteger, String, Text, Integer, Numeric, Date, DateTime, ForeignKey, FetchedValue
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -22,6 +22,8 @@ class Customer(Base):
     full_name = Column(String(120), nullable=False)
     phone = Column(String(30))
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    # Lo actualiza un trigger en cada UPDATE (migrations/0006_change_tracking.sql)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), server_onupdate=FetchedValue(), nullable=False)
 
 
 class Sale(Base):
@@ -36,8 +38,17 @@ class Sale(Base):
     delivery_address = Column(Text, nullable=False)
     notes = Column(Text)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    # Lo actualiza un trigger en cada UPDATE (migrations/0006_change_tracking.sql)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), server_onupdate=FetchedValue(), nullable=False)
+    # Saldo mantenido por triggers sobre sale_item y payment; status es una
+    # columna generada a partir de los totales (migrations/0008_sale_balance.sql)
+    sale_total = Column(Numeric(14, 2), server_default="0", server_onupdate=FetchedValue(), nullable=False)
+    paid_total = Column(Numeric(14, 2), server_default="0", server_onupdate=FetchedValue(), nullable=False)
+    status = Column(Text, server_default=FetchedValue(), server_onupdate=FetchedValue(), nullable=False)
 
-    customer = relationship("Customer")
+    # Sin lazy loading implícito: cada query debe pedir el cliente con
+    # joinedload/selectinload (evita N+1 al serializar listas de SaleResponse)
+    customer = relationship("Customer", lazy="raise_on_sql")
 
 
 class SaleItem(Base):
@@ -52,6 +63,8 @@ class SaleItem(Base):
     unit_price = Column(Numeric(12, 2), nullable=False)
     photo_url = Column(Text)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    # Lo actualiza un trigger en cada UPDATE (migrations/0006_change_tracking.sql)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), server_onupdate=FetchedValue(), nullable=False)
 
     sale = relationship("Sale")
 
@@ -65,6 +78,7 @@ class Payment(Base):
     paid_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     amount = Column(Numeric(12, 2), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    # Lo actualiza un trigger en cada UPDATE (migrations/0006_change_tracking.sql)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), server_onupdate=FetchedValue(), nullable=False)
 
     sale = relationship("Sale")
-
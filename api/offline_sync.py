@@ -0,0 +1,176 @@
+import json
+from datetime import date, datetime
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import idempotency
+from models import Customer, Payment, Sale, SaleItem
+from schemas import PaymentCreate, SaleCreate, SyncOperation, SyncOperationResult
+
+OPERATION_MODELS = {
+    "create_sale": SaleCreate,
+    "create_payment": PaymentCreate,
+}
+
+
+def _error(index: int, op: SyncOperation, status_code: int, detail) -> SyncOperationResult:
+    return SyncOperationResult(
+        index=index, client_id=op.client_id, type=op.type,
+        status="error", status_code=status_code, detail=detail,
+    )
+
+
+def _ok(index: int, op: SyncOperation, new_id: int, replayed: bool = False) -> SyncOperationResult:
+    return SyncOperationResult(
+        index=index, client_id=op.client_id, type=op.type,
+        status="ok", status_code=200, id=new_id, replayed=replayed,
+    )
+
+
+def _scope(op: SyncOperation) -> str:
+    return f"sync:{op.type}"
+
+
+async def _existing_ids(db: AsyncSession, column, ids: set) -> set:
+    if not ids:
+        return set()
+    result = await db.execute(select(column).where(column.in_(ids)))
+    return set(result.scalars().all())
+
+
+async def apply_sync_batch(
+    db: AsyncSession, operations: list[SyncOperation], user_id: int
+) -> list[SyncOperationResult]:
+    """
+    Valida y aplica un lote de operaciones de la cola offline dentro de la
+    transacción de `db` (no hace commit). Las validaciones, los chequeos de
+    existencia y las idempotency_key se resuelven para todo el lote con una
+    query por tabla, y las inserciones son multi-fila. Una operación inválida
+    no impide aplicar las demás.
+    """
+    results: list = [None] * len(operations)
+    parsed: dict[int, object] = {}
+    hashes: dict[int, str] = {}
+    key_owner: dict[str, int] = {}
+    duplicates: list[tuple[int, int]] = []
+
+    for index, op in enumerate(operations):
+        try:
+            model = OPERATION_MODELS[op.type].model_validate(op.data)
+            if op.idempotency_key is not None:
+                op.idempotency_key = idempotency.validate_key(op.idempotency_key)
+        except ValidationError as e:
+            results[index] = _error(index, op, 422, json.loads(e.json(include_url=False)))
+            continue
+        except HTTPException as e:
+            results[index] = _error(index, op, e.status_code, e.detail)
+            continue
+        if op.type == "create_sale" and not model.items:
+            results[index] = _error(index, op, 422, "La venta debe tener al menos un item")
+            continue
+        if op.idempotency_key is not None:
+            hashes[index] = idempotency.request_hash(model)
+            # La misma clave repetida dentro del lote se resuelve con la primera aparición
+            if op.idempotency_key in key_owner:
+                duplicates.append((index, key_owner[op.idempotency_key]))
+                continue
+            key_owner[op.idempotency_key] = index
+        parsed[index] = model
+
+    # Operaciones ya aplicadas en un envío anterior: responder sin volver a insertar
+    stored = await idempotency.lookup(db, user_id, list(key_owner))
+    for key, index in key_owner.items():
+        if key not in stored:
+            continue
+        op = operations[index]
+        del parsed[index]
+        try:
+            idempotency.check_reuse(stored[key], _scope(op), hashes[index])
+        except HTTPException as e:
+            results[index] = _error(index, op, e.status_code, e.detail)
+            continue
+        results[index] = _ok(index, op, stored[key].response["id"], replayed=True)
+
+    sales = [(index, model) for index, model in parsed.items() if operations[index].type == "create_sale"]
+    payments = [(index, model) for index, model in parsed.items() if operations[index].type == "create_payment"]
+
+    # Chequeos de existencia en bloque
+    customer_ids = await _existing_ids(db, Customer.id, {sale.customer_id for _, sale in sales})
+    sale_ids = await _existing_ids(db, Sale.id, {payment.sale_id for _, payment in payments})
+    valid_sales = []
+    for index, sale in sales:
+        if sale.customer_id in customer_ids:
+            valid_sales.append((index, sale))
+        else:
+            results[index] = _error(index, operations[index], 404, "Cliente no encontrado")
+    valid_payments = []
+    for index, payment in payments:
+        if payment.sale_id in sale_ids:
+            valid_payments.append((index, payment))
+        else:
+            results[index] = _error(index, operations[index], 404, "Venta no encontrada")
+
+    if valid_sales:
+        today = date.today()
+        sale_rows = []
+        for _, sale in valid_sales:
+            row = sale.model_dump(exclude={"items"})
+            row["purchase_date"] = row["purchase_date"] or today
+            sale_rows.append(row)
+        new_sale_ids = (
+            await db.execute(insert(Sale).returning(Sale.id, sort_by_parameter_order=True), sale_rows)
+        ).scalars().all()
+
+        item_rows = [
+            {"sale_id": sale_id, **item.model_dump()}
+            for sale_id, (_, sale) in zip(new_sale_ids, valid_sales)
+            for item in sale.items
+        ]
+        await db.execute(insert(SaleItem), item_rows)
+
+        for sale_id, (index, _) in zip(new_sale_ids, valid_sales):
+            results[index] = _ok(index, operations[index], sale_id)
+
+    if valid_payments:
+        now = datetime.utcnow()
+        payment_rows = []
+        for _, payment in valid_payments:
+            row = payment.model_dump()
+            row["paid_at"] = row["paid_at"] or now
+            payment_rows.append(row)
+        new_payment_ids = (
+            await db.execute(insert(Payment).returning(Payment.id, sort_by_parameter_order=True), payment_rows)
+        ).scalars().all()
+        for payment_id, (index, _) in zip(new_payment_ids, valid_payments):
+            results[index] = _ok(index, operations[index], payment_id)
+
+    # Guardar las claves de lo aplicado, en la misma transacción
+    entries = [
+        (op.idempotency_key, _scope(op), hashes[index], 200, {"id": results[index].id})
+        for index, op in enumerate(operations)
+        if index in parsed and op.idempotency_key is not None and results[index].status == "ok"
+    ]
+    saved = await idempotency.save(db, user_id, entries)
+    if len(saved) < len(entries):
+        # Otro request aplicó alguna de estas claves mientras tanto: el lote se
+        # descarta completo y el reintento responde con lo ya guardado
+        raise HTTPException(
+            status_code=409,
+            detail="Hay otro request en curso con las mismas idempotency_key",
+            headers={"Retry-After": "1"},
+        )
+
+    for index, owner in duplicates:
+        op = operations[index]
+        owner_result = results[owner]
+        if hashes[index] != hashes[owner] or op.type != operations[owner].type:
+            results[index] = _error(index, op, 422, "La idempotency_key ya se usó con otro contenido")
+        elif owner_result.status == "ok":
+            results[index] = _ok(index, op, owner_result.id, replayed=True)
+        else:
+            results[index] = _error(index, op, owner_result.status_code, owner_result.detail)
+
+    return results
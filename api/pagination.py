@@ -0,0 +1,61 @@
+import base64
+import json
+from datetime import date, datetime
+from typing import Callable, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+def encode_cursor(*values) -> str:
+    """Cursor opaco (base64 url-safe) con los valores de orden de la última fila"""
+    raw = json.dumps(
+        [value.isoformat() if isinstance(value, (date, datetime)) else value for value in values],
+        separators=(",", ":"),
+    )
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, *parsers: Callable) -> tuple:
+    """Decodifica un cursor aplicando un parser por columna. Responde 400 si es inválido."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(values, list) or len(values) != len(parsers):
+            raise ValueError("cantidad de valores incorrecta")
+        return tuple(parse(value) for parse, value in zip(parsers, values))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
+async def fetch_page(
+    db: AsyncSession,
+    query,
+    order_columns: tuple,
+    parsers: tuple,
+    page: int,
+    page_size: int,
+    cursor: Optional[str] = None,
+) -> tuple[list, Optional[str]]:
+    """
+    Ejecuta un select() paginado en orden descendente por `order_columns`
+    (columna de fecha + id como desempate).
+    Con cursor usa keyset (WHERE (fecha, id) < cursor), si no OFFSET.
+    Devuelve (filas, next_cursor); next_cursor es None en la última página.
+    """
+    if cursor:
+        query = query.where(tuple_(*order_columns) < tuple_(*decode_cursor(cursor, *parsers)))
+    else:
+        query = query.offset((page - 1) * page_size)
+
+    result = await db.execute(
+        query.order_by(*(column.desc() for column in order_columns)).limit(page_size + 1)
+    )
+    rows = result.scalars().all()
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(*(getattr(rows[-1], column.key) for column in order_columns))
+    return rows, next_cursor
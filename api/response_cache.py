@@ -0,0 +1,103 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Optional
+
+import psycopg
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from cache import TTLCache
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Canal de Postgres por el que los workers se avisan que hubo escrituras
+CHANNEL = "joyas_cache"
+
+# Respuestas de endpoints de solo lectura (KPIs, historial, estados de cuenta).
+# Cada worker tiene su propio cache local; la invalidación llega a todos por NOTIFY.
+response_cache = TTLCache(maxsize=settings.response_cache_max_size, ttl=None)
+
+# Última versión de cada conjunto de tablas que consultó este proceso (ETag de
+# los GET sin If-None-Match, ver conditional.request_version); se vacía junto
+# con el cache de respuestas.
+version_cache = TTLCache(maxsize=64, ttl=None)
+
+_MISSING = object()
+# Se incrementa en cada invalidación: un cálculo que empezó antes de una
+# escritura no se guarda, para no dejar en cache datos ya viejos.
+_generation = 0
+
+
+def cache_key(endpoint: str, params: dict) -> tuple:
+    """Clave del cache a partir del endpoint y sus query params"""
+    return (endpoint, tuple(sorted(params.items())))
+
+
+async def cached_response(
+    endpoint: str,
+    params: dict,
+    compute: Callable[[], Awaitable[Any]],
+    ttl: Optional[float] = -1,
+) -> Any:
+    """
+    Devuelve la respuesta cacheada o la calcula con `compute()` y la guarda.
+    ttl=-1 usa RESPONSE_CACHE_TTL_SECONDS del endpoint; ttl=None no expira.
+    """
+    key = cache_key(endpoint, params)
+    value = response_cache.get(key, _MISSING)
+    if value is not _MISSING:
+        return value
+
+    generation = _generation
+    value = await compute()
+    if ttl == -1:
+        ttl = settings.response_cache_ttl_seconds.get(endpoint, 0)
+    if generation == _generation:
+        response_cache.set(key, value, ttl=ttl)
+    return value
+
+
+def invalidate_local() -> None:
+    """Vacía el cache de este proceso"""
+    global _generation
+    _generation += 1
+    response_cache.clear()
+    version_cache.clear()
+
+
+async def notify_invalidation(db: AsyncSession) -> None:
+    """
+    Encola un NOTIFY en la transacción actual: Postgres lo entrega a los demás
+    workers solo si la transacción hace commit. Llamar antes de `db.commit()`
+    y después del commit `invalidate_local()`.
+    """
+    await db.execute(text("SELECT pg_notify(:channel, '')"), {"channel": CHANNEL})
+
+
+def _listen_dsn() -> str:
+    # psycopg recibe la URL de libpq, sin el "+psycopg" de SQLAlchemy
+    return settings.database_url.strip().replace("postgresql+psycopg://", "postgresql://", 1)
+
+
+async def listen_for_invalidations(retry_seconds: float = 5.0) -> None:
+    """
+    Tarea de fondo: LISTEN en el canal y vacía el cache local con cada NOTIFY.
+    Si se corta la conexión, reconecta y vacía el cache (pudo perder avisos).
+    """
+    while True:
+        try:
+            async with await psycopg.AsyncConnection.connect(_listen_dsn(), autocommit=True) as conn:
+                await conn.execute(f"LISTEN {CHANNEL}")
+                invalidate_local()
+                logger.info("Escuchando invalidaciones de cache en el canal %s", CHANNEL)
+                async for _ in conn.notifies():
+                    invalidate_local()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            invalidate_local()
+            logger.warning(
+                f"LISTEN {CHANNEL} interrumpido ({type(e).__name__}), reintentando en {retry_seconds:g} s"
+            )
+        await asyncio.sleep(retry_seconds)
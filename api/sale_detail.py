@@ -0,0 +1,111 @@
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from balances import SALE_BALANCE_COLUMNS
+from conditional import cacheable_version
+
+# Versión de la venta completa: cambia si cambia la venta, su cliente o
+# cualquiera de sus items/pagos (change_xid de la migración 0006). La
+# cantidad de filas cubre los borrados, que no dejan change_xid en la tabla.
+SALE_VERSION_SQL = text("""
+    SELECT concat_ws('.', s.change_xid, c.change_xid, i.version, p.version) AS version,
+           GREATEST(s.change_xid::text::bigint, c.change_xid::text::bigint, i.max_xid, p.max_xid) AS max_xid,
+           pg_snapshot_xmin(pg_current_snapshot())::text::bigint AS xmin
+    FROM joyas.sale s
+    JOIN joyas.customer c ON c.id = s.customer_id
+    CROSS JOIN LATERAL (
+        SELECT concat_ws('-', max(change_xid), count(*)) AS version, max(change_xid)::text::bigint AS max_xid
+        FROM joyas.sale_item WHERE sale_id = s.id
+    ) i
+    CROSS JOIN LATERAL (
+        SELECT concat_ws('-', max(change_xid), count(*)) AS version, max(change_xid)::text::bigint AS max_xid
+        FROM joyas.payment WHERE sale_id = s.id
+    ) p
+    WHERE s.id = :sale_id
+""")
+
+# Venta, cliente, items, pagos y saldo (columnas de la migración 0008) en una
+# fila; la versión va aparte para poder responder 304 sin armar esto. Los montos
+# van como texto para no perder la escala de NUMERIC al pasar por JSON.
+SALE_FULL_SQL = text(f"""
+    SELECT s.id, s.customer_id, s.purchase_date, s.payment_due_date, s.delivery_date,
+           s.delivery_address, s.notes, s.created_at,
+           c.full_name AS customer_full_name, c.phone AS customer_phone,
+           c.created_at AS customer_created_at,
+           {SALE_BALANCE_COLUMNS},
+           i.items, p.payments
+    FROM joyas.sale s
+    JOIN joyas.customer c ON c.id = s.customer_id
+    CROSS JOIN LATERAL (
+        SELECT COALESCE(json_agg(json_build_object(
+                   'id', id, 'sale_id', sale_id, 'product_code', product_code,
+                   'jewel_type', jewel_type, 'quantity', quantity,
+                   'unit_price', unit_price::text, 'photo_url', photo_url, 'created_at', created_at
+               ) ORDER BY id), '[]') AS items
+        FROM joyas.sale_item WHERE sale_id = s.id
+    ) i
+    CROSS JOIN LATERAL (
+        SELECT COALESCE(json_agg(json_build_object(
+                   'id', id, 'sale_id', sale_id, 'paid_at', paid_at,
+                   'amount', amount::text, 'created_at', created_at
+               ) ORDER BY paid_at DESC, id DESC), '[]') AS payments
+        FROM joyas.payment WHERE sale_id = s.id
+    ) p
+    WHERE s.id = :sale_id
+""")
+
+
+async def get_sale_version(db: AsyncSession, sale_id: int, required: bool = True) -> Optional[str]:
+    """
+    Versión de la venta completa (None si no es confiable). Si la venta no
+    existe: 404, o None con required=False (sin ETag).
+    """
+    row = (await db.execute(SALE_VERSION_SQL, {"sale_id": sale_id})).first()
+    if row is None:
+        if not required:
+            return None
+        raise HTTPException(status_code=404, detail="Venta no encontrada")
+    return cacheable_version(row.version, row.xmin, row.max_xid)
+
+
+async def get_sale_full(db: AsyncSession, sale_id: int) -> Optional[dict]:
+    """Cuerpo de SaleFullResponse o None si la venta no existe"""
+    row = (await db.execute(SALE_FULL_SQL, {"sale_id": sale_id})).first()
+    if row is None:
+        return None
+    body = {
+        "sale": {
+            "id": row.id,
+            "customer_id": row.customer_id,
+            "purchase_date": row.purchase_date,
+            "payment_due_date": row.payment_due_date,
+            "delivery_date": row.delivery_date,
+            "delivery_address": row.delivery_address,
+            "notes": row.notes,
+            "created_at": row.created_at,
+            "customer": {
+                "id": row.customer_id,
+                "full_name": row.customer_full_name,
+                "phone": row.customer_phone,
+                "created_at": row.customer_created_at,
+            },
+        },
+        "items": row.items,
+        "payments": row.payments,
+        "statement": {
+            "sale_id": row.id,
+            "customer_id": row.customer_id,
+            "purchase_date": row.purchase_date,
+            "payment_due_date": row.payment_due_date,
+            "delivery_date": row.delivery_date,
+            "delivery_address": row.delivery_address,
+            "sale_total": row.sale_total,
+            "paid_total": row.paid_total,
+            "remaining": row.remaining,
+            "account_status": row.account_status,
+        },
+    }
+    return body
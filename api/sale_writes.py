@@ -0,0 +1,110 @@
+from datetime import date
+
+from fastapi import HTTPException
+from sqlalchemy import delete, insert, literal, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Customer, Sale, SaleItem
+from schemas import SaleCreate, SaleItemCreate
+
+ITEM_FIELDS = ("product_code", "jewel_type", "quantity", "unit_price", "photo_url")
+
+# Actualiza varios items en una sola sentencia (solo los de la venta indicada)
+UPDATE_ITEMS_SQL = text("""
+    UPDATE joyas.sale_item AS si
+    SET product_code = u.product_code,
+        jewel_type = u.jewel_type,
+        quantity = u.quantity,
+        unit_price = u.unit_price,
+        photo_url = u.photo_url
+    FROM unnest(
+        CAST(:ids AS bigint[]), CAST(:product_codes AS text[]), CAST(:jewel_types AS text[]),
+        CAST(:quantities AS int[]), CAST(:unit_prices AS numeric[]), CAST(:photo_urls AS text[])
+    ) AS u(id, product_code, jewel_type, quantity, unit_price, photo_url)
+    WHERE si.id = u.id AND si.sale_id = :sale_id
+""")
+
+
+def _item_row(item: SaleItemCreate) -> dict:
+    return item.model_dump(include=set(ITEM_FIELDS))
+
+
+async def insert_sale(db: AsyncSession, sale: SaleCreate):
+    """
+    Inserta la venta con INSERT ... SELECT desde el cliente: si el cliente no
+    existe no se inserta nada y devuelve None (sin SELECT previo).
+    Devuelve la fila insertada.
+    """
+    values = sale.model_dump(exclude={"items", "customer_id"})
+    values["purchase_date"] = values["purchase_date"] or date.today()
+    stmt = (
+        insert(Sale.__table__)
+        .from_select(
+            ["customer_id", *values],
+            select(
+                Customer.id,
+                *[literal(value, Sale.__table__.c[name].type) for name, value in values.items()]
+            ).where(Customer.id == sale.customer_id),
+        )
+        .returning(*Sale.__table__.c)
+    )
+    return (await db.execute(stmt)).first()
+
+
+async def insert_items(db: AsyncSession, sale_id: int, items: list[SaleItemCreate]) -> list[int]:
+    """Inserta los items en un único INSERT multi-fila; devuelve los ids en orden"""
+    if not items:
+        return []
+    stmt = (
+        insert(SaleItem.__table__)
+        .values([{"sale_id": sale_id, **_item_row(item)} for item in items])
+        .returning(SaleItem.__table__.c.id)
+    )
+    return list((await db.execute(stmt)).scalars().all())
+
+
+async def sync_items(db: AsyncSession, sale_id: int, items: list) -> None:
+    """
+    Deja los items de la venta iguales a `items` tocando solo lo que cambió:
+    los que traen `id` se actualizan si difieren, los que no traen `id` se
+    insertan y los que ya no están se borran. A lo sumo una sentencia por
+    tipo de cambio, sin importar la cantidad de items.
+    """
+    result = await db.execute(
+        select(SaleItem.__table__.c.id, *[SaleItem.__table__.c[name] for name in ITEM_FIELDS])
+        .where(SaleItem.__table__.c.sale_id == sale_id)
+    )
+    current = {row.id: {name: getattr(row, name) for name in ITEM_FIELDS} for row in result}
+
+    new_items = []
+    changed = []
+    kept = set()
+    for idx, item in enumerate(items):
+        item_id = getattr(item, "id", None)
+        if item_id is None:
+            new_items.append(item)
+            continue
+        if item_id not in current or item_id in kept:
+            raise HTTPException(
+                status_code=422,
+                detail=f"Item {idx + 1}: no pertenece a la venta"
+            )
+        kept.add(item_id)
+        row = _item_row(item)
+        if row != current[item_id]:
+            changed.append((item_id, row))
+
+    removed = [item_id for item_id in current if item_id not in kept]
+    if removed:
+        await db.execute(delete(SaleItem.__table__).where(SaleItem.__table__.c.id.in_(removed)))
+    if changed:
+        await db.execute(UPDATE_ITEMS_SQL, {
+            "sale_id": sale_id,
+            "ids": [item_id for item_id, _ in changed],
+            "product_codes": [row["product_code"] for _, row in changed],
+            "jewel_types": [row["jewel_type"] for _, row in changed],
+            "quantities": [row["quantity"] for _, row in changed],
+            "unit_prices": [row["unit_price"] for _, row in changed],
+            "photo_urls": [row["photo_url"] for _, row in changed],
+        })
+    await insert_items(db, sale_id, new_items)
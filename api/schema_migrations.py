@@ -0,0 +1,250 @@
+import hashlib
+import re
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from sqlalchemy import text
+
+# Migraciones SQL numeradas de migrations/ (NNNN_descripcion.sql), aplicadas en
+# orden por `manage.py migrate`. Cada una corre en su propia transacción junto
+# con su registro en joyas.schema_migrations, así que una migración que falla
+# no deja nada a medias. Una migración ya aplicada no se edita: se agrega otra.
+MIGRATIONS_DIR = Path(__file__).parent / "migrations"
+
+_MIGRATION_NAME_RE = re.compile(r"^(\d{4})_[\w-]+\.sql$")
+
+SCHEMA_MIGRATIONS_DDL = """
+    CREATE SCHEMA IF NOT EXISTS joyas;
+    CREATE TABLE IF NOT EXISTS joyas.schema_migrations (
+        version TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        checksum TEXT NOT NULL,
+        applied_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        -- false: marcada con --stamp (ya estaba aplicada a mano) o salteada
+        executed BOOLEAN NOT NULL DEFAULT true,
+        -- true: salteada con --skip; no se aplica hasta --apply-skipped
+        skipped BOOLEAN NOT NULL DEFAULT false
+    )
+"""
+
+# Un solo `migrate` a la vez (por ejemplo, dos deploys en paralelo)
+MIGRATION_LOCK_SQL = text("SELECT pg_advisory_lock(hashtext('joyas.schema_migrations'))")
+MIGRATION_UNLOCK_SQL = text("SELECT pg_advisory_unlock(hashtext('joyas.schema_migrations'))")
+
+RECORD_SQL = text("""
+    INSERT INTO joyas.schema_migrations (version, name, checksum, executed, skipped)
+    VALUES (:version, :name, :checksum, :executed, :skipped)
+    ON CONFLICT (version) DO UPDATE SET
+        name = EXCLUDED.name, checksum = EXCLUDED.checksum, applied_at = now(),
+        executed = EXCLUDED.executed, skipped = EXCLUDED.skipped
+""")
+
+# Objetos que deja cada migración: --stamp solo registra una migración si
+# existen todos (una base a la que le falta 0002 no queda marcada con pg_trgm).
+# Una migración nueva agrega acá sus objetos principales.
+STAMP_CHECKS = {
+    "0000": [("relation", "joyas.app_user"), ("relation", "joyas.customer"), ("relation", "joyas.sale"),
+             ("relation", "joyas.sale_item"), ("relation", "joyas.payment"),
+             ("relation", "joyas.v_sale_statement"), ("relation", "joyas.v_sales_active"),
+             ("relation", "joyas.v_kpis"), ("relation", "joyas.v_profit_kpis"),
+             ("relation", "joyas.v_history_month_customer")],
+    "0001": [("relation", "joyas.ix_sale_purchase_date_id"), ("relation", "joyas.ix_sale_customer_purchase_date_id"),
+             ("relation", "joyas.ix_customer_created_at_id"), ("relation", "joyas.ix_payment_paid_at_id"),
+             ("relation", "joyas.ix_payment_sale_paid_at_id")],
+    "0002": [("extension", "pg_trgm"), ("extension", "unaccent"), ("function", "joyas.search_norm"),
+             ("relation", "joyas.ix_customer_full_name_trgm"), ("relation", "joyas.ix_customer_full_name_norm_trgm"),
+             ("relation", "joyas.ix_customer_phone_digits_trgm"),
+             ("relation", "joyas.ix_sale_item_product_code_norm_trgm")],
+    "0003": [("relation", "joyas.kpi_snapshot"), ("relation", "joyas.kpi_sale_balance"),
+             ("function", "joyas.kpi_snapshot_rebuild"), ("trigger", "kpi_snapshot_sale_item_ins"),
+             ("trigger", "kpi_snapshot_payment_ins")],
+    "0004": [("relation", "joyas.history_month_customer"), ("function", "joyas.history_month_rebuild"),
+             ("trigger", "history_month_sale_ins"), ("trigger", "history_month_sale_item_ins")],
+    "0005": [("relation", "joyas.idempotency_key")],
+    "0006": [("column", "joyas.sale.change_xid"), ("column", "joyas.sale.updated_at"),
+             ("relation", "joyas.tombstone"), ("relation", "joyas.tombstone_horizon"),
+             ("trigger", "touch_sale"), ("trigger", "tombstone_sale")],
+    "0007": [("relation", "joyas.ix_sale_item_sale_id")],
+    "0008": [("column", "joyas.sale.status"), ("relation", "joyas.ix_sale_status_purchase_date_id"),
+             ("function", "joyas.sale_balance_rebuild"), ("trigger", "sale_balance_sale_item_ins"),
+             ("trigger", "sale_balance_payment_ins")],
+}
+
+_OBJECT_EXISTS_SQL = {
+    "relation": text("SELECT to_regclass(:name) IS NOT NULL"),
+    "function": text("SELECT to_regproc(:name) IS NOT NULL"),
+    "extension": text("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = :name)"),
+    "trigger": text("SELECT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = :name AND NOT tgisinternal)"),
+    "column": text("""
+        SELECT EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = split_part(:name, '.', 1)
+              AND table_name = split_part(:name, '.', 2)
+              AND column_name = split_part(:name, '.', 3)
+        )
+    """),
+}
+
+
+class AppliedMigration(NamedTuple):
+    checksum: str
+    skipped: bool
+
+
+class Migration(NamedTuple):
+    version: str
+    name: str
+    path: Path
+    checksum: str
+
+
+class MigrationError(Exception):
+    pass
+
+
+def discover(directory: Path = MIGRATIONS_DIR) -> list[Migration]:
+    migrations = []
+    for path in sorted(directory.glob("*.sql")):
+        match = _MIGRATION_NAME_RE.match(path.name)
+        if not match:
+            raise MigrationError(f"Nombre de migración inválido: {path.name} (se espera NNNN_descripcion.sql)")
+        checksum = hashlib.sha256(path.read_bytes()).hexdigest()
+        migrations.append(Migration(match.group(1), path.name, path, checksum))
+    versions = [m.version for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise MigrationError("Hay dos migraciones con el mismo número")
+    return migrations
+
+
+def _applied(conn) -> dict[str, AppliedMigration]:
+    """version -> registro de las migraciones aplicadas, marcadas o salteadas"""
+    conn.exec_driver_sql(SCHEMA_MIGRATIONS_DDL)
+    rows = conn.execute(text("SELECT version, checksum, skipped FROM joyas.schema_migrations")).all()
+    return {version: AppliedMigration(checksum, skipped) for version, checksum, skipped in rows}
+
+
+def _missing_objects(conn, version: str) -> list[str]:
+    """Objetos de STAMP_CHECKS[version] que no existen en la base"""
+    return [
+        f"{kind} {name}" for kind, name in STAMP_CHECKS[version]
+        if not conn.execute(_OBJECT_EXISTS_SQL[kind], {"name": name}).scalar()
+    ]
+
+
+def _has_unmanaged_schema(conn) -> bool:
+    """El esquema joyas existe pero no fue creado por este runner"""
+    return conn.execute(text("SELECT to_regclass('joyas.sale') IS NOT NULL")).scalar()
+
+
+def _run_script(conn, sql: str) -> None:
+    """Ejecuta el archivo tal cual: sin parámetros el driver no interpreta los % del SQL"""
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(sql)
+    finally:
+        cursor.close()
+
+
+def status(engine) -> list[dict]:
+    with engine.begin() as conn:
+        applied = _applied(conn)
+    rows = []
+    for migration in discover():
+        record = applied.get(migration.version)
+        if record is None:
+            state = "pending"
+        elif record.skipped:
+            state = "skipped"
+        else:
+            state = "applied" if record.checksum == migration.checksum else "modified"
+        rows.append({"version": migration.version, "name": migration.name, "status": state})
+    return rows
+
+
+def migrate(
+    engine,
+    target: Optional[str] = None,
+    stamp: bool = False,
+    skip: tuple[str, ...] = (),
+    apply_skipped: tuple[str, ...] = (),
+) -> dict[str, list[str]]:
+    """
+    Aplica (o con stamp=True solo registra) las migraciones pendientes hasta
+    `target` inclusive. Con stamp=True primero verifica que existan los objetos
+    de cada una (STAMP_CHECKS) y si falta alguno no registra nada.
+    `skip` son versiones que se registran como salteadas sin ejecutarlas (por
+    ejemplo 0002 en una base sin pg_trgm): las corridas siguientes no las
+    aplican hasta que se pidan con `apply_skipped`. Devuelve los nombres de
+    las migraciones aplicadas (o marcadas) y de las salteadas.
+    """
+    migrations = discover()
+    versions = {m.version for m in migrations}
+    for version in (target, *skip, *apply_skipped):
+        if version is not None and version not in versions:
+            raise MigrationError(f"No existe la migración {version}")
+    if set(skip) & set(apply_skipped):
+        raise MigrationError("Una misma versión no puede ir en --skip y --apply-skipped")
+    done = {"stamped" if stamp else "applied": [], "skipped": []}
+    with engine.connect() as lock_conn:
+        lock_conn.execute(MIGRATION_LOCK_SQL)
+        try:
+            with engine.begin() as conn:
+                applied = _applied(conn)
+                # Base con las migraciones aplicadas a mano con psql (antes de este runner)
+                if not applied and not stamp and _has_unmanaged_schema(conn):
+                    raise MigrationError(
+                        "El esquema joyas ya existe pero no tiene migraciones registradas: marcar las que ya "
+                        "están aplicadas con `manage.py migrate --stamp NNNN` y después correr migrate"
+                    )
+                for version in apply_skipped:
+                    if version not in applied or not applied[version].skipped:
+                        raise MigrationError(f"La migración {version} no está salteada")
+
+                # (migración, salteada): en orden, para registrar todo o nada si falla una verificación
+                plan = []
+                for migration in migrations:
+                    if target is not None and migration.version > target:
+                        break
+                    record = applied.get(migration.version)
+                    if record is not None and record.skipped and migration.version not in apply_skipped:
+                        done["skipped"].append(migration.name)
+                        continue
+                    if record is not None and not record.skipped:
+                        if record.checksum != migration.checksum:
+                            raise MigrationError(
+                                f"{migration.name} cambió después de aplicada: agregar una migración nueva en vez de editarla"
+                            )
+                        continue
+                    plan.append((migration, migration.version in skip))
+
+                if stamp:
+                    for migration, skipped in plan:
+                        if skipped:
+                            continue
+                        if migration.version not in STAMP_CHECKS:
+                            raise MigrationError(
+                                f"{migration.name} no tiene objetos en STAMP_CHECKS: no se puede marcar sin ejecutarla"
+                            )
+                        missing = _missing_objects(conn, migration.version)
+                        if missing:
+                            raise MigrationError(
+                                f"{migration.name} no está aplicada (falta {', '.join(missing)}): marcar solo hasta "
+                                f"la anterior, o saltearla con --skip {migration.version}"
+                            )
+
+            for migration, skipped in plan:
+                with engine.begin() as conn:
+                    if not stamp and not skipped:
+                        _run_script(conn, migration.path.read_text(encoding="utf-8"))
+                    conn.execute(RECORD_SQL, {
+                        "version": migration.version, "name": migration.name, "checksum": migration.checksum,
+                        "executed": not stamp and not skipped, "skipped": skipped,
+                    })
+                if skipped:
+                    done["skipped"].append(migration.name)
+                else:
+                    done["stamped" if stamp else "applied"].append(migration.name)
+        finally:
+            lock_conn.execute(MIGRATION_UNLOCK_SQL)
+            lock_conn.commit()
+    return done
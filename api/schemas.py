@@ -1,8 +1,10 @@
-from pydantic import BaseModel, EmailStr, Field, field_validator
-from typing import Optional
+from pydantic import BaseModel, EmailStr, Field, computed_field, field_validator
+from typing import Any, Literal, Optional
 from datetime import date, datetime
 from decimal import Decimal
 
+import images
+
 
 # Auth
 class LoginRequest(BaseModel):
@@ -31,6 +33,11 @@ class CustomerResponse(BaseModel):
         from_attributes = True
 
 
+class CustomerSearchResult(CustomerResponse):
+    score: float
+    matched_on: str
+
+
 # Sale Item
 class SaleItemCreate(BaseModel):
     product_code: Optional[str] = None
@@ -60,6 +67,16 @@ class SaleItemCreate(BaseModel):
         return Decimal(str(v))
 
 
+class SaleItemUpdate(SaleItemCreate):
+    # Item existente de la venta; sin id se agrega como nuevo
+    id: Optional[int] = None
+
+
+class PhotoVariants(BaseModel):
+    thumbnail_url: str
+    srcset: str
+
+
 class SaleItemResponse(BaseModel):
     id: int
     sale_id: int
@@ -70,6 +87,13 @@ class SaleItemResponse(BaseModel):
     photo_url: Optional[str]
     created_at: datetime
 
+    @computed_field
+    @property
+    def photo_variants(self) -> Optional[PhotoVariants]:
+        """Miniatura y srcset WebP de la foto (None si no es una foto subida)"""
+        variants = images.photo_variants(self.photo_url)
+        return PhotoVariants(**variants) if variants else None
+
     class Config:
         from_attributes = True
 
@@ -90,7 +114,7 @@ class SaleUpdate(BaseModel):
     notes: Optional[str] = None
     payment_due_date: Optional[date] = None
     delivery_date: Optional[date] = None
-    items: Optional[list[SaleItemCreate]] = None
+    items: Optional[list[SaleItemUpdate]] = None
 
 
 class SaleResponse(BaseModel):
@@ -140,6 +164,13 @@ class SaleStatementResponse(BaseModel):
     account_status: str
 
 
+class SaleFullResponse(BaseModel):
+    sale: SaleResponse
+    items: list[SaleItemResponse]
+    payments: list[PaymentResponse]
+    statement: SaleStatementResponse
+
+
 # KPIs
 class KPIsResponse(BaseModel):
     total_joyas_vendidas: int
@@ -160,11 +191,92 @@ class HistoryMonthCustomerResponse(BaseModel):
     ganancia_40: str
 
 
+# Sync offline (cola de la PWA)
+class SyncOperation(BaseModel):
+    type: Literal["create_sale", "create_payment"]
+    # Cuerpo de POST /sales o POST /payments; se valida por operación
+    data: dict
+    # Id local de la operación en la cola, se devuelve en el resultado
+    client_id: Optional[str] = None
+    # Igual que el header Idempotency-Key: reenviar la operación no la duplica
+    idempotency_key: Optional[str] = None
+
+
+class SyncBatchRequest(BaseModel):
+    operations: list[SyncOperation]
+
+
+class SyncOperationResult(BaseModel):
+    index: int
+    client_id: Optional[str] = None
+    type: str
+    status: Literal["ok", "error"]
+    # Código HTTP que habría devuelto la operación individual
+    status_code: int
+    id: Optional[int] = None
+    detail: Optional[Any] = None
+    # True si la operación ya se había aplicado con la misma idempotency_key
+    replayed: bool = False
+
+
+class SyncBatchResponse(BaseModel):
+    applied: int
+    failed: int
+    results: list[SyncOperationResult]
+
+
+# Sync incremental (GET /changes)
+class CustomerChange(CustomerResponse):
+    updated_at: datetime
+
+
+class SaleChange(BaseModel):
+    id: int
+    customer_id: int
+    purchase_date: date
+    payment_due_date: Optional[date]
+    delivery_date: Optional[date]
+    delivery_address: str
+    notes: Optional[str]
+    created_at: datetime
+    updated_at: datetime
+
+
+class SaleItemChange(SaleItemResponse):
+    updated_at: datetime
+
+
+class PaymentChange(PaymentResponse):
+    updated_at: datetime
+
+
+class DeletedEntity(BaseModel):
+    # Clave de la entidad en la respuesta: customers, sales, sale_items o payments
+    entity: str
+    id: int
+    deleted_at: datetime
+
+
+class ChangesResponse(BaseModel):
+    customers: list[CustomerChange]
+    sales: list[SaleChange]
+    sale_items: list[SaleItemChange]
+    payments: list[PaymentChange]
+    deleted: list[DeletedEntity]
+    # Enviar como `since` en la próxima llamada
+    cursor: str
+    # True si quedaron cambios para la página siguiente
+    has_more: bool
+
+
 # Pagination
 class PaginatedResponse(BaseModel):
     items: list
-    total: int
+    # total/total_pages son None cuando se omite el COUNT (include_total=false o paginación por cursor)
+    total: Optional[int] = None
     page: int
     page_size: int
-    total_pages: int
+    total_pages: Optional[int] = None
+    # Cursor para pedir la página siguiente (paginación keyset); None en la última página
+    next_cursor: Optional[str] = None
 
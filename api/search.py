@@ -0,0 +1,66 @@
+import re
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Búsqueda de clientes por nombre, teléfono o código de producto vendido.
+# Cada rama usa su índice trigram (ver migrations/0002_customer_trigram_search.sql):
+# el término se normaliza con la misma función que el índice y queda como
+# expresión constante, así el planner puede usar el índice GIN.
+# El resultado se ordena por similitud y se corta en `limit`.
+CUSTOMER_SEARCH_SQL = text("""
+    WITH matches AS (
+        SELECT c.id AS customer_id,
+               word_similarity(joyas.search_norm(:term), joyas.search_norm(c.full_name)) AS score,
+               'full_name' AS matched_on
+        FROM joyas.customer c
+        WHERE joyas.search_norm(:term) <% joyas.search_norm(c.full_name)
+           OR joyas.search_norm(c.full_name) LIKE '%' || joyas.search_norm(:like_term) || '%'
+
+        UNION ALL
+
+        SELECT c.id, word_similarity(:digits, regexp_replace(c.phone, '\\D', '', 'g')), 'phone'
+        FROM joyas.customer c
+        WHERE :digits <> '' AND regexp_replace(c.phone, '\\D', '', 'g') LIKE :digits_pattern
+
+        UNION ALL
+
+        SELECT s.customer_id,
+               word_similarity(joyas.search_norm(:term), joyas.search_norm(si.product_code)),
+               'product_code'
+        FROM joyas.sale_item si
+        JOIN joyas.sale s ON s.id = si.sale_id
+        WHERE joyas.search_norm(si.product_code) LIKE '%' || joyas.search_norm(:like_term) || '%'
+    ),
+    ranked AS (
+        SELECT DISTINCT ON (customer_id) customer_id, score, matched_on
+        FROM matches
+        ORDER BY customer_id, score DESC
+    )
+    SELECT c.id, c.full_name, c.phone, c.created_at, r.score, r.matched_on
+    FROM ranked r
+    JOIN joyas.customer c ON c.id = r.customer_id
+    ORDER BY r.score DESC, c.full_name
+    LIMIT :limit
+""")
+
+
+def _like_escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def customer_search_params(term: str, limit: int) -> dict:
+    """Parámetros de CUSTOMER_SEARCH_SQL para un término de búsqueda"""
+    term = term.strip()
+    digits = re.sub(r"\D", "", term)
+    return {
+        "term": term,
+        "like_term": _like_escape(term),
+        "digits": digits,
+        "digits_pattern": f"%{digits}%",
+        "limit": limit,
+    }
+
+
+async def search_customers(db: AsyncSession, term: str, limit: int) -> list:
+    result = await db.execute(CUSTOMER_SEARCH_SQL, customer_search_params(term, limit))
+    return result.fetchall()
@@ -0,0 +1,213 @@
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Registro de consultas lentas (SLOW_QUERY_MS > 0). Cada sentencia que supera
+# el umbral se loggea normalizada, con sus parámetros sin secretos, y si es un
+# SELECT que lee tablas se captura su plan con EXPLAIN (ANALYZE, BUFFERS) en un
+# hilo aparte.
+# Se ve en GET /admin/slow-queries (memoria del proceso).
+
+# Parámetros cuyo valor nunca se registra
+_SECRET_PARAM_RE = re.compile(r"pass|token|secret|hash|key", re.IGNORECASE)
+MAX_PARAM_CHARS = 200
+REDACTED = "[redactado]"
+
+_STRING_LITERAL_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL_RE = re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?\b")
+_WHITESPACE_RE = re.compile(r"\s+")
+_IN_LIST_RE = re.compile(r"\bIN \((?:\?|%\(\w+\)s|%s)(?:, (?:\?|%\(\w+\)s|%s))+\)", re.IGNORECASE)
+_FROM_RE = re.compile(r"\bFROM\b", re.IGNORECASE)
+_LOCKING_RE = re.compile(r"\bFOR (UPDATE|SHARE)\b", re.IGNORECASE)
+# Funciones con efectos que el ROLLBACK de solo lectura no deshace (un advisory
+# lock de sesión quedaría tomado en la conexión del pool) o que escriben
+_SIDE_EFFECT_RE = re.compile(
+    r"\b(pg_(try_)?advisory_\w+|pg_notify|nextval|setval|set_config|joyas\.\w+_rebuild)\s*\(", re.IGNORECASE
+)
+
+# Marca en conn.info de la conexión que está corriendo un EXPLAIN (no registrarlo a él)
+EXPLAINING = "slow_query_explaining"
+
+
+def normalize_sql(statement: str) -> str:
+    """SQL en una línea, con los literales como ? y las listas IN colapsadas"""
+    sql = _WHITESPACE_RE.sub(" ", statement).strip()
+    sql = _STRING_LITERAL_RE.sub("?", sql)
+    sql = _NUMBER_LITERAL_RE.sub("?", sql)
+    return _IN_LIST_RE.sub("IN (...)", sql)
+
+
+def _redact_value(value: Any) -> Any:
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f"<{len(value)} bytes>"
+    if isinstance(value, str):
+        return value if len(value) <= MAX_PARAM_CHARS else value[:MAX_PARAM_CHARS] + "…"
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    return _redact_value(str(value))
+
+
+def redact_params(parameters: Any) -> Any:
+    """Parámetros para el log: sin los que parecen secretos y con los textos largos cortados"""
+    if isinstance(parameters, dict):
+        return {
+            name: REDACTED if _SECRET_PARAM_RE.search(str(name)) else _redact_value(value)
+            for name, value in parameters.items()
+        }
+    if isinstance(parameters, (list, tuple)):
+        return [_redact_value(value) for value in parameters]
+    return None
+
+
+def _explainable(statement: str, executemany: bool) -> bool:
+    """Solo SELECT que leen tablas y no llaman funciones con efectos: EXPLAIN ANALYZE ejecuta la consulta de nuevo"""
+    head = statement.lstrip()[:6].upper()
+    return (
+        not executemany
+        and head == "SELECT"
+        and _FROM_RE.search(statement) is not None
+        and not _LOCKING_RE.search(statement)
+        and not _SIDE_EFFECT_RE.search(statement)
+    )
+
+
+class SlowQueryLog:
+    """
+    Últimas consultas lentas del proceso. Limita cuántas se registran por
+    minuto y corre a lo sumo un EXPLAIN por consulta normalizada cada
+    `explain_interval` segundos, de a uno por vez (EXPLAIN ANALYZE repite la
+    consulta, no debe sumar carga justo cuando la base está lenta).
+    """
+
+    def __init__(self, max_entries: int, max_per_minute: int, explain_interval: float):
+        self.max_per_minute = max_per_minute
+        self.explain_interval = explain_interval
+        self.entries: deque = deque(maxlen=max_entries)
+        self.counters = {"recorded": 0, "rate_limited": 0, "explained": 0, "explain_failed": 0, "explain_skipped": 0}
+        self._lock = threading.Lock()
+        self._next_id = 1
+        self._window_start = time.monotonic()
+        self._window_count = 0
+        self._explained_at: dict[str, float] = {}
+        self._explain_pending = False
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="slow-query-explain")
+
+    def record(
+        self, statement: str, parameters: Any, seconds: float, executemany: bool = False, explain_engine=None
+    ) -> Optional[dict]:
+        """Registra una consulta lenta; None si se descartó por el límite por minuto"""
+        now = time.monotonic()
+        sql = normalize_sql(statement)
+        fingerprint = hashlib.sha1(sql.encode()).hexdigest()[:12]
+        with self._lock:
+            if now - self._window_start >= 60:
+                self._window_start, self._window_count = now, 0
+            if self._window_count >= self.max_per_minute:
+                self.counters["rate_limited"] += 1
+                return None
+            self._window_count += 1
+            self.counters["recorded"] += 1
+            entry = {
+                "id": self._next_id,
+                "at": datetime.now(timezone.utc).isoformat(),
+                "duration_ms": round(seconds * 1000, 1),
+                "fingerprint": fingerprint,
+                "sql": sql,
+                "params": redact_params(parameters[0] if executemany and parameters else parameters),
+                "executemany": executemany,
+                "explain_status": "skipped",
+                "explain": None,
+            }
+            self._next_id += 1
+            self.entries.append(entry)
+
+            explain = explain_engine is not None and settings.slow_query_explain and _explainable(statement, executemany)
+            if explain and (self._explain_pending or now - self._explained_at.get(fingerprint, -1e9) < self.explain_interval):
+                self.counters["explain_skipped"] += 1
+                explain = False
+            if explain:
+                self._explain_pending = True
+                self._explained_at[fingerprint] = now
+                entry["explain_status"] = "pending"
+
+        logger.warning(
+            f"Consulta lenta ({entry['duration_ms']} ms) [{fingerprint}]: {sql} - params: {entry['params']}"
+        )
+        if explain:
+            self._executor.submit(self._explain, entry, statement, parameters, explain_engine)
+        return entry
+
+    def _explain(self, entry: dict, statement: str, parameters: Any, explain_engine) -> None:
+        try:
+            with explain_engine.connect() as conn:
+                conn.info[EXPLAINING] = True
+                try:
+                    # Solo lectura: si el SELECT llama a algo que escribe, falla en vez de escribir
+                    conn.exec_driver_sql("SET TRANSACTION READ ONLY")
+                    conn.exec_driver_sql(f"SET LOCAL statement_timeout = {int(settings.slow_query_explain_timeout_ms)}")
+                    rows = conn.exec_driver_sql(f"EXPLAIN (ANALYZE, BUFFERS) {statement}", parameters).fetchall()
+                    conn.rollback()
+                finally:
+                    conn.info.pop(EXPLAINING, None)
+            entry["explain"] = "\n".join(row[0] for row in rows)
+            entry["explain_status"] = "done"
+            with self._lock:
+                self.counters["explained"] += 1
+            logger.info(f"Plan de la consulta lenta [{entry['fingerprint']}]:\n{entry['explain']}")
+        except Exception as e:
+            # El error del driver, no el de SQLAlchemy (que incluye los parámetros sin redactar)
+            error = getattr(e, "orig", None) or e
+            entry["explain"] = f"{type(error).__name__}: {error}"
+            entry["explain_status"] = "failed"
+            with self._lock:
+                self.counters["explain_failed"] += 1
+            logger.warning(f"No se pudo capturar el plan de [{entry['fingerprint']}] - Tipo: {type(e).__name__}")
+        finally:
+            with self._lock:
+                self._explain_pending = False
+
+    def snapshot(self, limit: int) -> dict:
+        with self._lock:
+            items = list(self.entries)[-limit:] if limit > 0 else []
+            counters = dict(self.counters)
+        return {
+            "enabled": settings.slow_query_ms > 0,
+            "threshold_ms": settings.slow_query_ms,
+            "counters": counters,
+            "items": [dict(entry) for entry in reversed(items)],
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self.entries.clear()
+            self._explained_at.clear()
+
+
+slow_query_log = SlowQueryLog(
+    max_entries=settings.slow_query_log_size,
+    max_per_minute=settings.slow_query_max_per_minute,
+    explain_interval=settings.slow_query_explain_interval_seconds,
+)
+
+
+def check_statement(conn, statement: str, parameters: Any, seconds: float, executemany: bool, explain_engine) -> None:
+    """Llamar al terminar cada sentencia (ver database.py); registra si supera el umbral"""
+    if settings.slow_query_ms <= 0 or seconds * 1000 < settings.slow_query_ms:
+        return
+    if conn.info.get(EXPLAINING):
+        return
+    try:
+        slow_query_log.record(statement, parameters, seconds, executemany, explain_engine)
+    except Exception as e:
+        # El registro nunca debe romper la consulta que lo disparó
+        logger.error(f"Error al registrar consulta lenta: {str(e)}", exc_info=True)
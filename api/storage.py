@@ -0,0 +1,203 @@
+import io
+import os
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import BinaryIO, NamedTuple, Optional
+
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+from conditional import etag_matches
+from config import settings
+
+UPLOAD_DIR = Path(__file__).parent / "uploads" / "images"
+UPLOAD_URL = "/uploads/images"
+
+# Los nombres salen del contenido (o de un uuid en fotos viejas): un archivo
+# nunca cambia, el navegador/CDN puede guardarlo un año sin revalidar
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Backends de almacenamiento de imágenes. Ambos tienen la misma interfaz
+# (nombres relativos como "abc.jpg" o "variants/abc_160w.webp"):
+#   exists(name), put(name, tmp_path, content_type), touch(name), open(name),
+#   delete(name), list(subdir="") y tmp_dir (dónde escribir los temporales antes de put).
+# Los errores del backend se levantan como OSError.
+
+
+class StoredImage(NamedTuple):
+    name: str
+    modified_at: datetime
+
+
+class LocalStorage:
+    """Directorio local; put es un rename atómico (el temporal está en el mismo disco)"""
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        # Al lado del directorio servido (mismo disco, el rename sigue siendo
+        # atómico) pero fuera de él: un temporal a medio escribir no tiene URL
+        self.tmp_dir = directory.parent / f".{directory.name}-tmp"
+        (directory / "variants").mkdir(parents=True, exist_ok=True)
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+
+    def exists(self, name: str) -> bool:
+        return (self.directory / name).is_file()
+
+    def put(self, name: str, tmp_path: Path, content_type: str) -> None:
+        os.replace(tmp_path, self.directory / name)
+
+    def touch(self, name: str) -> None:
+        """Actualiza la fecha (la GC no borra fotos recientes); FileNotFoundError si no existe"""
+        os.utime(self.directory / name)
+
+    def open(self, name: str) -> BinaryIO:
+        return open(self.directory / name, "rb")
+
+    def delete(self, name: str) -> None:
+        (self.directory / name).unlink(missing_ok=True)
+
+    def list(self, subdir: str = "") -> list[StoredImage]:
+        """Archivos de `subdir` (sin recorrer subdirectorios ni temporales)"""
+        prefix = f"{subdir}/" if subdir else ""
+        return [
+            StoredImage(prefix + entry.name, datetime.fromtimestamp(entry.stat().st_mtime, timezone.utc))
+            for entry in os.scandir(self.directory / subdir)
+            if entry.is_file() and not entry.name.startswith(".")
+        ]
+
+
+class S3Storage:
+    """
+    Bucket S3 o compatible (MinIO, R2, ...) vía boto3, que es opcional: solo
+    se importa con IMAGE_STORAGE=s3. Las credenciales salen de las variables
+    estándar de AWS. Los objetos se sirven redirigiendo a `public_url`.
+    """
+
+    def __init__(self, bucket: str, prefix: str, endpoint_url: Optional[str], public_url: str):
+        try:
+            import boto3
+            from botocore.exceptions import BotoCoreError, ClientError
+        except ImportError as e:
+            raise RuntimeError("IMAGE_STORAGE=s3 requiere boto3 (pip install boto3)") from e
+        self.client = boto3.client("s3", endpoint_url=endpoint_url)
+        self.bucket = bucket
+        self.prefix = prefix
+        self.public_url = public_url.rstrip("/")
+        self.tmp_dir = Path(tempfile.gettempdir())
+        self._errors = (BotoCoreError, ClientError)
+        self._client_error = ClientError
+
+    def _key(self, name: str) -> str:
+        return self.prefix + name
+
+    def url(self, name: str) -> str:
+        return f"{self.public_url}/{self._key(name)}"
+
+    def _head(self, name: str) -> Optional[dict]:
+        """Metadatos del objeto o None si no existe"""
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._key(name))
+        except self._client_error as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise OSError(f"S3 head_object {name}: {e}") from e
+        except self._errors as e:
+            raise OSError(f"S3 head_object {name}: {e}") from e
+
+    def exists(self, name: str) -> bool:
+        return self._head(name) is not None
+
+    def put(self, name: str, tmp_path: Path, content_type: str) -> None:
+        try:
+            self.client.upload_file(
+                str(tmp_path), self.bucket, self._key(name),
+                ExtraArgs={"ContentType": content_type, "CacheControl": IMMUTABLE_CACHE_CONTROL},
+            )
+        except self._errors as e:
+            raise OSError(f"S3 upload {name}: {e}") from e
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+    def touch(self, name: str) -> None:
+        # S3 no tiene utime: copiar el objeto sobre sí mismo actualiza LastModified
+        head = self._head(name)
+        if head is None:
+            raise FileNotFoundError(name)
+        key = self._key(name)
+        try:
+            self.client.copy_object(
+                Bucket=self.bucket, Key=key, CopySource={"Bucket": self.bucket, "Key": key},
+                MetadataDirective="REPLACE", ContentType=head["ContentType"], CacheControl=IMMUTABLE_CACHE_CONTROL,
+            )
+        except self._errors as e:
+            raise OSError(f"S3 copy_object {name}: {e}") from e
+
+    def open(self, name: str) -> BinaryIO:
+        try:
+            body = self.client.get_object(Bucket=self.bucket, Key=self._key(name))["Body"]
+            return io.BytesIO(body.read())
+        except self._errors as e:
+            raise OSError(f"S3 get_object {name}: {e}") from e
+
+    def delete(self, name: str) -> None:
+        try:
+            self.client.delete_object(Bucket=self.bucket, Key=self._key(name))
+        except self._errors as e:
+            raise OSError(f"S3 delete_object {name}: {e}") from e
+
+    def list(self, subdir: str = "") -> list[StoredImage]:
+        prefix = self._key(f"{subdir}/" if subdir else "")
+        images = []
+        try:
+            pages = self.client.get_paginator("list_objects_v2").paginate(
+                Bucket=self.bucket, Prefix=prefix, Delimiter="/"
+            )
+            for page in pages:
+                for obj in page.get("Contents", []):
+                    images.append(StoredImage(obj["Key"][len(self.prefix):], obj["LastModified"]))
+        except self._errors as e:
+            raise OSError(f"S3 list {prefix}: {e}") from e
+        return images
+
+
+def _build_storage():
+    if settings.image_storage == "s3":
+        if not settings.s3_bucket or not settings.s3_public_url:
+            raise RuntimeError("IMAGE_STORAGE=s3 requiere S3_BUCKET y S3_PUBLIC_URL")
+        return S3Storage(settings.s3_bucket, settings.s3_prefix, settings.s3_endpoint_url, settings.s3_public_url)
+    return LocalStorage(UPLOAD_DIR)
+
+
+image_storage = _build_storage()
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """
+    StaticFiles para archivos que no cambian nunca: Cache-Control immutable y
+    ETag fuerte con el nombre del archivo (el de Starlette depende del mtime).
+    Los archivos ocultos (temporales de versiones anteriores) no se sirven.
+    """
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        if any(part.startswith(".") for part in Path(path).parts):
+            raise HTTPException(status_code=404)
+        return await super().get_response(path, scope)
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope, status_code: int = 200) -> Response:
+        headers = {"ETag": f'"{Path(full_path).stem}"', "Cache-Control": IMMUTABLE_CACHE_CONTROL}
+        response = FileResponse(
+            full_path, status_code=status_code, headers=headers, stat_result=stat_result, method=scope["method"]
+        )
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
+
+    def is_not_modified(self, response_headers: Headers, request_headers: Headers) -> bool:
+        # Con If-None-Match se ignora If-Modified-Since (RFC 9110)
+        if "if-none-match" in request_headers:
+            return etag_matches(request_headers["if-none-match"], response_headers["etag"])
+        return super().is_not_modified(response_headers, request_headers)
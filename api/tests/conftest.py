@@ -0,0 +1,23 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# Los tests escriben en la base: solo corren contra una base de prueba indicada
+# explícitamente (nunca la DATABASE_URL del .env), con las migraciones aplicadas.
+#   TEST_DATABASE_URL=postgresql://postgres:pw@localhost/joyas_test py -m pytest tests
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+if TEST_DATABASE_URL:
+    os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+    os.environ.setdefault("JWT_SECRET", "tests-" + os.urandom(16).hex())
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def pytest_collection_modifyitems(config, items):
+    if TEST_DATABASE_URL:
+        return
+    skip = pytest.mark.skip(reason="TEST_DATABASE_URL no está definida")
+    for item in items:
+        item.add_marker(skip)
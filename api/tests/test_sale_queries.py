@@ -0,0 +1,108 @@
+import asyncio
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+import httpx
+import pytest
+from pydantic import ValidationError
+from sqlalchemy import event, select, text
+from sqlalchemy.orm import Session
+
+# Ventas con un cliente distinto cada una: con lazy loading serían 100 SELECT de clientes
+PAGE_ROWS = 100
+
+
+@pytest.fixture(scope="module")
+def sales():
+    """PAGE_ROWS ventas (cada una con su cliente) en la primera página de GET /sales"""
+    from database import engine
+
+    # Fecha futura: quedan primeras en el orden (purchase_date DESC, id DESC)
+    purchase_date = date.today() + timedelta(days=3650)
+    with engine.begin() as conn:
+        customer_ids = conn.execute(text("""
+            INSERT INTO joyas.customer (full_name)
+            SELECT 'Cliente test ' || g FROM generate_series(1, :n) AS g
+            RETURNING id
+        """), {"n": PAGE_ROWS}).scalars().all()
+        sale_ids = conn.execute(text("""
+            INSERT INTO joyas.sale (customer_id, purchase_date, delivery_address)
+            SELECT c, :purchase_date, 'test' FROM unnest(CAST(:customer_ids AS bigint[])) AS c
+            RETURNING id
+        """), {"customer_ids": customer_ids, "purchase_date": purchase_date}).scalars().all()
+    yield sale_ids
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM joyas.sale WHERE id = ANY(:ids)"), {"ids": sale_ids})
+        conn.execute(text("DELETE FROM joyas.customer WHERE id = ANY(:ids)"), {"ids": customer_ids})
+
+
+@pytest.fixture
+def auth_headers(monkeypatch):
+    from auth import create_access_token
+    from config import settings
+
+    # Usuario del token sin consultar app_user: la autenticación no suma queries
+    monkeypatch.setattr(settings, "auth_trust_claims", True)
+    return {"Authorization": f"Bearer {create_access_token({'sub': 'test', 'uid': 1})}"}
+
+
+@contextmanager
+def count_statements():
+    import database
+
+    statements = []
+
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engines = [database.engine] + ([database.async_engine.sync_engine] if database.async_engine is not None else [])
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", before_execute)
+    try:
+        yield statements
+    finally:
+        for engine in engines:
+            event.remove(engine, "before_cursor_execute", before_execute)
+
+
+def list_sales_statements(headers, page_size: int) -> list[str]:
+    from main import app
+    from response_cache import version_cache
+
+    # Cada request consulta la versión del ETag (sin la memorizada por el anterior)
+    version_cache.clear()
+
+    async def request():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/sales", params={"page_size": page_size}, headers=headers)
+
+    with count_statements() as statements:
+        response = asyncio.run(request())
+    assert response.status_code == 200
+    items = response.json()["items"]
+    assert len(items) == page_size
+    assert all(item["customer"] is not None for item in items)
+    return statements
+
+
+@pytest.mark.parametrize("strategy", ["selectin", "joined"])
+def test_list_sales_query_count_is_constant(sales, auth_headers, monkeypatch, strategy):
+    from config import settings
+
+    monkeypatch.setitem(settings.sale_customer_loading, "list_sales", strategy)
+    small = list_sales_statements(auth_headers, 10)
+    large = list_sales_statements(auth_headers, PAGE_ROWS)
+    assert len(large) == len(small), large
+
+
+def test_sale_customer_is_not_lazy_loaded(sales):
+    from database import engine
+    from models import Sale
+    from schemas import SaleResponse
+
+    with Session(engine) as session:
+        sale = session.execute(select(Sale).where(Sale.id == sales[0])).scalar_one()
+        # Sale.customer es lazy="raise_on_sql": sin cargarlo, serializar falla en vez de consultar
+        with pytest.raises(ValidationError, match="raise_on_sql"):
+            SaleResponse.model_validate(sale)
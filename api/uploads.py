@@ -0,0 +1,164 @@
+import hashlib
+import uuid
+from pathlib import Path
+from typing import Optional
+
+from fastapi import HTTPException, Request
+from multipart.multipart import MultipartParser, parse_options_header
+from starlette.concurrency import run_in_threadpool
+
+# Formatos aceptados según los primeros bytes del archivo (no el Content-Type del cliente)
+IMAGE_FORMATS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+}
+SNIFF_BYTES = 12
+# Margen para los headers multipart y el boundary al comparar Content-Length con el límite
+MULTIPART_OVERHEAD = 16 * 1024
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """Content-Type real de la imagen por sus magic bytes, o None"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if len(head) >= 12 and head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def _too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"El archivo excede el límite de {max_bytes // (1024 * 1024)}MB"
+    )
+
+
+def _not_an_image() -> HTTPException:
+    return HTTPException(
+        status_code=400,
+        detail=f"Tipo de archivo no permitido. Solo: {', '.join(IMAGE_FORMATS)}"
+    )
+
+
+class _FilePart:
+    """Estado del parser multipart: junta los bytes del campo `field_name`"""
+
+    def __init__(self, field_name: str):
+        self.field_name = field_name
+        self.header_field = b""
+        self.header_value = b""
+        self.current_is_file = False
+        self.found = False
+        self.pending: list[bytes] = []
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_part_data": self.on_part_data,
+        }
+
+    def on_part_begin(self) -> None:
+        self.current_is_file = False
+
+    def on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self.header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self.header_value += data[start:end]
+
+    def on_header_end(self) -> None:
+        if self.header_field.lower() == b"content-disposition":
+            _, options = parse_options_header(self.header_value)
+            # Solo el primer campo con ese nombre
+            if options.get(b"name") == self.field_name.encode() and not self.found:
+                self.current_is_file = self.found = True
+        self.header_field = b""
+        self.header_value = b""
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self.current_is_file:
+            self.pending.append(data[start:end])
+
+    def take(self) -> bytes:
+        data = b"".join(self.pending)
+        self.pending.clear()
+        return data
+
+
+async def receive_image(request: Request, storage, max_bytes: int, field_name: str = "file") -> str:
+    """
+    Lee un multipart/form-data en streaming y guarda el campo `field_name`
+    como imagen en `storage` (ver storage.py). Nunca tiene el archivo entero
+    en memoria: cada chunk se escribe a un archivo temporal (en un hilo) y se
+    corta con 413 apenas supera `max_bytes` o con 400 si los primeros bytes
+    no son de una imagen permitida. El nombre final es el sha256 del
+    contenido: si esa foto ya estaba guardada no se vuelve a guardar.
+    Devuelve el nombre final del archivo.
+    """
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    boundary = options.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise HTTPException(status_code=400, detail="Se espera multipart/form-data")
+
+    # Si el cliente declara un cuerpo demasiado grande, cortar sin leerlo
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes + MULTIPART_OVERHEAD:
+        raise _too_large(max_bytes)
+
+    part = _FilePart(field_name)
+    parser = MultipartParser(boundary, part.callbacks())
+    tmp_path = storage.tmp_dir / f".{uuid.uuid4()}.part"
+    digest = hashlib.sha256()
+    tmp_file = await run_in_threadpool(open, tmp_path, "wb")
+    size = 0
+    head = b""
+    image_type = None
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            data = part.take()
+            if not data:
+                continue
+            size += len(data)
+            if size > max_bytes:
+                raise _too_large(max_bytes)
+            if image_type is None:
+                head += data[:SNIFF_BYTES]
+                if len(head) >= SNIFF_BYTES:
+                    image_type = sniff_image_type(head)
+                    if image_type is None:
+                        raise _not_an_image()
+            digest.update(data)
+            await run_in_threadpool(tmp_file.write, data)
+        parser.finalize()
+        await run_in_threadpool(tmp_file.close)
+
+        if not part.found:
+            raise HTTPException(status_code=400, detail=f"Falta el archivo (campo '{field_name}')")
+        # Archivos más chicos que SNIFF_BYTES
+        image_type = image_type or sniff_image_type(head)
+        if image_type is None:
+            raise _not_an_image()
+
+        filename = f"{digest.hexdigest()[:32]}{IMAGE_FORMATS[image_type]}"
+        try:
+            # Si ya estaba no se guarda otra copia, solo se renueva la fecha para la GC
+            await run_in_threadpool(storage.touch, filename)
+            await run_in_threadpool(_discard, tmp_file, tmp_path)
+        except FileNotFoundError:
+            await run_in_threadpool(storage.put, filename, tmp_path, image_type)
+        return filename
+    except BaseException:
+        await run_in_threadpool(_discard, tmp_file, tmp_path)
+        raise
+
+
+def _discard(tmp_file, tmp_path: Path) -> None:
+    tmp_file.close()
+    tmp_path.unlink(missing_ok=True)
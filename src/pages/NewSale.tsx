@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react'
+import { useState, useEffect, useRef } from 'react'
 import { useNavigate } from 'react-router-dom'
 import { api } from '../services/api'
 import { offlineQueue } from '../services/offlineQueue'
@@ -17,6 +17,8 @@ interface SaleItem {
 
 export default function NewSale() {
   const navigate = useNavigate()
+  // Una clave por formulario: reintentar el envío no duplica la venta
+  const idempotencyKey = useRef(crypto.randomUUID())
   const [customers, setCustomers] = useState<any[]>([])
   const [selectedCustomerId, setSelectedCustomerId] = useState<number | null>(null)
   const [selectedCustomerName, setSelectedCustomerName] = useState<string>('')
@@ -317,7 +319,7 @@ export default function NewSale() {
 
     try {
       if (isOnline) {
-        await api.createSale(saleData)
+        await api.createSale(saleData, idempotencyKey.current)
       } else {
         await offlineQueue.addOperation('create_sale', saleData)
         // Mensaje informativo para modo offline (no es error)
@@ -4,6 +4,12 @@ import { api } from '../services/api'
 import { format } from 'date-fns'
 import { formatPYG, parsePYG } from '../utils/money'
 
+const API_URL = import.meta.env.VITE_API_URL || '/api'
+
+// srcset de la API ("/uploads/... 160w, ...") con el prefijo de la API
+const withApiUrl = (srcset: string) =>
+  srcset.split(', ').map((entry) => `${API_URL}${entry}`).join(', ')
+
 // Tipo para items editables
 interface EditableItem {
   id?: number
@@ -45,16 +51,11 @@ export default function SaleDetail() {
 
   const loadSaleData = async () => {
     try {
-      const [saleData, statementData, itemsData, paymentsData] = await Promise.all([
-        api.getSale(parseInt(id!)),
-        api.getSaleStatement(parseInt(id!)),
-        api.getSaleItems(parseInt(id!)),
-        api.getPayments(1, 100, parseInt(id!))
-      ])
-      setSale(saleData)
-      setStatement(statementData)
-      setItems(itemsData)
-      setPayments(paymentsData.items)
+      const data = await api.getSaleFull(parseInt(id!))
+      setSale(data.sale)
+      setStatement(data.statement)
+      setItems(data.items)
+      setPayments(data.payments)
     } catch (error) {
       console.error('Error loading sale:', error)
     } finally {
@@ -196,6 +197,7 @@ export default function SaleDetail() {
           const qtyValidation = validateQuantity(item.quantity)
           const priceValidation = validateUnitPrice(item.unit_price)
           return {
+            id: item.id,
             jewel_type: item.jewel_type,
             quantity: qtyValidation.normalized!,
             unit_price: priceValidation.normalized!,
@@ -481,6 +483,16 @@ export default function SaleDetail() {
                 {items.map((item) => (
                   <div key={item.id} className="pb-3 border-b border-white/10 last:border-0">
                     <div className="flex justify-between items-start mb-1">
+                      {item.photo_variants && (
+                        <img
+                          src={`${API_URL}${item.photo_variants.thumbnail_url}`}
+                          srcSet={withApiUrl(item.photo_variants.srcset)}
+                          sizes="4rem"
+                          loading="lazy"
+                          alt={item.jewel_type}
+                          className="w-16 h-16 object-cover rounded-xl border border-gold-main/20 mr-3"
+                        />
+                      )}
                       <div className="flex-1">
                         <div className="font-semibold text-white">{item.jewel_type}</div>
                         {item.product_code && (
@@ -4,6 +4,30 @@ import axios, { AxiosInstance } from 'axios'
 // En desarrollo puede ser '/api' si hay proxy configurado
 const API_URL = import.meta.env.VITE_API_URL || 'https://joyas-api.onrender.com'
 
+export interface SyncOperation {
+  type: 'create_sale' | 'create_payment'
+  data: any
+  client_id?: string
+  idempotency_key?: string
+}
+
+export interface SyncOperationResult {
+  index: number
+  client_id: string | null
+  type: string
+  status: 'ok' | 'error'
+  status_code: number
+  id: number | null
+  detail: any
+  replayed: boolean
+}
+
+export interface SyncBatchResponse {
+  applied: number
+  failed: number
+  results: SyncOperationResult[]
+}
+
 class ApiService {
   private client: AxiosInstance
 
@@ -71,8 +95,11 @@ class ApiService {
     return data
   }
 
-  async createSale(sale: any) {
-    const { data } = await this.client.post('/sales', sale)
+  // idempotencyKey: reintentar con la misma clave no duplica la venta
+  async createSale(sale: any, idempotencyKey?: string) {
+    const { data } = await this.client.post('/sales', sale, {
+      headers: idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : undefined,
+    })
     return data
   }
 
@@ -81,6 +108,12 @@ class ApiService {
     return data
   }
 
+  // Venta, cliente, items, pagos y saldo en un request (responde ETag: el navegador revalida con 304)
+  async getSaleFull(id: number) {
+    const { data } = await this.client.get(`/sales/${id}/full`)
+    return data
+  }
+
   async getSaleStatement(id: number) {
     const { data } = await this.client.get(`/sales/${id}/statement`)
     return data
@@ -109,8 +142,24 @@ class ApiService {
     return data
   }
 
-  async createPayment(payment: { sale_id: number; amount: number }) {
-    const { data } = await this.client.post('/payments', payment)
+  async createPayment(payment: { sale_id: number; amount: number }, idempotencyKey?: string) {
+    const { data } = await this.client.post('/payments', payment, {
+      headers: idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : undefined,
+    })
+    return data
+  }
+
+  // Sync offline: aplica varias operaciones de la cola en un solo request
+  async syncBatch(operations: SyncOperation[]): Promise<SyncBatchResponse> {
+    const { data } = await this.client.post('/sync/batch', { operations })
+    return data
+  }
+
+  // Cambios desde `since` (cursor de la respuesta anterior); repetir mientras has_more
+  async getChanges(since?: string, limit?: number) {
+    const { data } = await this.client.get('/changes', {
+      params: { since, limit },
+    })
     return data
   }
 
@@ -1,5 +1,5 @@
 import { openDB, DBSchema, IDBPDatabase } from 'idb'
-import { api } from './api'
+import { api, SyncOperation } from './api'
 
 interface OfflineQueueDB extends DBSchema {
   operations: {
@@ -9,6 +9,8 @@ interface OfflineQueueDB extends DBSchema {
       type: 'create_sale' | 'create_payment'
       data: any
       timestamp: number
+      // Clave de idempotencia: reenviar la operación no la duplica en el servidor
+      idempotency_key?: string
     }
     indexes: { 'by-timestamp': number }
   }
@@ -16,6 +18,26 @@ interface OfflineQueueDB extends DBSchema {
 
 let db: IDBPDatabase<OfflineQueueDB> | null = null
 
+// Operaciones por request a /sync/batch (el backend acepta hasta 500)
+const SYNC_BATCH_SIZE = 100
+
+// Con idempotency_key reenviar un lote es seguro: si el servidor ya lo aplicó
+// (p. ej. se perdió la respuesta), devuelve los resultados guardados
+const SYNC_MAX_ATTEMPTS = 4
+
+async function syncWithRetry(operations: SyncOperation[]) {
+  for (let attempt = 1; ; attempt++) {
+    try {
+      return await api.syncBatch(operations)
+    } catch (error: any) {
+      const status = error?.response?.status
+      const retryable = !status || status === 409 || status >= 500
+      if (!retryable || attempt >= SYNC_MAX_ATTEMPTS || !navigator.onLine) throw error
+      await new Promise((resolve) => setTimeout(resolve, 500 * 2 ** (attempt - 1)))
+    }
+  }
+}
+
 async function getDB() {
   if (!db) {
     db = await openDB<OfflineQueueDB>('joyas-offline-queue', 1, {
@@ -38,6 +60,7 @@ export const offlineQueue = {
       type,
       data,
       timestamp: Date.now(),
+      idempotency_key: crypto.randomUUID(),
     } as any)
   },
 
@@ -61,17 +84,30 @@ export const offlineQueue = {
 
     const operations = await this.getOperations()
     
-    for (const op of operations) {
+    // Enviar la cola en lotes: un request (y una transacción) por lote
+    for (let start = 0; start < operations.length; start += SYNC_BATCH_SIZE) {
+      const chunk = operations.slice(start, start + SYNC_BATCH_SIZE)
       try {
-        if (op.type === 'create_sale') {
-          await api.createSale(op.data)
-        } else if (op.type === 'create_payment') {
-          await api.createPayment(op.data)
+        const { results } = await syncWithRetry(
+          chunk.map((op) => ({
+            type: op.type,
+            data: op.data,
+            client_id: String(op.id),
+            idempotency_key: op.idempotency_key,
+          }))
+        )
+        for (const result of results) {
+          if (result.status === 'ok') {
+            await this.removeOperation(Number(result.client_id))
+          } else {
+            console.error('Error syncing operation:', result.client_id, result.detail)
+            // Si falla, mantener en la cola para reintentar después
+          }
         }
-        await this.removeOperation(op.id as number)
       } catch (error) {
-        console.error('Error syncing operation:', error)
-        // Si falla, mantener en la cola para reintentar después
+        console.error('Error syncing batch:', error)
+        // Sin respuesta del servidor: el lote queda en la cola para reintentar después
+        return
       }
     }
   },